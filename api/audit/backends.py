@@ -0,0 +1,127 @@
+""" Where buffered audit events are written.
+
+Each backend writes a batch of event dicts (see `audit.log.make_event`) in
+one go, and can read them back for a time range for `export_audit_log`.
+"""
+import datetime
+import json
+import os
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import AuditEvent
+
+
+class DatabaseBackend(object):
+    """ Writes each batch with one bulk insert into `AuditEvent`. """
+
+    batch_size = 500
+
+    def write(self, events):
+        AuditEvent.objects.bulk_create([
+            AuditEvent(
+                created_at=event['time'],
+                event=event['event'],
+                user_id=event['user_id'],
+                client_id=event['client_id'] or '',
+                remote_addr=event['remote_addr'],
+                details=json.dumps(event['details'], cls=DjangoJSONEncoder),
+            )
+            for event in events
+        ], batch_size=self.batch_size)
+
+    def read(self, since=None, until=None, events=None):
+        queryset = AuditEvent.objects.order_by('created_at', 'pk')
+        if since is not None:
+            queryset = queryset.filter(created_at__gte=since)
+        if until is not None:
+            queryset = queryset.filter(created_at__lt=until)
+        if events:
+            queryset = queryset.filter(event__in=events)
+        for row in queryset.iterator():
+            yield {
+                'time': row.created_at,
+                'event': row.event,
+                'user_id': row.user_id,
+                'client_id': row.client_id or None,
+                'remote_addr': row.remote_addr,
+                'details': json.loads(row.details) if row.details else {},
+            }
+
+
+class FileBackend(object):
+    """ Appends events as JSON lines to one file per UTC day in `directory`,
+    e.g. `audit-2018-11-01.jsonl`, so reading a time range only opens the
+    files of the days in it.
+
+    Every batch is appended with a single write to a file opened in append
+    mode, so the batches of several workers never interleave.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def get_path(self, day):
+        return os.path.join(self.directory, f'audit-{day.isoformat()}.jsonl')
+
+    def write(self, events):
+        lines = {}
+        for event in events:
+            day = event['time'].astimezone(datetime.timezone.utc).date()
+            lines.setdefault(day, []).append(json.dumps(event, cls=DjangoJSONEncoder) + '\n')
+
+        os.makedirs(self.directory, exist_ok=True)
+        for day, day_lines in sorted(lines.items()):
+            with open(self.get_path(day), 'a', encoding='utf-8') as f:
+                f.write(''.join(day_lines))
+
+    def get_days(self, since=None, until=None):
+        """ The days that have a file, in order, between `since` and `until`. """
+        days = []
+        for name in os.listdir(self.directory) if os.path.isdir(self.directory) else ():
+            if not (name.startswith('audit-') and name.endswith('.jsonl')):
+                continue
+            try:
+                day = datetime.datetime.strptime(name[6:-6], '%Y-%m-%d').date()
+            except ValueError:
+                continue
+            if since is not None and day < since.astimezone(datetime.timezone.utc).date():
+                continue
+            if until is not None and day > until.astimezone(datetime.timezone.utc).date():
+                continue
+            days.append(day)
+        return sorted(days)
+
+    def read(self, since=None, until=None, events=None):
+        for day in self.get_days(since, until):
+            # Batches from different workers are only roughly in order, so
+            # each day is sorted before it's returned.
+            rows = []
+            with open(self.get_path(day), encoding='utf-8') as f:
+                for line in f:
+                    row = json.loads(line)
+                    row['time'] = parse_datetime(row['time'])
+                    if timezone.is_naive(row['time']):
+                        row['time'] = timezone.make_aware(row['time'], datetime.timezone.utc)
+                    if since is not None and row['time'] < since:
+                        continue
+                    if until is not None and row['time'] >= until:
+                        continue
+                    if events and row['event'] not in events:
+                        continue
+                    rows.append(row)
+            rows.sort(key=lambda row: row['time'])
+            yield from rows
+
+
+def get_backend(name, directory=None):
+    """ The backend called `name` ("database" or "file"), or None. """
+    if not name:
+        return None
+    if name == 'database':
+        return DatabaseBackend()
+    if name == 'file':
+        return FileBackend(directory)
+    raise ValueError(f'Unknown audit log backend: {name}.')
@@ -0,0 +1,143 @@
+""" Buffering audit events in memory and writing them in batches.
+
+Recording an event only appends it to this worker's buffer. The buffer is
+written by its backend (one bulk insert, or one append to the day's JSON
+lines file) after a response has been sent, once it holds
+`AUDIT_LOG['FLUSH_SIZE']` events or its oldest event is
+`AUDIT_LOG['FLUSH_INTERVAL']` seconds old, and when the process exits.
+
+The buffer holds at most `AUDIT_LOG['MAX_EVENTS']` events. Events recorded
+while it's full are dropped and counted, as are batches the backend fails to
+write, so neither a flood of failures nor a database outage can grow a
+worker's memory without bound.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from oauth_microservice.metrics import AUDIT_EVENTS
+from .backends import get_backend
+
+
+logger = logging.getLogger(__name__)
+
+
+def make_event(event, user_id=None, client_id=None, remote_addr=None, **details):
+    return {
+        'time': timezone.now(),
+        'event': event,
+        'user_id': user_id,
+        'client_id': client_id,
+        'remote_addr': remote_addr,
+        'details': details,
+    }
+
+
+class AuditLog(object):
+    """ A bounded, per-process buffer of audit events in front of a backend
+    from `audit.backends`. Nothing is recorded without a backend.
+    """
+
+    def __init__(self, backend, max_events=10000, flush_size=100, flush_interval=5):
+        self.backend = backend
+        self.max_events = max_events
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._events = []
+        # When the oldest buffered event was recorded, on the monotonic clock.
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def __len__(self):
+        return len(self._events)
+
+    def record(self, event, **fields):
+        """ Buffer an event, e.g. `record('token.issued', user_id=1,
+        client_id='abc', grant_type='password')`. Fields other than
+        `user_id`, `client_id` and `remote_addr` go into its details.
+        """
+        if self.backend is None:
+            return
+        entry = make_event(event, **fields)
+        with self._lock:
+            if len(self._events) >= self.max_events:
+                self.dropped += 1
+                entry = None
+            else:
+                self._events.append(entry)
+                if self._oldest is None:
+                    self._oldest = time.monotonic()
+                self.recorded += 1
+        if entry is None:
+            AUDIT_EVENTS.labels('dropped').inc()
+
+    def is_due(self):
+        events, oldest = len(self._events), self._oldest
+        return events >= self.flush_size or (
+            events > 0 and oldest is not None
+            and time.monotonic() - oldest >= self.flush_interval
+        )
+
+    def flush(self):
+        """ Write the buffered events, returning how many were written. A
+        batch the backend fails to write is logged and dropped, not retried.
+        """
+        with self._flush_lock:
+            with self._lock:
+                events, self._events = self._events, []
+                self._oldest = None
+            if not events:
+                return 0
+
+            try:
+                self.backend.write(events)
+            except Exception:
+                logger.exception('Unable to write %d audit events.', len(events))
+                with self._lock:
+                    self.failed += len(events)
+                AUDIT_EVENTS.labels('failed').inc(len(events))
+                return 0
+
+            with self._lock:
+                self.written += len(events)
+            AUDIT_EVENTS.labels('written').inc(len(events))
+            return len(events)
+
+    def flush_if_due(self, *args, **kwargs):
+        """ Flush when the size or time threshold is reached. Usable as a
+        signal receiver.
+        """
+        if self.is_due():
+            self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'buffered': len(self._events),
+                'recorded': self.recorded,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+            }
+
+
+def get_remote_addr(request):
+    return request.META.get('REMOTE_ADDR') or None
+
+
+audit_log = AuditLog(
+    get_backend(settings.AUDIT_LOG['BACKEND'], settings.AUDIT_LOG['DIRECTORY']),
+    max_events=settings.AUDIT_LOG['MAX_EVENTS'],
+    flush_size=settings.AUDIT_LOG['FLUSH_SIZE'],
+    flush_interval=settings.AUDIT_LOG['FLUSH_INTERVAL'],
+)
+atexit.register(audit_log.flush)
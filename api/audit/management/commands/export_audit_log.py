@@ -0,0 +1,104 @@
+import csv
+import datetime
+import json
+
+from django.conf import settings
+from django.core.management import base
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from audit.backends import get_backend
+
+
+CSV_FIELDS = ('time', 'event', 'user_id', 'client_id', 'remote_addr', 'details')
+
+
+def parse_time(value):
+    """ An aware datetime from an ISO 8601 date or datetime. Dates are
+    midnight and naive datetimes are in the current time zone.
+    """
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise base.CommandError(f'Expected an ISO 8601 date or datetime, got "{value}".')
+        parsed = datetime.datetime.combine(day, datetime.time())
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class Command(base.BaseCommand):
+    help = (
+        'Export the audit events recorded between two times, oldest first, as '
+        'JSON lines or CSV.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-s',
+            '--since',
+            help='Only events at or after this ISO 8601 date or datetime.',
+            default=None
+        )
+        parser.add_argument(
+            '-u',
+            '--until',
+            help='Only events before this ISO 8601 date or datetime.',
+            default=None
+        )
+        parser.add_argument(
+            '-e',
+            '--event',
+            help='Only events of this type, e.g. token.issued. Can be repeated.',
+            action='append',
+            dest='events',
+            default=[]
+        )
+        parser.add_argument(
+            '--source',
+            help='Read from the "database" or "file" backend. Default: AUDIT_LOG_BACKEND.',
+            choices=('database', 'file'),
+            default=settings.AUDIT_LOG['BACKEND'] or 'database'
+        )
+        parser.add_argument(
+            '-f',
+            '--format',
+            help='Write "jsonl" or "csv". Default: jsonl',
+            choices=('jsonl', 'csv'),
+            default='jsonl'
+        )
+        parser.add_argument(
+            '-o',
+            '--output',
+            help='Write the events to this file instead of stdout.',
+            default=None
+        )
+
+    def write_events(self, rows, output, output_format):
+        if output_format == 'csv':
+            writer = csv.writer(output)
+            writer.writerow(CSV_FIELDS)
+            for row in rows:
+                row = dict(row, details=json.dumps(row['details'], cls=DjangoJSONEncoder))
+                writer.writerow([
+                    '' if row[field] is None else row[field] for field in CSV_FIELDS
+                ])
+        else:
+            for row in rows:
+                output.write(json.dumps(row, cls=DjangoJSONEncoder) + '\n')
+
+    def handle(self, since, until, events, source, format, output, *args, **kwargs):
+        since = parse_time(since) if since else None
+        until = parse_time(until) if until else None
+        if since and until and since >= until:
+            raise base.CommandError('--since must be before --until.')
+
+        backend = get_backend(source, settings.AUDIT_LOG['DIRECTORY'])
+        rows = backend.read(since=since, until=until, events=events)
+        if output:
+            with open(output, 'w', newline='') as f:
+                self.write_events(rows, f, format)
+        else:
+            self.write_events(rows, self.stdout, format)
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 14:23
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('event', models.CharField(max_length=64)),
+                ('user_id', models.IntegerField(blank=True, null=True)),
+                ('client_id', models.CharField(blank=True, max_length=100)),
+                ('remote_addr', models.GenericIPAddressField(blank=True, null=True)),
+                ('details', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='auditevent',
+            index_together=set([('event', 'created_at')]),
+        ),
+    ]
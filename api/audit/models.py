@@ -0,0 +1,32 @@
+from django.db import models
+from django.utils import timezone
+
+
+class AuditEvent(models.Model):
+    """ A record of something security relevant: a token issued, an
+    authorization allowed or denied, a bearer token rejected or a managed
+    user created.
+
+    Events are buffered by each worker and written in bulk by
+    `audit.log.AuditLog`, so the log is append-only and rows are never
+    updated.
+
+    Notes
+    -----
+
+    - `user_id` is the user the event is about (e.g. the token's owner or
+    the managing user), kept as a plain id so events outlive deleted users.
+    - `details` is a JSON object with the event's other fields.
+    """
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    event = models.CharField(max_length=64)
+    user_id = models.IntegerField(null=True, blank=True)
+    client_id = models.CharField(max_length=100, blank=True)
+    remote_addr = models.GenericIPAddressField(null=True, blank=True)
+    details = models.TextField(blank=True)
+
+    class Meta:
+        index_together = [('event', 'created_at')]
+
+    def __str__(self):
+        return f'{self.created_at} {self.event}'
@@ -0,0 +1,8 @@
+from django.core.signals import request_finished
+
+from .log import audit_log
+
+
+# Flushing once the response has been sent keeps the writes off the
+# request's latency.
+request_finished.connect(audit_log.flush_if_due, dispatch_uid='audit.flush_if_due')
@@ -0,0 +1,234 @@
+import datetime
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from oauth2_provider.models import Application
+
+from .apps import AuditConfig
+from .backends import DatabaseBackend, FileBackend
+from .log import AuditLog, audit_log, make_event
+from .models import AuditEvent
+
+
+class ListBackend(object):
+
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    def write(self, events):
+        if self.fail:
+            raise OSError('The disk is full.')
+        self.batches.append(events)
+
+
+def event_at(time, event='token.issued', **fields):
+    entry = make_event(event, **fields)
+    entry['time'] = time
+    return entry
+
+
+class AuditAppTestCase(TestCase):
+
+    def test_apps(self):
+        self.assertEqual(AuditConfig.name, 'audit')
+
+
+class AuditLogTestCase(TestCase):
+
+    def test_nothing_is_recorded_without_a_backend(self):
+        log = AuditLog(None)
+        log.record('token.issued')
+        self.assertEqual(len(log), 0)
+        self.assertEqual(log.flush(), 0)
+
+    def test_flushes_in_batches(self):
+        backend = ListBackend()
+        log = AuditLog(backend, flush_size=3, flush_interval=60)
+        log.record('token.issued', user_id=1, client_id='abc', grant_type='password')
+        log.record('token.rejected', path='/validate/')
+        self.assertFalse(log.is_due())
+
+        log.record('token.rejected', path='/validate/')
+        self.assertTrue(log.is_due())
+        log.flush_if_due()
+        self.assertEqual(len(backend.batches), 1)
+        self.assertEqual([event['event'] for event in backend.batches[0]], [
+            'token.issued', 'token.rejected', 'token.rejected'
+        ])
+        self.assertEqual(backend.batches[0][0]['details'], {'grant_type': 'password'})
+        self.assertEqual(log.stats()['written'], 3)
+        self.assertEqual(len(log), 0)
+
+    def test_flushes_after_the_interval(self):
+        log = AuditLog(ListBackend(), flush_size=100, flush_interval=5)
+        with mock.patch('audit.log.time.monotonic', return_value=100):
+            log.record('token.rejected')
+        with mock.patch('audit.log.time.monotonic', return_value=104):
+            self.assertFalse(log.is_due())
+        with mock.patch('audit.log.time.monotonic', return_value=105):
+            self.assertTrue(log.is_due())
+
+    def test_drops_events_when_full(self):
+        log = AuditLog(ListBackend(), max_events=2)
+        for _ in range(5):
+            log.record('token.rejected')
+
+        self.assertEqual(len(log), 2)
+        self.assertEqual(log.stats()['dropped'], 3)
+
+    def test_failed_batches_are_counted_and_dropped(self):
+        log = AuditLog(ListBackend(fail=True))
+        log.record('token.rejected')
+        with self.assertLogs('audit.log', 'ERROR'):
+            self.assertEqual(log.flush(), 0)
+
+        self.assertEqual(log.stats()['failed'], 1)
+        self.assertEqual(len(log), 0)
+
+
+class AuditBackendsTestCase(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now().replace(microsecond=0)
+        self.events = [
+            event_at(self.now - datetime.timedelta(days=2), 'managed_user.created', user_id=1),
+            event_at(self.now - datetime.timedelta(hours=1), remote_addr='10.0.0.1'),
+            event_at(self.now, 'token.rejected', path='/validate/'),
+        ]
+
+    def test_database(self):
+        backend = DatabaseBackend()
+        backend.write(self.events)
+        self.assertEqual(AuditEvent.objects.count(), 3)
+
+        rows = list(backend.read(since=self.now - datetime.timedelta(days=1)))
+        self.assertEqual([row['event'] for row in rows], ['token.issued', 'token.rejected'])
+        self.assertEqual(rows[0]['remote_addr'], '10.0.0.1')
+        self.assertEqual(rows[1]['details'], {'path': '/validate/'})
+
+        rows = list(backend.read(until=self.now, events=['managed_user.created']))
+        self.assertEqual([row['user_id'] for row in rows], [1])
+
+    def test_file(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        backend = FileBackend(directory.name)
+        # Written out of order, as batches from several workers can be.
+        backend.write(self.events[1:])
+        backend.write(self.events[:1])
+
+        files = sorted(os.listdir(directory.name))
+        self.assertGreaterEqual(len(files), 2)
+        self.assertEqual(len(backend.get_days(since=self.now)), 1)
+
+        rows = list(backend.read())
+        self.assertEqual([row['time'] for row in rows], [event['time'] for event in self.events])
+        since = self.now - datetime.timedelta(days=1)
+        rows = list(backend.read(since=since, events=['token.rejected']))
+        self.assertEqual([row['details'] for row in rows], [{'path': '/validate/'}])
+
+
+class AuditEventsTestCase(TestCase):
+    """ The events recorded by the views. """
+
+    def setUp(self):
+        self.user = User.objects.create_user('test_user', 'tester@gmail.com', 'test')
+        self.application = Application.objects.create(
+            name='Test Application',
+            redirect_uris='http://localhost/',
+            user=self.user,
+            skip_authorization=True,
+            authorization_grant_type=Application.GRANT_IMPLICIT,
+            client_type=Application.CLIENT_PUBLIC,
+        )
+        self.backend = ListBackend()
+        patcher = mock.patch.object(audit_log, 'backend', self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(audit_log.flush)
+
+    def get_events(self):
+        audit_log.flush()
+        return [event for batch in self.backend.batches for event in batch]
+
+    def test_authorize(self):
+        self.client.login(username='test_user', password='test')
+        r = self.client.get('/o/authorize/', {
+            'client_id': self.application.client_id,
+            'response_type': 'token',
+        })
+        self.assertEqual(r.status_code, 302)
+
+        allowed, issued = self.get_events()
+        self.assertEqual(allowed['event'], 'authorization.allowed')
+        self.assertEqual(allowed['user_id'], self.user.pk)
+        self.assertEqual(allowed['client_id'], self.application.client_id)
+        self.assertEqual(allowed['remote_addr'], '127.0.0.1')
+        self.assertEqual(issued['event'], 'token.issued')
+        self.assertEqual(issued['details']['grant_type'], 'implicit')
+
+    def test_rejected_bearer_tokens(self):
+        r = self.client.get('/validate/', HTTP_AUTHORIZATION='Bearer not-a-token')
+        self.assertEqual(r.status_code, 401)
+
+        event, = self.get_events()
+        self.assertEqual(event['event'], 'token.rejected')
+        self.assertEqual(event['details'], {'path': '/validate/'})
+
+    def test_flushed_once_requests_finish(self):
+        with mock.patch.object(audit_log, 'flush_size', 1):
+            self.client.get('/validate/', HTTP_AUTHORIZATION='Bearer not-a-token')
+        self.assertEqual(len(self.backend.batches), 1)
+        self.assertEqual(len(audit_log), 0)
+
+
+class ExportAuditLogCommandTestCase(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+        DatabaseBackend().write([
+            event_at(self.now - datetime.timedelta(days=2), 'managed_user.created', user_id=1),
+            event_at(self.now, 'token.issued', client_id='abc', grant_type='password'),
+        ])
+
+    def test_export(self):
+        out = StringIO()
+        call_command(
+            'export_audit_log', since=(self.now - datetime.timedelta(days=1)).isoformat(),
+            source='database', stdout=out,
+        )
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([row['event'] for row in rows], ['token.issued'])
+        self.assertEqual(rows[0]['details'], {'grant_type': 'password'})
+
+        out = StringIO()
+        call_command('export_audit_log', source='database', format='csv', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], 'time,event,user_id,client_id,remote_addr,details')
+        self.assertEqual(len(lines), 3)
+
+    def test_export_from_files(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        FileBackend(directory.name).write([event_at(self.now, 'token.rejected')])
+
+        out = StringIO()
+        with override_settings(AUDIT_LOG={'BACKEND': 'file', 'DIRECTORY': directory.name}):
+            call_command('export_audit_log', source='file', event=['token.rejected'], stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['event'], 'token.rejected')
+
+    def test_invalid_range(self):
+        with self.assertRaises(CommandError):
+            call_command('export_audit_log', since='yesterday', stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command(
+                'export_audit_log', since='2018-11-02', until='2018-11-01', stdout=StringIO()
+            )
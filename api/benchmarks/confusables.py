@@ -0,0 +1,105 @@
+""" Comparing the memory and speed of the homoglyph checks backed by
+`confusable_homoglyphs`' JSON dicts and by the compiled index.
+
+Each backend is measured in a fresh interpreter (see `run()`), which loads
+it, checks a sample of names with `is_dangerous` and prints how much its
+memory grew and how long that took, as JSON.
+"""
+import json
+import os
+import random
+import string
+import sys
+import time
+
+from . import imports
+
+
+BACKENDS = ('json', 'index')
+
+# Names are mostly ASCII, with some Greek and Cyrillic letters mixed in.
+ALPHABETS = (
+    string.ascii_letters + string.digits + '._-',
+    ''.join(map(chr, range(0x391, 0x3ca))),
+    ''.join(map(chr, range(0x410, 0x450))),
+)
+
+
+def sample_names(count, seed=0):
+    rng = random.Random(seed)
+    names = []
+    for _ in range(count):
+        alphabet = ''.join(rng.sample(ALPHABETS, rng.choice((1, 1, 1, 2))))
+        names.append(''.join(rng.choice(alphabet) for _ in range(rng.randint(6, 16))))
+    return names
+
+
+def get_memory():
+    """ This process's resident and private memory in KiB. The private
+    memory leaves out pages shared with other processes, such as those of
+    a mapped file. It's only known on Linux.
+    """
+    memory = {'rss_kb': None, 'private_kb': None}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        import resource
+        memory['rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return memory
+
+    values = {}
+    for line in lines:
+        name, _, value = line.partition(':')
+        if value.strip().endswith('kB'):
+            values[name] = int(value.split()[0])
+    memory['rss_kb'] = values.get('Rss')
+    memory['private_kb'] = values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)
+    return memory
+
+
+def load_backend(backend):
+    from django.conf import settings
+    if backend == 'json':
+        os.environ['CONFUSABLE_DATA'] = settings.CONFUSABLES['DATA_DIR']
+        from confusable_homoglyphs import confusables
+        return confusables
+
+    from oauth_microservice.utils import confusables
+    confusables.get_index()
+    return confusables
+
+
+def measure(backend, count=10000, seed=0):
+    import django
+    django.setup()
+
+    names = sample_names(count, seed)
+    before = get_memory()
+    started = time.perf_counter()
+    module = load_backend(backend)
+    loaded = time.perf_counter()
+    dangerous = sum(1 for name in names if module.is_dangerous(name))
+    finished = time.perf_counter()
+    after = get_memory()
+
+    json.dump({
+        'backend': backend,
+        'load_ms': round((loaded - started) * 1000, 2),
+        'checks': count,
+        'dangerous': dangerous,
+        'us_per_check': round((finished - loaded) / count * 1e6, 2),
+        'rss_kb': after['rss_kb'] - before['rss_kb'],
+        'private_kb': (
+            after['private_kb'] - before['private_kb']
+            if after['private_kb'] is not None else None
+        ),
+    }, sys.stdout)
+
+
+def run(backend, count=10000, seed=0):
+    """ Measure `backend` in a new interpreter, and return the result. """
+    return imports.run_python(
+        f'from benchmarks import confusables; '
+        f'confusables.measure({backend!r}, {count:d}, {seed:d})'
+    )
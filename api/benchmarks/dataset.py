@@ -0,0 +1,161 @@
+from collections import namedtuple
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, Permission, User
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Application
+from oauthlib.common import generate_token
+
+from users.models import PermissionSupport
+from users.permissions import rebuild_effective_permissions
+from .models import SeededObject
+
+
+PREFIX = 'bench_'
+PASSWORD = 'benchmark'
+REDIRECT_URI = 'http://localhost/benchmark/callback'
+
+GroupPermission = Group.permissions.through
+UserGroup = User.groups.through
+
+
+Dataset = namedtuple('Dataset', (
+    # The client used for the password grant on /o/token/.
+    'token_application',
+    # The client, which skips authorization, used on /o/authorize/.
+    'authorize_application',
+    'usernames',
+    'codenames',
+    'tokens',
+))
+Dataset.__doc__ = """ The benchmark data. Every user's password is `PASSWORD`. """
+
+
+def seeded(model):
+    """ The objects of `model` created by `seed()`. """
+    content_type = ContentType.objects.get_for_model(model)
+    return model.objects.filter(
+        pk__in=SeededObject.objects.filter(content_type=content_type).values('object_id')
+    )
+
+
+def record(model, ids):
+    content_type = ContentType.objects.get_for_model(model)
+    SeededObject.objects.bulk_create([
+        SeededObject(content_type=content_type, object_id=pk) for pk in ids
+    ])
+
+
+def clear():
+    """ Delete the benchmark data. Only objects created by `seed()` are
+    deleted, whatever their names.
+    """
+    with transaction.atomic():
+        # Access tokens go with their application and user.
+        for model in (Application, User, Group, Permission):
+            seeded(model).delete()
+        SeededObject.objects.all().delete()
+
+
+@transaction.atomic
+def seed(users=1000, groups=10, permissions_per_group=5, tokens=1000):
+    """ Create `users` users spread evenly over `groups` groups with
+    `permissions_per_group` permissions each, and `tokens` live access
+    tokens spread evenly over the users. Any previous benchmark data is
+    replaced.
+    """
+    clear()
+
+    content_type = ContentType.objects.get_for_model(PermissionSupport)
+    codenames = [f'{PREFIX}permission_{i}' for i in range(groups * permissions_per_group)]
+    Permission.objects.bulk_create([
+        Permission(codename=codename, name=f'Benchmark permission {i}', content_type=content_type)
+        for i, codename in enumerate(codenames)
+    ])
+    group_names = [f'{PREFIX}group_{i}' for i in range(groups)]
+    Group.objects.bulk_create([Group(name=name) for name in group_names])
+
+    # Not every database backend sets primary keys on bulk inserts.
+    permission_ids = dict(
+        Permission.objects.filter(content_type=content_type, codename__in=codenames)
+        .values_list('codename', 'pk')
+    )
+    group_ids = dict(Group.objects.filter(name__in=group_names).values_list('name', 'pk'))
+    record(Permission, permission_ids.values())
+    record(Group, group_ids.values())
+    GroupPermission.objects.bulk_create([
+        GroupPermission(
+            group_id=group_ids[group_names[i]],
+            permission_id=permission_ids[codenames[i * permissions_per_group + j]],
+        )
+        for i in range(groups)
+        for j in range(permissions_per_group)
+    ])
+
+    # Hashing is slow on purpose, so every user shares one hash.
+    password = make_password(PASSWORD)
+    usernames = [f'{PREFIX}user_{i}' for i in range(users)]
+    User.objects.bulk_create([
+        User(username=username, email=f'{username}@example.com', password=password)
+        for username in usernames
+    ])
+    user_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'pk'))
+    user_ids = [user_ids[username] for username in usernames]
+    record(User, user_ids)
+    if groups:
+        UserGroup.objects.bulk_create([
+            UserGroup(user_id=user_id, group_id=group_ids[group_names[i % groups]])
+            for i, user_id in enumerate(user_ids)
+        ])
+    rebuild_effective_permissions(user_ids)
+
+    token_application = Application.objects.create(
+        name=f'{PREFIX}password',
+        client_type=Application.CLIENT_CONFIDENTIAL,
+        authorization_grant_type=Application.GRANT_PASSWORD,
+    )
+    authorize_application = Application.objects.create(
+        name=f'{PREFIX}authorize',
+        client_type=Application.CLIENT_CONFIDENTIAL,
+        authorization_grant_type=Application.GRANT_AUTHORIZATION_CODE,
+        redirect_uris=REDIRECT_URI,
+        skip_authorization=True,
+    )
+    record(Application, [token_application.pk, authorize_application.pk])
+    expires = timezone.now() + timedelta(days=30)
+    if user_ids:
+        AccessToken.objects.bulk_create([
+            AccessToken(
+                user_id=user_ids[i % len(user_ids)],
+                application=token_application,
+                token=generate_token(),
+                expires=expires,
+                scope='read write',
+            )
+            for i in range(tokens)
+        ])
+    return load()
+
+
+def load():
+    """ Read the benchmark data back, e.g. for a run in another process. """
+    applications = seeded(Application)
+    try:
+        token_application = applications.get(name=f'{PREFIX}password')
+        authorize_application = applications.get(name=f'{PREFIX}authorize')
+    except Application.DoesNotExist:
+        return None
+    return Dataset(
+        token_application=token_application,
+        authorize_application=authorize_application,
+        usernames=list(seeded(User).order_by('pk').values_list('username', flat=True)),
+        codenames=list(seeded(Permission).order_by('pk').values_list('codename', flat=True)),
+        tokens=list(
+            AccessToken.objects.filter(
+                application=token_application, expires__gt=timezone.now()
+            ).order_by('pk').values_list('token', flat=True)
+        ),
+    )
@@ -0,0 +1,114 @@
+""" Benchmarking the WSGI and ASGI deployments against each other.
+
+`compare()` starts each deployment in turn on a free local port, with the
+same number of gunicorn workers and threads per worker (`ASGI_THREADS` for
+the ASGI one), runs the same benchmark against it over HTTP and stops it.
+Both servers use the current settings and database, so seed_benchmark must
+have run first.
+"""
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import runner
+
+
+DEPLOYMENTS = ('wsgi', 'asgi')
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def get_server_command(deployment, port, workers, threads):
+    """ The gunicorn command line the entrypoint would run for
+    `deployment`, bound to `port` on localhost.
+    """
+    command = [
+        sys.executable, '-m', 'gunicorn',
+        '--config', 'gunicorn_config.py',
+        '--bind', f'127.0.0.1:{port}',
+        '--workers', str(workers),
+    ]
+    if deployment == 'asgi':
+        # The threads are the ASGI app's own pool, set with ASGI_THREADS.
+        return command + [
+            '--worker-class', 'uvicorn.workers.UvicornWorker', 'oauth_microservice.asgi:application'
+        ]
+    return command + ['--threads', str(threads), 'oauth_microservice.wsgi']
+
+
+def wait_for_server(process, port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'The server exited with status {process.returncode}.')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'The server did not start within {timeout} seconds.')
+
+
+def benchmark_deployment(deployment, dataset, workers=1, threads=8, timeout=30, **options):
+    """ Start `deployment`, benchmark it with `runner.run(**options)` and
+    stop it again.
+    """
+    port = get_free_port()
+    process = subprocess.Popen(
+        get_server_command(deployment, port, workers, threads),
+        cwd=settings.BASE_DIR,
+        env=dict(os.environ, ASGI_THREADS=str(threads)),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    try:
+        try:
+            wait_for_server(process, port, timeout)
+        except RuntimeError as e:
+            process.kill()
+            errors = process.communicate()[1].strip()
+            raise RuntimeError(f'{e}\n{errors}' if errors else str(e))
+        return runner.run(dataset, url=f'http://127.0.0.1:{port}', **options)
+    finally:
+        if process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+
+def compare(dataset, deployments=DEPLOYMENTS, workers=1, threads=8, timeout=30, **options):
+    """ Benchmark each deployment the same way, and return their reports
+    side by side with the requests per second of each scenario.
+    """
+    reports = OrderedDict(
+        (deployment, benchmark_deployment(
+            deployment, dataset, workers=workers, threads=threads, timeout=timeout, **options
+        ))
+        for deployment in deployments
+    )
+    summary = OrderedDict(
+        (name, OrderedDict(
+            (deployment, report['scenarios'][name]['requests_per_second'])
+            for deployment, report in reports.items()
+        ))
+        for name in next(iter(reports.values()))['scenarios']
+    )
+    return OrderedDict((
+        ('workers', workers),
+        ('threads', threads),
+        ('requests_per_second', summary),
+        ('deployments', reports),
+    ))
@@ -0,0 +1,110 @@
+""" Measuring how long a worker takes to import the app.
+
+`profile()` runs in a fresh interpreter (see `run()`), times every module
+imported while Django is set up and the URLconf is loaded, and prints the
+result as JSON. Python 3.6 has no `-X importtime`, so imports are timed by
+wrapping `importlib._bootstrap._find_and_load`, which is what both the
+`import` statement and `importlib.import_module` call for modules that
+aren't loaded yet.
+"""
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+def _time_imports(timings):
+    """ Start recording `{module: (self seconds, cumulative seconds)}` into
+    `timings`. Time spent importing a module's own imports only counts
+    towards its cumulative time.
+    """
+    bootstrap = importlib._bootstrap
+    find_and_load = bootstrap._find_and_load
+    # The time spent in the children of each import in progress.
+    stack = []
+
+    def timed_find_and_load(name, import_):
+        started = time.perf_counter()
+        stack.append(0.0)
+        try:
+            return find_and_load(name, import_)
+        finally:
+            elapsed = time.perf_counter() - started
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            timings[name] = (elapsed - children, elapsed)
+
+    bootstrap._find_and_load = timed_find_and_load
+
+
+def profile():
+    timings = {}
+    _time_imports(timings)
+
+    started = time.perf_counter()
+    import django
+    django.setup()
+    setup_finished = time.perf_counter()
+
+    from django.conf import settings
+    importlib.import_module(settings.ROOT_URLCONF)
+    finished = time.perf_counter()
+
+    json.dump({
+        'api_only': settings.API_ONLY,
+        'seconds': {
+            'setup': setup_finished - started,
+            'urlconf': finished - setup_finished,
+            'total': finished - started,
+        },
+        'modules': {name: list(times) for name, times in timings.items()},
+    }, sys.stdout)
+
+
+def run_python(statement, env=None):
+    """ Run `statement` in a new interpreter with the current settings and
+    `env` added to the environment, and return the JSON it prints.
+    """
+    from django.conf import settings
+    result = subprocess.run(
+        [sys.executable, '-c', statement],
+        cwd=settings.BASE_DIR,
+        env=dict(os.environ, **(env or {})),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    if result.returncode:
+        raise RuntimeError(f'Unable to run {statement!r}:\n{result.stderr}')
+    return json.loads(result.stdout)
+
+
+def run(env=None):
+    """ Profile the imports in a new interpreter, and return the result. """
+    return run_python('from benchmarks import imports; imports.profile()', env)
+
+
+def report(results, top=20):
+    """ Summarize several runs: the fastest run's phases and the `top`
+    slowest modules of that run by self time.
+    """
+    fastest = min(results, key=lambda result: result['seconds']['total'])
+    modules = sorted(fastest['modules'].items(), key=lambda item: item[1][0], reverse=True)
+    return {
+        'python': sys.version.split()[0],
+        'api_only': fastest['api_only'],
+        'runs': len(results),
+        'seconds': {name: round(value, 4) for name, value in fastest['seconds'].items()},
+        'modules_imported': len(fastest['modules']),
+        'slowest_modules': [
+            {
+                'module': name,
+                'self_ms': round(self_time * 1000, 2),
+                'cumulative_ms': round(cumulative * 1000, 2),
+            }
+            for name, (self_time, cumulative) in modules[:top]
+        ],
+    }
@@ -0,0 +1,82 @@
+import json
+
+from django.core.management import base
+
+from benchmarks import dataset, runner
+
+
+class Command(base.BaseCommand):
+    help = (
+        'Measure the latency (p50/p95/p99), throughput and database queries '
+        'per request of the hot endpoints, in-process or against a running '
+        'server, and print the results as JSON. Run seed_benchmark first.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'scenarios',
+            nargs='*',
+            help=f'The endpoints to benchmark. Default: all of {", ".join(runner.SCENARIOS)}.',
+        )
+        parser.add_argument(
+            '-u',
+            '--url',
+            help=(
+                'The base URL of a running server, e.g. http://localhost:8000. '
+                'Default: send the requests in-process, which also counts queries.'
+            ),
+            default=None
+        )
+        parser.add_argument(
+            '-n',
+            '--requests',
+            help='The number of measured requests per endpoint. Default: 500',
+            type=int,
+            default=500
+        )
+        parser.add_argument(
+            '--warmup',
+            help='The number of unmeasured requests sent first. Default: 20',
+            type=int,
+            default=20
+        )
+        parser.add_argument(
+            '-c',
+            '--concurrency',
+            help='The number of clients sending requests at once. Default: 1',
+            type=int,
+            default=1
+        )
+        parser.add_argument(
+            '--seed',
+            help='Seeds the choice of users, tokens and permissions. Default: 0',
+            type=int,
+            default=0
+        )
+        parser.add_argument(
+            '-o',
+            '--output',
+            help='Write the JSON report to this file instead of stdout.',
+            default=None
+        )
+
+    def handle(self, scenarios, url, requests, warmup, concurrency, seed, output,
+               *args, **kwargs):
+        unknown = [name for name in scenarios if name not in runner.SCENARIOS]
+        if unknown:
+            raise base.CommandError(f'Unknown endpoints: {", ".join(unknown)}.')
+
+        data = dataset.load()
+        if data is None or not data.tokens:
+            raise base.CommandError('There is no benchmark data. Run seed_benchmark first.')
+
+        report = runner.run(
+            data, scenarios=scenarios, url=url, requests=requests,
+            warmup=warmup, concurrency=concurrency, seed=seed,
+        )
+        report = json.dumps(report, indent=2)
+        if output:
+            with open(output, 'w') as f:
+                f.write(report + '\n')
+        else:
+            self.stdout.write(report)
@@ -0,0 +1,53 @@
+import json
+
+from django.core.management import base
+
+from benchmarks import confusables
+from oauth_microservice.utils.confusables import get_index
+
+
+class Command(base.BaseCommand):
+    help = (
+        'Compare the memory each worker needs and the speed of the homoglyph '
+        'checks with confusable_homoglyphs\' JSON tables and with the compiled '
+        'index, and print the results as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-n',
+            '--checks',
+            help='The number of names checked by each backend. Default: 10000',
+            type=int,
+            default=10000
+        )
+        parser.add_argument(
+            '--seed',
+            help='Seeds the sample of names. Default: 0',
+            type=int,
+            default=0
+        )
+        parser.add_argument(
+            '-o',
+            '--output',
+            help='Write the JSON report to this file instead of stdout.',
+            default=None
+        )
+
+    def handle(self, checks, seed, output, *args, **kwargs):
+        if checks < 1:
+            raise base.CommandError('--checks must be at least 1.')
+
+        # Build the index first, so that isn't measured.
+        get_index()
+        try:
+            results = [confusables.run(backend, checks, seed) for backend in confusables.BACKENDS]
+        except RuntimeError as e:
+            raise base.CommandError(str(e))
+
+        report = json.dumps({'backends': results}, indent=2)
+        if output:
+            with open(output, 'w') as f:
+                f.write(report + '\n')
+        else:
+            self.stdout.write(report)
@@ -0,0 +1,100 @@
+import json
+
+from django.core.management import base
+
+from benchmarks import dataset, deployments, runner
+
+
+class Command(base.BaseCommand):
+    help = (
+        'Start the WSGI and the ASGI deployment in turn on a local port, run '
+        'the same benchmark against each and print the results side by side '
+        'as JSON. Run seed_benchmark first.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'scenarios',
+            nargs='*',
+            help=f'The endpoints to benchmark. Default: all of {", ".join(runner.SCENARIOS)}.',
+        )
+        parser.add_argument(
+            '-w',
+            '--workers',
+            help='The number of gunicorn workers of each deployment. Default: 1',
+            type=int,
+            default=1
+        )
+        parser.add_argument(
+            '-t',
+            '--threads',
+            help=(
+                'The number of threads per worker: gunicorn threads for WSGI, '
+                'ASGI_THREADS for ASGI. Default: 8'
+            ),
+            type=int,
+            default=8
+        )
+        parser.add_argument(
+            '-n',
+            '--requests',
+            help='The number of measured requests per endpoint. Default: 500',
+            type=int,
+            default=500
+        )
+        parser.add_argument(
+            '--warmup',
+            help='The number of unmeasured requests sent first. Default: 20',
+            type=int,
+            default=20
+        )
+        parser.add_argument(
+            '-c',
+            '--concurrency',
+            help='The number of clients sending requests at once. Default: 8',
+            type=int,
+            default=8
+        )
+        parser.add_argument(
+            '--seed',
+            help='Seeds the choice of users, tokens and permissions. Default: 0',
+            type=int,
+            default=0
+        )
+        parser.add_argument(
+            '--timeout',
+            help='Seconds to wait for each server to start. Default: 30',
+            type=int,
+            default=30
+        )
+        parser.add_argument(
+            '-o',
+            '--output',
+            help='Write the JSON report to this file instead of stdout.',
+            default=None
+        )
+
+    def handle(self, scenarios, workers, threads, requests, warmup, concurrency, seed,
+               timeout, output, *args, **kwargs):
+        unknown = [name for name in scenarios if name not in runner.SCENARIOS]
+        if unknown:
+            raise base.CommandError(f'Unknown endpoints: {", ".join(unknown)}.')
+
+        data = dataset.load()
+        if data is None or not data.tokens:
+            raise base.CommandError('There is no benchmark data. Run seed_benchmark first.')
+
+        try:
+            report = deployments.compare(
+                data, workers=workers, threads=threads, timeout=timeout,
+                scenarios=scenarios, requests=requests, warmup=warmup,
+                concurrency=concurrency, seed=seed,
+            )
+        except RuntimeError as e:
+            raise base.CommandError(str(e))
+        report = json.dumps(report, indent=2)
+        if output:
+            with open(output, 'w') as f:
+                f.write(report + '\n')
+        else:
+            self.stdout.write(report)
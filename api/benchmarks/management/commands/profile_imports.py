@@ -0,0 +1,59 @@
+import json
+
+from django.core.management import base
+
+from benchmarks import imports
+
+
+class Command(base.BaseCommand):
+    help = (
+        'Measure how long a fresh worker takes to set up Django and load the '
+        'URLconf, and which modules are slowest to import, and print the '
+        'results as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-n',
+            '--top',
+            help='The number of slowest modules to list. Default: 20',
+            type=int,
+            default=20
+        )
+        parser.add_argument(
+            '-r',
+            '--runs',
+            help='Profile this many fresh interpreters and report the fastest. Default: 3',
+            type=int,
+            default=3
+        )
+        parser.add_argument(
+            '--api-only',
+            help='Profile with API_ONLY set, as API-only workers boot.',
+            action='store_true',
+            default=False
+        )
+        parser.add_argument(
+            '-o',
+            '--output',
+            help='Write the JSON report to this file instead of stdout.',
+            default=None
+        )
+
+    def handle(self, top, runs, api_only, output, *args, **kwargs):
+        if runs < 1:
+            raise base.CommandError('--runs must be at least 1.')
+
+        env = {'API_ONLY': 'true'} if api_only else {}
+        try:
+            results = [imports.run(env) for _ in range(runs)]
+        except RuntimeError as e:
+            raise base.CommandError(str(e))
+
+        report = imports.report(results, top=top)
+        report = json.dumps(report, indent=2)
+        if output:
+            with open(output, 'w') as f:
+                f.write(report + '\n')
+        else:
+            self.stdout.write(report)
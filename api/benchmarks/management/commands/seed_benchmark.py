@@ -0,0 +1,46 @@
+from django.core.management import base
+from django.utils import timezone
+
+from benchmarks import dataset
+
+
+class Command(base.BaseCommand):
+    help = (
+        'Create the data the benchmark runs against: users spread over groups '
+        'with permissions, live access tokens and two OAuth clients. Replaces '
+        'the data created by the previous run, which is prefixed with "bench_".'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Default: 1000')
+        parser.add_argument('--groups', type=int, default=10, help='Default: 10')
+        parser.add_argument(
+            '--permissions-per-group', type=int, default=5, help='Default: 5'
+        )
+        parser.add_argument('--tokens', type=int, default=1000, help='Default: 1000')
+        parser.add_argument(
+            '--clear',
+            help='Delete the benchmark data instead.',
+            action='store_true',
+            default=False
+        )
+
+    def log(self, message):
+        """ Write log messages to stdout in a consistent format. """
+        self.stdout.write('[{date}] {message}'.format(
+            date=timezone.now(),
+            message=message
+        ))
+
+    def handle(self, verbosity, users, groups, permissions_per_group, tokens, clear,
+               *args, **kwargs):
+        if clear:
+            self.log('Deleting the benchmark data...')
+            dataset.clear()
+        else:
+            self.log(
+                f'Creating {users} users, {groups} groups with {permissions_per_group} '
+                f'permissions each and {tokens} access tokens...'
+            )
+            dataset.seed(users, groups, permissions_per_group, tokens)
+        self.log('Done.')
@@ -0,0 +1,16 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import models
+
+
+class SeededObject(models.Model):
+    """ An object created by `benchmarks.dataset.seed()`.
+
+    Clearing the benchmark data deletes exactly these objects, so real users,
+    groups, permissions or applications are never deleted because their name
+    happens to start with the benchmark prefix.
+    """
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = [('content_type', 'object_id')]
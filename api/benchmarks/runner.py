@@ -0,0 +1,298 @@
+import base64
+import http.client
+import math
+import random
+import subprocess
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from contextlib import ExitStack
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from oauth_microservice.renderers import JSON_BACKEND
+from .dataset import PASSWORD, REDIRECT_URI
+
+
+Scenario = namedtuple('Scenario', ('method', 'path', 'build', 'login'))
+Scenario.__doc__ = """ An endpoint to benchmark. `build(dataset, rng)` returns
+the params and headers of one request. Scenarios with `login` set run with a
+logged in session.
+"""
+
+
+def _bearer(dataset, rng):
+    return {'Authorization': f'Bearer {rng.choice(dataset.tokens)}'}
+
+
+def _basic(application):
+    credentials = f'{application.client_id}:{application.client_secret}'.encode()
+    return {'Authorization': f'Basic {base64.b64encode(credentials).decode()}'}
+
+
+SCENARIOS = OrderedDict((
+    ('validate', Scenario(
+        'GET', '/validate/',
+        lambda dataset, rng: ({}, _bearer(dataset, rng)),
+        login=False,
+    )),
+    ('user', Scenario(
+        'GET', '/user/',
+        lambda dataset, rng: ({}, _bearer(dataset, rng)),
+        login=False,
+    )),
+    ('permissions', Scenario(
+        'GET', '/permissions/',
+        lambda dataset, rng: ({}, _bearer(dataset, rng)),
+        login=False,
+    )),
+    ('has_permission', Scenario(
+        'GET', '/user/has_permission/',
+        lambda dataset, rng: ({'codename': rng.choice(dataset.codenames)}, _bearer(dataset, rng)),
+        login=False,
+    )),
+    ('token', Scenario(
+        'POST', '/o/token/',
+        lambda dataset, rng: (
+            {
+                'grant_type': 'password',
+                'username': rng.choice(dataset.usernames),
+                'password': PASSWORD,
+                'scope': 'read',
+            },
+            _basic(dataset.token_application),
+        ),
+        login=False,
+    )),
+    ('authorize', Scenario(
+        'GET', '/o/authorize/',
+        lambda dataset, rng: (
+            {
+                'response_type': 'code',
+                'client_id': dataset.authorize_application.client_id,
+                'redirect_uri': REDIRECT_URI,
+                'scope': 'read',
+            },
+            {},
+        ),
+        login=True,
+    )),
+))
+
+
+class InProcessClient(object):
+    """ Sends requests through Django's test client, which runs the whole
+    middleware and view stack without a server, and counts the queries.
+    """
+    counts_queries = True
+
+    def __init__(self):
+        self.client = Client()
+
+    def login(self, username, password):
+        self.client.login(username=username, password=password)
+
+    def request(self, method, path, params, headers):
+        extra = {'HTTP_' + name.upper().replace('-', '_'): value for name, value in headers.items()}
+        with ExitStack() as stack:
+            queries = [
+                stack.enter_context(CaptureQueriesContext(connection))
+                for connection in connections.all()
+            ]
+            started = time.perf_counter()
+            response = getattr(self.client, method.lower())(path, params, **extra)
+            elapsed = time.perf_counter() - started
+        return response.status_code, elapsed, sum(len(captured) for captured in queries)
+
+
+class HTTPClient(object):
+    """ Sends requests to a running server over one keep-alive connection.
+    Queries can't be counted from outside the server.
+    """
+    counts_queries = False
+
+    def __init__(self, url):
+        url = urlsplit(url)
+        connection_class = (
+            http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        )
+        self.connection = connection_class(url.netloc)
+        self.prefix = url.path.rstrip('/')
+        self.cookies = SimpleCookie()
+
+    def _send(self, method, path, params, headers):
+        headers = dict(headers)
+        body = None
+        if method == 'GET':
+            if params:
+                path = f'{path}?{urlencode(params, doseq=True)}'
+        else:
+            body = urlencode(params, doseq=True)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.cookies:
+            headers['Cookie'] = '; '.join(
+                f'{name}={morsel.value}' for name, morsel in self.cookies.items()
+            )
+
+        try:
+            self.connection.request(method, self.prefix + path, body, headers)
+            response = self.connection.getresponse()
+        except (http.client.HTTPException, ConnectionError):
+            # The server closed the keep-alive connection, so try again once.
+            self.connection.close()
+            self.connection.request(method, self.prefix + path, body, headers)
+            response = self.connection.getresponse()
+        response.read()
+        for cookie in response.msg.get_all('Set-Cookie') or []:
+            self.cookies.load(cookie)
+        return response.status
+
+    def login(self, username, password):
+        self._send('GET', '/accounts/login/', {}, {})
+        self._send('POST', '/accounts/login/', {
+            'username': username,
+            'password': password,
+            'csrfmiddlewaretoken': self.cookies[settings.CSRF_COOKIE_NAME].value,
+        }, {'Referer': f'http://{self.connection.host}/accounts/login/'})
+
+    def request(self, method, path, params, headers):
+        started = time.perf_counter()
+        status = self._send(method, path, params, headers)
+        return status, time.perf_counter() - started, None
+
+
+def percentile(ordered, percent):
+    """ The nearest-rank percentile of an ordered list. """
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def summarize(latencies, queries, errors, elapsed):
+    ordered = sorted(latencies)
+
+    def milliseconds(value):
+        return None if value is None else round(value * 1000, 3)
+
+    return OrderedDict((
+        ('requests', len(latencies)),
+        ('errors', errors),
+        ('p50_ms', milliseconds(percentile(ordered, 50))),
+        ('p95_ms', milliseconds(percentile(ordered, 95))),
+        ('p99_ms', milliseconds(percentile(ordered, 99))),
+        ('mean_ms', milliseconds(sum(latencies) / len(latencies) if latencies else None)),
+        ('requests_per_second', round(len(latencies) / elapsed, 1) if elapsed else None),
+        ('queries_per_request', round(sum(queries) / len(queries), 2) if queries else None),
+    ))
+
+
+def run_scenario(scenario, dataset, make_client, requests=500, warmup=20, concurrency=1, seed=0):
+    """ Send `requests` requests (after `warmup` unmeasured ones) spread over
+    `concurrency` threads, each with its own client, and summarize them.
+    """
+    latencies, queries = [], []
+    errors = [0]
+    failures = []
+    lock = threading.Lock()
+
+    def worker(number, count):
+        try:
+            rng = random.Random(f'{seed}-{number}')
+            client = make_client()
+            if scenario.login:
+                client.login(rng.choice(dataset.usernames), PASSWORD)
+            for _ in range(warmup // concurrency):
+                client.request(scenario.method, scenario.path, *scenario.build(dataset, rng))
+            start.wait()
+
+            results = []
+            for _ in range(count):
+                results.append(
+                    client.request(scenario.method, scenario.path, *scenario.build(dataset, rng))
+                )
+        except Exception as e:
+            failures.append(e)
+            start.abort()
+            return
+
+        with lock:
+            for status, latency, query_count in results:
+                latencies.append(latency)
+                if query_count is not None:
+                    queries.append(query_count)
+                if status >= 400:
+                    errors[0] += 1
+
+    counts = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    # The clock starts once every worker has logged in and warmed up.
+    started = []
+    if concurrency == 1:
+        # Run in this thread, so in-process requests share its database
+        # connection (and transaction).
+        start = threading.Barrier(1, action=lambda: started.append(time.perf_counter()))
+        worker(0, counts[0])
+    else:
+        start = threading.Barrier(
+            concurrency, action=lambda: started.append(time.perf_counter())
+        )
+        threads = [
+            threading.Thread(target=worker, args=(number, count))
+            for number, count in enumerate(counts)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    if failures:
+        raise failures[0]
+    return summarize(latencies, queries, errors[0], time.perf_counter() - started[0])
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(dataset, scenarios=None, url=None, requests=500, warmup=20, concurrency=1, seed=0):
+    """ Benchmark the scenarios in-process, or against the server at `url`,
+    and return a JSON-serializable report.
+    """
+    if url:
+        def make_client():
+            return HTTPClient(url)
+    else:
+        make_client = InProcessClient
+
+    report = OrderedDict((
+        ('commit', get_commit()),
+        ('started_at', timezone.now().isoformat()),
+        ('target', url or 'in-process'),
+        # The local one, which is only the server's when benchmarking in-process.
+        ('json_backend', JSON_BACKEND),
+        ('dataset', OrderedDict((
+            ('users', len(dataset.usernames)),
+            ('permissions', len(dataset.codenames)),
+            ('tokens', len(dataset.tokens)),
+        ))),
+        ('requests', requests),
+        ('warmup', warmup),
+        ('concurrency', concurrency),
+        ('seed', seed),
+        ('scenarios', OrderedDict()),
+    ))
+    for name in scenarios or SCENARIOS:
+        report['scenarios'][name] = run_scenario(
+            SCENARIOS[name], dataset, make_client,
+            requests=requests, warmup=warmup, concurrency=concurrency, seed=seed,
+        )
+    return report
@@ -0,0 +1,176 @@
+import json
+import subprocess
+import sys
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from . import confusables, dataset, deployments, imports, runner
+
+
+class DatasetTestCase(TestCase):
+
+    def test_seed(self):
+        data = dataset.seed(users=6, groups=2, permissions_per_group=3, tokens=9)
+
+        self.assertEqual(len(data.usernames), 6)
+        self.assertEqual(len(data.codenames), 6)
+        self.assertEqual(len(data.tokens), 9)
+
+        # Seeding again replaces the data.
+        data = dataset.seed(users=2, groups=1, permissions_per_group=1, tokens=2)
+        self.assertEqual(len(data.usernames), 2)
+
+        dataset.clear()
+        self.assertIsNone(dataset.load())
+
+    def test_clear_only_deletes_seeded_objects(self):
+        from django.contrib.auth.models import Group, User
+
+        user = User.objects.create_user(f'{dataset.PREFIX}real', 'real@example.com', 'test')
+        group = Group.objects.create(name=f'{dataset.PREFIX}real')
+        dataset.seed(users=2, groups=1, permissions_per_group=1, tokens=1)
+
+        dataset.clear()
+        self.assertTrue(User.objects.filter(pk=user.pk).exists())
+        self.assertTrue(Group.objects.filter(pk=group.pk).exists())
+        self.assertFalse(User.objects.filter(username=f'{dataset.PREFIX}user_1').exists())
+
+    def test_only_installed_in_development_or_when_enabled(self):
+        statement = (
+            'import json, django; django.setup(); from django.apps import apps; '
+            'print(json.dumps(apps.is_installed("benchmarks")))'
+        )
+        self.assertFalse(imports.run_python(statement, {'ENVIRONMENT': 'production'}))
+        self.assertTrue(imports.run_python(
+            statement, {'ENVIRONMENT': 'production', 'BENCHMARKS_ENABLED': 'true'}
+        ))
+
+
+class RunnerTestCase(TestCase):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(runner.percentile(values, 50), 50)
+        self.assertEqual(runner.percentile(values, 99), 99)
+        self.assertEqual(runner.percentile([7], 95), 7)
+        self.assertIsNone(runner.percentile([], 50))
+
+    def test_run_in_process(self):
+        data = dataset.seed(users=4, groups=2, permissions_per_group=2, tokens=4)
+        report = runner.run(data, requests=5, warmup=1)
+
+        self.assertEqual(list(report['scenarios']), list(runner.SCENARIOS))
+        for name, result in report['scenarios'].items():
+            self.assertEqual(result['requests'], 5, name)
+            self.assertEqual(result['errors'], 0, name)
+            self.assertGreater(result['queries_per_request'], 0, name)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'], name)
+
+    def test_command(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark', stdout=StringIO())
+
+        call_command('seed_benchmark', users=2, groups=1, tokens=2, stdout=StringIO())
+        out = StringIO()
+        call_command('benchmark', 'validate', requests=3, warmup=0, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(list(report['scenarios']), ['validate'])
+        self.assertEqual(report['target'], 'in-process')
+
+
+class DeploymentsTestCase(TestCase):
+
+    def test_server_commands(self):
+        wsgi = deployments.get_server_command('wsgi', 8001, workers=2, threads=8)
+        self.assertEqual(wsgi[-3:], ['--threads', '8', 'oauth_microservice.wsgi'])
+        self.assertIn('127.0.0.1:8001', wsgi)
+
+        asgi = deployments.get_server_command('asgi', 8001, workers=2, threads=8)
+        self.assertEqual(asgi[-1], 'oauth_microservice.asgi:application')
+        self.assertIn('uvicorn.workers.UvicornWorker', asgi)
+        self.assertNotIn('--threads', asgi)
+
+    def test_servers_that_exit_are_reported(self):
+        process = subprocess.Popen([sys.executable, '-c', 'raise SystemExit(3)'])
+        with self.assertRaisesRegex(RuntimeError, 'exited with status 3'):
+            deployments.wait_for_server(process, deployments.get_free_port(), timeout=10)
+
+    def test_command(self):
+        with self.assertRaises(CommandError):
+            call_command('compare_deployments', 'not-an-endpoint', stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('compare_deployments', stdout=StringIO())
+
+
+class ImportProfileTestCase(TestCase):
+
+    def test_report(self):
+        results = [
+            {'api_only': False, 'seconds': {'setup': 2, 'urlconf': 1, 'total': 3},
+             'modules': {'a': [0.5, 0.5]}},
+            {'api_only': False, 'seconds': {'setup': 1, 'urlconf': 1, 'total': 2},
+             'modules': {'a': [0.1, 0.3], 'b': [0.2, 0.2], 'c': [0.01, 0.01]}},
+        ]
+        report = imports.report(results, top=2)
+
+        self.assertEqual(report['runs'], 2)
+        self.assertEqual(report['seconds']['total'], 2)
+        self.assertEqual(report['modules_imported'], 3)
+        self.assertEqual(
+            [module['module'] for module in report['slowest_modules']], ['b', 'a']
+        )
+        self.assertEqual(report['slowest_modules'][1]['cumulative_ms'], 300)
+
+    def test_boot_skips_the_site_pages(self):
+        result = imports.run()
+        self.assertIn('users.admin', result['modules'])
+        # The site pages are left out of boot...
+        self.assertNotIn('oauth_microservice.admin_urls', result['modules'])
+        self.assertNotIn('registration.views', result['modules'])
+        # ...but reversing any URL loads them.
+        statement = (
+            'import json, sys, django; django.setup(); from django.urls import reverse; '
+            'reverse("database_status"); '
+            'print(json.dumps("oauth_microservice.admin_urls" in sys.modules))'
+        )
+        self.assertTrue(imports.run_python(statement))
+
+        # API-only workers don't load them, or the admin, at all.
+        result = imports.run({'API_ONLY': 'true'})
+        self.assertTrue(result['api_only'])
+        self.assertNotIn('users.admin', result['modules'])
+        self.assertFalse(imports.run_python(statement, {'API_ONLY': 'true'}))
+
+        self.assertFalse(imports.run({'API_ONLY': 'false'})['api_only'])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('profile_imports', top=3, runs=1, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['runs'], 1)
+        self.assertEqual(len(report['slowest_modules']), 3)
+        self.assertGreater(report['seconds']['total'], report['seconds']['urlconf'])
+
+        with self.assertRaises(CommandError):
+            call_command('profile_imports', runs=0, stdout=StringIO())
+
+
+class ConfusablesBenchmarkTestCase(TestCase):
+
+    def test_sample_names(self):
+        self.assertEqual(confusables.sample_names(5, seed=1), confusables.sample_names(5, seed=1))
+        self.assertEqual(len(confusables.sample_names(5)), 5)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('benchmark_confusables', checks=200, stdout=out)
+        results = json.loads(out.getvalue())['backends']
+
+        self.assertEqual([result['backend'] for result in results], list(confusables.BACKENDS))
+        # Both backends agree on which names are dangerous.
+        self.assertEqual(results[0]['dangerous'], results[1]['dangerous'])
+        for result in results:
+            self.assertEqual(result['checks'], 200)
+            self.assertGreater(result['us_per_check'], 0)
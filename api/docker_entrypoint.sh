@@ -3,5 +3,24 @@
 # Set up remaining migrations
 python3 manage.py collectstatic --noinput;
 
-# Boot up the app.
-gunicorn oauth_microservice.wsgi --bind=0.0.0.0:8000 --reload;
+# Compile the Unicode tables of the managed user homoglyph checks into the
+# index that workers share.
+python3 manage.py build_confusables_index;
+
+# Refuse to start if the database is missing something the app relies on,
+# such as the default groups and permissions of managed users.
+python3 manage.py check --tag database || exit 1;
+
+# Workers share their metrics through files in this directory, which must
+# start out empty.
+export prometheus_multiproc_dir=${prometheus_multiproc_dir:-/tmp/prometheus};
+rm -rf "$prometheus_multiproc_dir";
+mkdir -p "$prometheus_multiproc_dir";
+
+# Boot up the app. With ASGI_ENABLED=true it is served by uvicorn workers
+# through oauth_microservice.asgi instead of sync workers.
+if [ "${ASGI_ENABLED:-false}" = "true" ]; then
+    gunicorn oauth_microservice.asgi:application --worker-class uvicorn.workers.UvicornWorker --config gunicorn_config.py --bind=0.0.0.0:8000 --reload;
+else
+    gunicorn oauth_microservice.wsgi --config gunicorn_config.py --bind=0.0.0.0:8000 --reload;
+fi
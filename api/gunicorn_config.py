@@ -0,0 +1,9 @@
+""" Gunicorn settings, loaded with `gunicorn --config gunicorn_config.py`. """
+import os
+
+
+def child_exit(server, worker):
+    # Let the metrics of workers that have exited be merged or dropped.
+    if 'prometheus_multiproc_dir' in os.environ:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1 @@
+default_app_config = 'managed_users.apps.ManagedUsersConfig'
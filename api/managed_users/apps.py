@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class ManagedUsersConfig(AppConfig):
     name = 'managed_users'
+
+    def ready(self):
+        from django.conf import settings
+
+        if settings.ENABLE_REMOTE_USER_MANAGEMENT:
+            from . import checks, signals  # noqa: F401
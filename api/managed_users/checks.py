@@ -0,0 +1,34 @@
+from django.core.checks import Error, Tags, register
+from django.db import DatabaseError
+
+from oauth_microservice.utils.permissions import get_permissions_config
+
+from .defaults import resolve_defaults
+
+
+@register(Tags.database)
+def check_managed_user_defaults(app_configs, **kwargs):
+    """ Every default permission and group of managed users must exist.
+
+    This is a database check, so it only runs with `manage.py check --tag
+    database`, as the entrypoint does before starting the app.
+    """
+    config = get_permissions_config()
+    try:
+        defaults = resolve_defaults(config.managed_user_permissions, config.managed_user_groups)
+    except DatabaseError:
+        # The tables don't exist until the first migration.
+        return []
+
+    errors = []
+    for kind, names in (
+        ('permissions', defaults.missing_permissions),
+        ('groups', defaults.missing_groups),
+    ):
+        if names:
+            errors.append(Error(
+                f'The default managed user {kind} {", ".join(names)} do not exist.',
+                hint='Run "manage.py rebuild_permissions".',
+                id='managed_users.E001',
+            ))
+    return errors
@@ -0,0 +1,98 @@
+import logging
+
+from django.conf import settings
+from django.contrib.auth.models import Permission, Group
+from django.db.models import F
+
+from oauth_microservice.utils.cache import TTLCache
+from oauth_microservice.utils.permissions import get_permissions_config
+from .models import DefaultsVersion
+
+
+logger = logging.getLogger(__name__)
+
+# Resolved defaults are keyed by the names in the permissions file and the
+# `DefaultsVersion`, so an edited file, or permissions and groups changed by
+# any process, are resolved afresh.
+defaults_cache = TTLCache(
+    max_size=8,
+    ttl=settings.REMOTE_USER_MANAGEMENT['DEFAULTS_CACHE_TTL'],
+)
+
+
+class ManagedUserDefaults(object):
+    """ The primary keys of the default permissions and groups of managed
+    users, and the names in the permissions file that don't exist.
+    """
+
+    def __init__(self, permission_ids, group_ids, missing_permissions, missing_groups):
+        self.permission_ids = tuple(permission_ids)
+        self.group_ids = tuple(group_ids)
+        self.missing_permissions = tuple(missing_permissions)
+        self.missing_groups = tuple(missing_groups)
+
+    @property
+    def is_complete(self):
+        return not (self.missing_permissions or self.missing_groups)
+
+
+def resolve_defaults(codenames, group_names):
+    """ Look up the default permissions and groups with one query each.
+
+    Permissions are matched by codename across every content type, as
+    `rebuild_permissions` does.
+    """
+    permissions = Permission.objects.filter(codename__in=codenames).values_list('codename', 'pk')
+    groups = dict(Group.objects.filter(name__in=group_names).values_list('name', 'pk'))
+    found_codenames = {codename for codename, _ in permissions}
+    return ManagedUserDefaults(
+        permission_ids=[pk for _, pk in permissions],
+        group_ids=[groups[name] for name in group_names if name in groups],
+        missing_permissions=[codename for codename in codenames if codename not in found_codenames],
+        missing_groups=[name for name in group_names if name not in groups],
+    )
+
+
+def get_defaults_version():
+    version = DefaultsVersion.objects.values_list('version', flat=True).first()
+    return version or 0
+
+
+def bump_defaults_version(*args, **kwargs):
+    """ Make every process resolve the defaults again. Usable as a signal
+    receiver.
+    """
+    if not DefaultsVersion.objects.filter(pk=1).update(version=F('version') + 1):
+        DefaultsVersion.objects.get_or_create(pk=1, defaults={'version': 1})
+
+
+def get_defaults():
+    """ Returns the `ManagedUserDefaults` for the current permissions file,
+    resolving them on first use and whenever the `DefaultsVersion` changes.
+    Checking the version costs one query.
+
+    Missing defaults are skipped with a warning rather than failing the
+    request, and are looked up again on the next call until they exist.
+    The `managed_users.E001` check reports them at startup.
+    """
+    config = get_permissions_config()
+    names = (config.managed_user_permissions, config.managed_user_groups)
+    key = (*names, get_defaults_version())
+    defaults = defaults_cache.get(key)
+    if defaults is None:
+        defaults = resolve_defaults(*names)
+        if defaults.is_complete:
+            defaults_cache.set(key, defaults)
+        else:
+            logger.warning(
+                'Missing managed user defaults, run rebuild_permissions. '
+                'Permissions: %s. Groups: %s.',
+                ', '.join(defaults.missing_permissions) or '-',
+                ', '.join(defaults.missing_groups) or '-',
+            )
+    return defaults
+
+
+def clear_defaults(*args, **kwargs):
+    """ Forget the resolved defaults. Usable as a signal receiver. """
+    defaults_cache.clear()
@@ -0,0 +1,55 @@
+import time
+
+from django.conf import settings
+from django.core.management import base
+from django.utils import timezone
+
+from managed_users.outbox import send_queued_emails
+
+
+class Command(base.BaseCommand):
+    help = (
+        'Send the emails waiting in the outbox in batches, reusing one mail '
+        'connection per batch.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-b',
+            '--batch-size',
+            help='The most emails to send over one connection.',
+            type=int,
+            default=settings.EMAIL_OUTBOX['BATCH_SIZE']
+        )
+        parser.add_argument(
+            '-l',
+            '--loop',
+            help='Keep running and poll for new emails instead of exiting once drained.',
+            action='store_true',
+            default=False
+        )
+
+    def log(self, message):
+        """ Write log messages to stdout in a consistent format. """
+        self.stdout.write(f'[{timezone.now()}] {message}')
+
+    def drain(self, batch_size):
+        """ Send batches until no due emails are left. """
+        while True:
+            try:
+                sent, failed = send_queued_emails(batch_size)
+            except Exception as e:
+                # The mail relay is unreachable. The leased emails become due
+                # again once their lease expires.
+                self.log(f'Unable to send emails: {e}')
+                return
+            if sent or failed:
+                self.log(f'Sent {sent} emails, {failed} failed.')
+            if sent + failed < batch_size:
+                return
+
+    def handle(self, verbosity, batch_size, loop, *args, **kwargs):
+        self.drain(batch_size)
+        while loop:
+            time.sleep(settings.EMAIL_OUTBOX['POLL_INTERVAL'])
+            self.drain(batch_size)
@@ -1,6 +1,7 @@
 from django.conf import settings
 from django.core.exceptions import PermissionDenied
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
 from django.contrib.auth.tokens import default_token_generator
 from django.contrib.sites.shortcuts import get_current_site
 from django.template import loader
@@ -8,9 +9,14 @@ from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
 
 from rest_framework import status
+from rest_framework.decorators import list_route
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.mixins import CreateModelMixin
 
+from audit.log import audit_log, get_remote_addr
+from .outbox import queue_email, queue_emails
+
 
 managed_user_settings = settings.REMOTE_USER_MANAGEMENT
 
@@ -31,6 +37,7 @@ class CreateRemoteUserMixin(CreateModelMixin):
     token_generator = default_token_generator
     from_email = settings.DEFAULT_FROM_EMAIL
     use_https = settings.USE_SSL
+    use_outbox = settings.EMAIL_OUTBOX['ENABLED']
 
     PERMISSION_DENIED_MESSAGE = 'You do not have permission to create managed users.'
 
@@ -46,16 +53,26 @@ class CreateRemoteUserMixin(CreateModelMixin):
             'protocol': 'https' if self.use_https else 'http',
         }
 
-    def send_mail(self, subject_template_name, email_template_name,
-                  context, from_email, to_email, html_email_template_name=None):
+    def render_mail(self, subject_template_name, email_template_name, context):
         subject = loader.render_to_string(subject_template_name, context)
         # Email subject *must not* contain newlines
         subject = ''.join(subject.splitlines())
         body = loader.render_to_string(email_template_name, context)
+        return subject, body
 
+    def send_mail(self, subject_template_name, email_template_name,
+                  context, from_email, to_email, html_email_template_name=None):
+        subject, body = self.render_mail(subject_template_name, email_template_name, context)
         email_message = EmailMultiAlternatives(subject, body, from_email, [to_email])
         email_message.send()
 
+    def queue_mail(self, subject_template_name, email_template_name,
+                   context, from_email, to_email, html_email_template_name=None):
+        # Sent later by the send_queued_email worker, once the surrounding
+        # transaction has committed.
+        subject, body = self.render_mail(subject_template_name, email_template_name, context)
+        queue_email(subject, body, from_email, to_email)
+
     def create(self, request, *args, **kwargs):
         """ Create the user given in the request.
 
@@ -71,20 +88,32 @@ class CreateRemoteUserMixin(CreateModelMixin):
         if not request.user.has_perm(self.managing_user_permission):
             raise PermissionDenied(self.PERMISSION_DENIED_MESSAGE)
 
-        # Create the new managed user
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        user = self.perform_create(serializer)
-
-        # Send new user a password reset email
-        context = self.get_password_reset_email_context(user, request)
-        self.send_mail(
-            self.subject_template_name,
-            self.email_template_name,
-            context,
-            self.from_email,
-            user.email,
-        )
+
+        # The user and their queued welcome email are saved together, so
+        # neither exists without the other. Without the outbox the email is
+        # sent once the user is committed, so a slow mail server never holds
+        # the transaction open.
+        with transaction.atomic():
+            # Create the new managed user
+            user = self.perform_create(serializer)
+
+            # Send new user a password reset email
+            context = self.get_password_reset_email_context(user, request)
+            args = (
+                self.subject_template_name,
+                self.email_template_name,
+                context,
+                self.from_email,
+                user.email,
+            )
+            if self.use_outbox:
+                self.queue_mail(*args)
+            else:
+                transaction.on_commit(lambda: self.send_mail(*args))
+
+        self.record_created([user], request)
 
         # Let the requesting user know that a new user was successfully created
         headers = self.get_success_headers(serializer.data)
@@ -92,3 +121,104 @@ class CreateRemoteUserMixin(CreateModelMixin):
 
     def perform_create(self, serializer):
         return serializer.save()
+
+    def record_created(self, users, request):
+        for user in users:
+            audit_log.record(
+                'managed_user.created',
+                user_id=request.user.pk,
+                remote_addr=get_remote_addr(request),
+                created_user_id=user.pk,
+                username=user.username,
+            )
+
+
+class BulkCreateRemoteUserMixin(CreateRemoteUserMixin):
+    """ Allow many remote users to be created with one request.
+
+    The payload is a list of users. Every item is validated, usernames and
+    emails are checked for conflicts with one query, and the valid users are
+    created together. The response has a result for each item, in order.
+    """
+    bulk_serializer_class = None
+    max_bulk_create = managed_user_settings['MAX_BULK_CREATE']
+
+    def get_bulk_serializer(self, *args, **kwargs):
+        kwargs['context'] = self.get_serializer_context()
+        return self.bulk_serializer_class(*args, **kwargs)
+
+    def send_mails(self, emails):
+        """ Send `(subject, body, from_email, to_email)` emails over one
+        mail connection.
+        """
+        connection = get_connection()
+        connection.send_messages([
+            EmailMultiAlternatives(subject, body, from_email, [to_email], connection=connection)
+            for subject, body, from_email, to_email in emails
+        ])
+
+    def queue_mails(self, emails):
+        queue_emails(emails)
+
+    @list_route(methods=['post'], url_path='bulk')
+    def bulk_create(self, request, *args, **kwargs):
+        """ Create the users given in the request.
+
+        Items that fail validation or conflict with an existing user (or an
+        earlier item) are reported with their errors and the rest are
+        created. Each created user is sent the same welcome email as
+        `create`.
+        """
+        if not request.user.has_perm(self.managing_user_permission):
+            raise PermissionDenied(self.PERMISSION_DENIED_MESSAGE)
+
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError({'non_field_errors': ['Expected a list of users.']})
+        if len(items) > self.max_bulk_create:
+            raise ValidationError({'non_field_errors': [
+                f'At most {self.max_bulk_create} users can be created at once.'
+            ]})
+
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            serializer = self.get_bulk_serializer(data=item)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results[index] = {
+                    'status': status.HTTP_400_BAD_REQUEST,
+                    'errors': serializer.errors,
+                }
+
+        serializer = self.get_bulk_serializer()
+        conflicts = serializer.get_conflicts([data for _, data in valid])
+        for position, errors in conflicts.items():
+            results[valid[position][0]] = {'status': status.HTTP_409_CONFLICT, 'errors': errors}
+        valid = [item for position, item in enumerate(valid) if position not in conflicts]
+
+        with transaction.atomic():
+            users = serializer.bulk_create([data for _, data in valid])
+
+            emails = []
+            for user in users:
+                if not user.email:
+                    continue
+                context = self.get_password_reset_email_context(user, request)
+                subject, body = self.render_mail(
+                    self.subject_template_name, self.email_template_name, context
+                )
+                emails.append((subject, body, self.from_email, user.email))
+            if emails and self.use_outbox:
+                self.queue_mails(emails)
+            elif emails:
+                transaction.on_commit(lambda: self.send_mails(emails))
+
+        self.record_created(users, request)
+        for (index, _), user in zip(valid, users):
+            results[index] = {
+                'status': status.HTTP_201_CREATED,
+                'user': self.get_serializer(user).data,
+            }
+        return Response({'results': results}, status=status.HTTP_200_OK)
@@ -1 +1,48 @@
-# no:qa
+from django.db import models
+from django.utils import timezone
+
+
+class OutgoingEmail(models.Model):
+    """ An email waiting in the outbox to be sent by the `send_queued_email`
+    worker command.
+
+    Queuing an email is a single insert, so it can be done in the same
+    transaction as the change it announces. The email is only sent once that
+    transaction commits, and a slow mail relay never holds up a request.
+
+    Notes
+    -----
+
+    - `send_after` is when the email is next due. Failed attempts push it back
+    with an exponential backoff, and workers push it forward while they are
+    sending it so that no two workers send the same email.
+    - `sent_at` is set once the email has been handed to the mail relay.
+    """
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    to_email = models.CharField(max_length=254)
+
+    created_at = models.DateTimeField(default=timezone.now)
+    send_after = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        index_together = [('sent_at', 'send_after')]
+
+    def __str__(self):
+        return f'{self.subject} <{self.to_email}>'
+
+
+class DefaultsVersion(models.Model):
+    """ A single row counting the changes to permissions and groups.
+
+    Each process caches the primary keys of the managed user defaults (see
+    `managed_users.defaults`) under the version it resolved them at. Any
+    process that changes a permission or group bumps the version, so every
+    other process resolves the defaults again on its next use instead of
+    inserting keys that may no longer exist.
+    """
+    version = models.PositiveIntegerField(default=0)
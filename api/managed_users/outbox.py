@@ -0,0 +1,99 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutgoingEmail
+
+
+outbox_settings = settings.EMAIL_OUTBOX
+
+
+def queue_email(subject, body, from_email, to_email):
+    """ Add an email to the outbox. Call this inside the transaction that
+    makes the change the email is about.
+    """
+    return OutgoingEmail.objects.create(
+        subject=subject,
+        body=body,
+        from_email=from_email,
+        to_email=to_email,
+    )
+
+
+def queue_emails(emails):
+    """ Add many `(subject, body, from_email, to_email)` emails to the outbox
+    with one insert.
+    """
+    return OutgoingEmail.objects.bulk_create([
+        OutgoingEmail(subject=subject, body=body, from_email=from_email, to_email=to_email)
+        for subject, body, from_email, to_email in emails
+    ])
+
+
+def get_retry_delay(attempts):
+    """ Exponential backoff, capped at `EMAIL_OUTBOX['MAX_RETRY_DELAY']`. """
+    delay = outbox_settings['RETRY_DELAY'] * 2 ** max(attempts - 1, 0)
+    return timedelta(seconds=min(delay, outbox_settings['MAX_RETRY_DELAY']))
+
+
+@transaction.atomic
+def claim_emails(batch_size):
+    """ Lease a batch of due emails to this worker.
+
+    The rows are locked only long enough to push `send_after` past the
+    lease, so other workers skip them without waiting while they're sent.
+    """
+    now = timezone.now()
+    emails = list(
+        OutgoingEmail.objects
+        .select_for_update(skip_locked=True)
+        .filter(
+            sent_at__isnull=True,
+            send_after__lte=now,
+            attempts__lt=outbox_settings['MAX_ATTEMPTS'],
+        )
+        .order_by('send_after')[:batch_size]
+    )
+    OutgoingEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+        send_after=now + timedelta(seconds=outbox_settings['LEASE'])
+    )
+    return emails
+
+
+def send_queued_emails(batch_size=None, connection=None):
+    """ Send one batch of due emails over a single mail connection.
+
+    Returns a `(sent, failed)` tuple. Failed emails are retried later with an
+    exponential backoff until they reach `EMAIL_OUTBOX['MAX_ATTEMPTS']`.
+    """
+    emails = claim_emails(batch_size or outbox_settings['BATCH_SIZE'])
+    if not emails:
+        return 0, 0
+
+    sent = failed = 0
+    connection = connection or get_connection()
+    with connection:
+        for email in emails:
+            message = EmailMultiAlternatives(
+                email.subject,
+                email.body,
+                email.from_email,
+                [email.to_email],
+                connection=connection,
+            )
+            email.attempts += 1
+            try:
+                message.send()
+            except Exception as e:
+                failed += 1
+                email.last_error = f'{e.__class__.__name__}: {e}'
+                email.send_after = timezone.now() + get_retry_delay(email.attempts)
+            else:
+                sent += 1
+                email.last_error = ''
+                email.sent_at = timezone.now()
+            email.save(update_fields=('attempts', 'last_error', 'send_after', 'sent_at'))
+    return sent, failed
@@ -1,37 +1,113 @@
-from django.conf import settings
-from django.contrib.auth.models import Permission, Group
 from django.contrib.auth import get_user_model
+from django.db.models import Q
 from rest_framework import serializers
 
+from users.permissions import rebuild_effective_permissions
+
+from .defaults import get_defaults
+from .validators import validate_confusables, validate_confusables_email
 
-UserModel = get_user_model()
 
+UserModel = get_user_model()
 
-managed_user_settings = settings.REMOTE_USER_MANAGEMENT
+UserPermission = UserModel.user_permissions.through
+UserGroup = UserModel.groups.through
 
 
 class ManagedUserSerializer(serializers.ModelSerializer):
-    managed_user_default_groups = managed_user_settings['MANAGED_USERS']['DEFAULT_GROUPS']
-    managed_user_default_permissions = managed_user_settings['MANAGED_USERS']['DEFAULT_PERMISSIONS']
 
     class Meta:
         model = UserModel
         fields = ('username', 'email', 'first_name', 'last_name')
 
-    def get_default_permissions(self):
-        return [
-            Permission.objects.get(codename=codename)
-            for codename in self.managed_user_default_permissions
-        ]
+    def validate_username(self, value):
+        validate_confusables(value)
+        return value
 
-    def get_default_groups(self):
-        return [
-            Group.objects.get(name=name)
-            for name in self.managed_user_default_groups
-        ]
+    def validate_email(self, value):
+        if value:
+            validate_confusables_email(value)
+        return value
 
     def create(self, validated_data):
         user = UserModel.objects.create(**validated_data)
-        user.user_permissions.set(self.get_default_permissions())
-        user.groups.set(self.get_default_groups())
+        self.assign_defaults([user])
         return user
+
+    def assign_defaults(self, users):
+        """ Give the users the default permissions and groups with one
+        insert for each relation.
+        """
+        defaults = get_defaults()
+        UserPermission.objects.bulk_create([
+            UserPermission(user_id=user.pk, permission_id=permission_id)
+            for user in users
+            for permission_id in defaults.permission_ids
+        ])
+        UserGroup.objects.bulk_create([
+            UserGroup(user_id=user.pk, group_id=group_id)
+            for user in users
+            for group_id in defaults.group_ids
+        ])
+        # Bulk writes to the through tables don't send m2m_changed.
+        rebuild_effective_permissions([user.pk for user in users])
+
+    def get_conflicts(self, items):
+        """ Returns the errors of the validated items whose username or email
+        is already taken, by an existing user or an earlier item, keyed by
+        the item's position. Existing users are found with one query.
+        """
+        usernames = [item['username'] for item in items]
+        emails = [item['email'] for item in items if item.get('email')]
+        taken_usernames, taken_emails = set(), set()
+        for username, email in UserModel.objects.filter(
+            Q(username__in=usernames) | Q(email__in=emails)
+        ).values_list('username', 'email'):
+            taken_usernames.add(username)
+            taken_emails.add(email)
+
+        conflicts = {}
+        for index, item in enumerate(items):
+            errors = {}
+            if item['username'] in taken_usernames:
+                errors['username'] = ['A user with that username already exists.']
+            if item.get('email') and item['email'] in taken_emails:
+                errors['email'] = ['A user with that email already exists.']
+            if errors:
+                conflicts[index] = errors
+            taken_usernames.add(item['username'])
+            if item.get('email'):
+                taken_emails.add(item['email'])
+        return conflicts
+
+    def bulk_create(self, items):
+        """ Create many users with the default permissions and groups using
+        a fixed number of queries. Expects validated items without conflicts.
+        """
+        if not items:
+            return []
+        UserModel.objects.bulk_create([UserModel(**item) for item in items])
+
+        # Not every database backend sets primary keys on bulk inserts.
+        users = {
+            user.username: user
+            for user in UserModel.objects.filter(username__in=[item['username'] for item in items])
+        }
+        users = [users[item['username']] for item in items]
+
+        self.assign_defaults(users)
+        return users
+
+
+class BulkManagedUserSerializer(ManagedUserSerializer):
+    """ Validates one item of a bulk create. Usernames are checked for
+    conflicts across the whole request at once rather than per item.
+    """
+
+    class Meta(ManagedUserSerializer.Meta):
+        # A validator of its own: DRF deep-copies extra_kwargs, and the
+        # model's validator can't be copied once its regex has been compiled
+        # (e.g. by a single create).
+        extra_kwargs = {
+            'username': {'validators': [type(UserModel.username_validator)()]},
+        }
@@ -0,0 +1,27 @@
+from django.contrib.auth.models import Permission, Group
+from django.db.models.signals import post_delete, post_save
+
+from oauth_microservice.utils.permissions import permissions_config_changed
+from users.signals import permissions_rebuilt
+
+from .defaults import bump_defaults_version, clear_defaults
+
+
+# The permissions file is read by each process, so a change only needs to
+# clear this process's cache.
+permissions_config_changed.connect(clear_defaults, dispatch_uid='managed_users.clear_defaults')
+
+# Changes to permissions and groups can be made by any process, so they bump
+# the version that every process checks. Bulk changes made by
+# rebuild_permissions are announced with one signal, and changes made
+# elsewhere (e.g. in the admin) are caught individually.
+permissions_rebuilt.connect(
+    bump_defaults_version, dispatch_uid='managed_users.bump_defaults_version'
+)
+for model in (Permission, Group):
+    for signal in (post_save, post_delete):
+        signal.connect(
+            bump_defaults_version,
+            sender=model,
+            dispatch_uid=f'managed_users.bump_defaults_version.{model.__name__}',
+        )
@@ -1,6 +1,21 @@
+import json
+from io import StringIO
 from unittest import mock
 
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.utils import timezone
+
+
+def run_on_commit_callbacks():
+    """ Run the callbacks that would run once the test's transaction
+    commits, which it never does.
+    """
+    callbacks, connection.run_on_commit = connection.run_on_commit, []
+    for _, callback in callbacks:
+        callback()
 
 
 class CreateRemoteUserMixinTestCase(TestCase):
@@ -36,6 +51,8 @@ class CreateRemoteUserMixinTestCase(TestCase):
         )
 
         class CreateRemoteUserMixinView(CreateRemoteUserMixin):
+            use_outbox = False
+
             def get_serializer(self, data=None):
                 return mock.Mock(data=mock_user)
 
@@ -50,11 +67,331 @@ class CreateRemoteUserMixinTestCase(TestCase):
         mixin = CreateRemoteUserMixinView()
         response = mixin.create(request)
 
+        # The email is only sent once the user has been committed.
+        self.assertEqual(send.call_count, 0)
+        run_on_commit_callbacks()
         self.assertEqual(send.call_count, 1)
         self.assertEqual(response.status_code, 201)
         self.assertEqual(response.data.username, 'TestUser')
         self.assertEqual(response.data.email, 'test@local')
 
+    @mock.patch('django.core.mail.EmailMultiAlternatives.send')
+    @mock.patch('managed_users.mixins.CreateRemoteUserMixin.perform_create')
+    @mock.patch('managed_users.mixins.CreateRemoteUserMixin.token_generator.make_token')
+    def test_valid_create_queues_email(self, make_token, perform_create, send):
+        from managed_users.mixins import CreateRemoteUserMixin
+        from managed_users.models import OutgoingEmail
+
+        mock_user = mock.Mock(username='TestUser', email='test@local', pk=1)
+
+        class CreateRemoteUserMixinView(CreateRemoteUserMixin):
+            use_outbox = True
+
+            def get_serializer(self, data=None):
+                return mock.Mock(data=mock_user)
+
+        make_token.return_value = 'test-token'
+        perform_create.return_value = mock_user
+        request = mock.Mock(user=mock.Mock(has_perm=mock.Mock(return_value=True)))
+
+        response = CreateRemoteUserMixinView().create(request)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(send.call_count, 0)
+        self.assertEqual(OutgoingEmail.objects.get().to_email, 'test@local')
+
+
+class OutboxTestCase(TestCase):
+
+    def setUp(self):
+        from managed_users.outbox import queue_email
+
+        for i in range(3):
+            queue_email(f'Subject {i}', 'Body', 'from@local', f'to{i}@local')
+
+    def test_send_queued_emails_over_one_connection(self):
+        from managed_users.models import OutgoingEmail
+        from managed_users.outbox import send_queued_emails
+
+        connection = mail.get_connection()
+        with mock.patch.object(connection, 'open') as open_connection:
+            self.assertEqual(send_queued_emails(connection=connection), (3, 0))
+
+        self.assertEqual(open_connection.call_count, 1)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(OutgoingEmail.objects.filter(sent_at__isnull=True).exists())
+        self.assertEqual(send_queued_emails(), (0, 0))
+
+    def test_failed_emails_are_retried_later(self):
+        from managed_users.models import OutgoingEmail
+        from managed_users.outbox import send_queued_emails
+
+        send = mock.patch(
+            'django.core.mail.EmailMultiAlternatives.send', side_effect=OSError('down')
+        )
+        with send:
+            self.assertEqual(send_queued_emails(batch_size=2), (0, 2))
+
+        failed = OutgoingEmail.objects.filter(attempts=1)
+        self.assertEqual(failed.count(), 2)
+        self.assertTrue(all(email.send_after > timezone.now() for email in failed))
+        self.assertEqual(failed.first().last_error, 'OSError: down')
+
+        # Only the email that hasn't failed yet is due.
+        self.assertEqual(send_queued_emails(), (1, 0))
+
+    def test_command(self):
+        call_command('send_queued_email', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 3)
+
+
+class BulkCreateManagedUsersTestCase(TestCase):
+
+    def setUp(self):
+        from django.contrib.auth.models import Group, Permission, User
+        from django.contrib.contenttypes.models import ContentType
+        from managed_users.defaults import clear_defaults
+        from users.models import PermissionSupport
+
+        clear_defaults()
+        content_type = ContentType.objects.get_for_model(PermissionSupport)
+        self.permission = Permission.objects.create(
+            codename='test_read', name='test_read', content_type=content_type
+        )
+        group = Group.objects.create(name='read_only')
+        group.permissions.add(self.permission)
+
+        User.objects.create_user('existing', 'existing@example.com', 'test')
+        User.objects.create_superuser('manager', 'manager@example.com', 'test')
+        self.client.login(username='manager', password='test')
+
+    def bulk_create(self, users):
+        return self.client.post(
+            '/managed_users/bulk/', json.dumps(users), content_type='application/json'
+        )
+
+    def test_bulk_create(self):
+        from django.contrib.auth.models import User
+        from managed_users.models import OutgoingEmail
+        from managed_users.views import ManagedUserViewSet
+        from users.permissions import get_user_permission_codenames
+
+        with mock.patch.object(ManagedUserViewSet, 'use_outbox', True):
+            r = self.bulk_create([
+                {'username': 'new1', 'email': 'new1@example.com'},
+                {'username': 'existing', 'email': 'other@example.com'},
+                {'username': 'new2', 'email': 'existing@example.com'},
+                {'username': 'new1', 'email': 'again@example.com'},
+                {'username': 'bad name!', 'email': 'bad@example.com'},
+                {'username': 'new3', 'email': 'new3@example.com', 'first_name': 'New'},
+            ])
+
+        self.assertEqual(r.status_code, 200)
+        results = r.json()['results']
+        self.assertEqual([result['status'] for result in results], [201, 409, 409, 409, 400, 201])
+        self.assertEqual(results[0]['user']['username'], 'new1')
+        self.assertEqual(results[5]['user']['first_name'], 'New')
+        self.assertIn('username', results[1]['errors'])
+        self.assertIn('email', results[2]['errors'])
+        self.assertIn('username', results[3]['errors'])
+        self.assertIn('username', results[4]['errors'])
+
+        user = User.objects.get(username='new3')
+        self.assertFalse(user.has_usable_password())
+        self.assertEqual(list(user.groups.values_list('name', flat=True)), ['read_only'])
+        self.assertEqual(list(get_user_permission_codenames(user)), ['test_read'])
+        self.assertEqual(
+            sorted(OutgoingEmail.objects.values_list('to_email', flat=True)),
+            ['new1@example.com', 'new3@example.com'],
+        )
+
+    def test_queries_do_not_grow_with_the_payload(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        def count_queries(users):
+            with CaptureQueriesContext(connection) as queries:
+                r = self.bulk_create(users)
+            self.assertEqual(r.status_code, 200)
+            return len(queries)
+
+        # The first request resolves and caches the default groups.
+        count_queries([{'username': 'warm', 'email': 'warm@example.com'}])
+        few = count_queries([
+            {'username': f'a{i}', 'email': f'a{i}@example.com'} for i in range(2)
+        ])
+        many = count_queries([
+            {'username': f'b{i}', 'email': f'b{i}@example.com'} for i in range(20)
+        ])
+        self.assertEqual(few, many)
+
+    def test_emails_are_sent_over_one_connection_without_the_outbox(self):
+        from managed_users.views import ManagedUserViewSet
+
+        with mock.patch.object(ManagedUserViewSet, 'use_outbox', False):
+            r = self.bulk_create([
+                {'username': f'new{i}', 'email': f'new{i}@example.com'} for i in range(3)
+            ])
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+        run_on_commit_callbacks()
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_created_users_are_audited(self):
+        from django.contrib.auth.models import User
+        from audit.log import audit_log
+
+        written = []
+        backend = mock.Mock(write=written.extend)
+        with mock.patch.object(audit_log, 'backend', backend):
+            r = self.bulk_create([
+                {'username': 'new1', 'email': 'new1@example.com'},
+                {'username': 'existing', 'email': 'other@example.com'},
+            ])
+            audit_log.flush()
+
+        self.assertEqual(r.status_code, 200)
+        event, = written
+        self.assertEqual(event['event'], 'managed_user.created')
+        self.assertEqual(event['user_id'], User.objects.get(username='manager').pk)
+        self.assertEqual(event['details'], {
+            'created_user_id': User.objects.get(username='new1').pk, 'username': 'new1',
+        })
+
+    def test_bulk_create_after_a_single_create(self):
+        r = self.client.post('/managed_users/', {'username': 'bad name!', 'email': 'a@example.com'})
+        self.assertEqual(r.status_code, 400)
+
+        r = self.bulk_create([{'username': 'new1', 'email': 'new1@example.com'}])
+        self.assertEqual(r.status_code, 200)
+
+    def test_confusable_names_are_rejected(self):
+        from django.contrib.auth.models import User
+
+        r = self.bulk_create([
+            {'username': 'ΑlaskaJazz', 'email': 'alaska@example.com'},
+            {'username': 'alaska', 'email': 'alaska@exαmple.com'},
+            {'username': 'AlaskaJazz', 'email': 'jazz@example.com'},
+        ])
+        self.assertEqual(r.status_code, 200)
+        results = r.json()['results']
+        self.assertEqual([result['status'] for result in results], [400, 400, 201])
+        self.assertIn('username', results[0]['errors'])
+        self.assertIn('email', results[1]['errors'])
+
+        r = self.client.post('/managed_users/', {'username': 'ΡayPal', 'email': 'pay@example.com'})
+        self.assertEqual(r.status_code, 400)
+        self.assertIn('username', r.json())
+        self.assertFalse(User.objects.filter(email='pay@example.com').exists())
+
+    def test_payload_must_be_a_list(self):
+        r = self.bulk_create({'username': 'new1'})
+        self.assertEqual(r.status_code, 400)
+
+    def test_requires_permission(self):
+        from django.contrib.auth.models import User
+
+        User.objects.create_user('unprivileged', 'unprivileged@example.com', 'test')
+        self.client.login(username='unprivileged', password='test')
+        r = self.bulk_create([{'username': 'new1', 'email': 'new1@example.com'}])
+        self.assertEqual(r.status_code, 403)
+        self.assertFalse(User.objects.filter(username='new1').exists())
+
+
+class ConfusablesValidatorsTestCase(TestCase):
+
+    def test_validators(self):
+        from django.core.exceptions import ValidationError
+        from managed_users.validators import validate_confusables, validate_confusables_email
+
+        validate_confusables('AlaskaJazz')
+        validate_confusables_email('alaska@example.com')
+        with self.assertRaises(ValidationError):
+            validate_confusables('ΑlaskaJazz')
+        with self.assertRaises(ValidationError):
+            validate_confusables_email('alaska@exαmple.com')
+
+    def test_json_tables_are_not_loaded(self):
+        import sys
+        from managed_users.validators import validate_confusables
+
+        loaded = [name for name in sys.modules if name.startswith('confusable_homoglyphs')]
+        with mock.patch.dict(sys.modules):
+            for name in loaded:
+                del sys.modules[name]
+            validate_confusables('AlaskaJazz')
+            self.assertFalse('confusable_homoglyphs.confusables' in sys.modules)
+
+
+class ManagedUserDefaultsTestCase(TestCase):
+
+    def setUp(self):
+        from django.contrib.auth.models import Group
+        from managed_users.defaults import clear_defaults
+
+        clear_defaults()
+        self.addCleanup(clear_defaults)
+        self.group = Group.objects.create(name='read_only')
+
+    def test_defaults_are_resolved_once(self):
+        from managed_users.defaults import get_defaults
+
+        with self.assertNumQueries(2):
+            defaults = get_defaults()
+        self.assertEqual(defaults.group_ids, (self.group.pk,))
+
+        # Only the version is checked.
+        with self.assertNumQueries(1):
+            self.assertIs(get_defaults(), defaults)
+
+    def test_defaults_are_resolved_again_when_permissions_are_rebuilt(self):
+        from managed_users.defaults import get_defaults
+
+        defaults = get_defaults()
+        call_command('rebuild_permissions', stdout=StringIO())
+        self.assertIsNot(get_defaults(), defaults)
+
+    def test_changes_made_by_other_processes_are_picked_up(self):
+        from django.contrib.auth.models import Group
+        from managed_users.defaults import defaults_cache, get_defaults
+
+        self.assertEqual(get_defaults().group_ids, (self.group.pk,))
+
+        # Deleting and recreating the group doesn't touch this process's
+        # cache, only the version in the database, as if another process
+        # had made the change.
+        with mock.patch.object(defaults_cache, 'clear') as clear:
+            self.group.delete()
+            group = Group.objects.create(name='read_only')
+        self.assertFalse(clear.called)
+
+        self.assertEqual(get_defaults().group_ids, (group.pk,))
+
+    def test_missing_defaults_are_skipped_and_not_cached(self):
+        from django.contrib.auth.models import User
+        from managed_users.defaults import get_defaults
+        from managed_users.serializers import ManagedUserSerializer
+
+        self.group.delete()
+        with self.assertLogs('managed_users.defaults', 'WARNING'):
+            user = ManagedUserSerializer().create({'username': 'new', 'email': 'new@local'})
+        self.assertFalse(user.groups.exists())
+
+        with self.assertLogs('managed_users.defaults', 'WARNING'):
+            self.assertEqual(get_defaults().missing_groups, ('read_only',))
+        self.assertTrue(User.objects.filter(username='new').exists())
+
+    def test_check_reports_missing_defaults(self):
+        from managed_users.checks import check_managed_user_defaults
+
+        self.assertEqual(check_managed_user_defaults(None), [])
+
+        self.group.delete()
+        errors = check_managed_user_defaults(None)
+        self.assertEqual([error.id for error in errors], ['managed_users.E001'])
+        self.assertIn('read_only', errors[0].msg)
+
 
 class ManagedUsersAppTestCase(TestCase):
 
@@ -0,0 +1,35 @@
+""" Homoglyph checks of the names given to managed users.
+
+They use the shared index in `oauth_microservice.utils.confusables`, rather
+than `confusable_homoglyphs`, which reads both of its Unicode tables into
+dicts in every process.
+"""
+from django.core.exceptions import ValidationError
+from django.utils.translation import ugettext_lazy as _
+
+from oauth_microservice.utils import confusables
+
+
+CONFUSABLE = _('This name cannot be registered. Please choose a different name.')
+CONFUSABLE_EMAIL = _(
+    'This email address cannot be registered. Please supply a different email address.'
+)
+
+
+def validate_confusables(value):
+    """ Reject mixed-script names with characters that look like others,
+    which are likely homograph attacks.
+    """
+    if isinstance(value, str) and confusables.is_dangerous(value):
+        raise ValidationError(CONFUSABLE, code='invalid')
+
+
+def validate_confusables_email(value):
+    """ Reject email addresses whose local part or domain would be rejected
+    by `validate_confusables`.
+    """
+    if '@' not in value:
+        return
+    local_part, _, domain = value.rpartition('@')
+    if confusables.is_dangerous(local_part) or confusables.is_dangerous(domain):
+        raise ValidationError(CONFUSABLE_EMAIL, code='invalid')
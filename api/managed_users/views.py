@@ -1,11 +1,11 @@
 from rest_framework import viewsets
 
 from . import serializers
-from .mixins import CreateRemoteUserMixin
+from .mixins import BulkCreateRemoteUserMixin
 
 
 class ManagedUserViewSet(
-    CreateRemoteUserMixin,
+    BulkCreateRemoteUserMixin,
     viewsets.GenericViewSet
 ):
     """ A Viewset that allows a managing user to perform administrative actions
@@ -15,5 +15,10 @@ class ManagedUserViewSet(
     Create a new managed user with default managed user permissions and groups.
     Once the user is created, they're sent a welcome email asking them to reset
     their password.
+
+    bulk_create:
+    Create many managed users from a list, as `create` does for one. The
+    response has a result with a status and the user or errors for each item.
     """
     serializer_class = serializers.ManagedUserSerializer
+    bulk_serializer_class = serializers.BulkManagedUserSerializer
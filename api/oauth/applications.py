@@ -0,0 +1,35 @@
+import copy
+
+from django.conf import settings
+from oauth2_provider.models import get_application_model
+
+from oauth_microservice.utils.cache import TTLCache
+
+
+Application = get_application_model()
+
+application_cache = TTLCache(
+    max_size=settings.OAUTH_APPLICATION_CACHE['MAX_SIZE'],
+    ttl=settings.OAUTH_APPLICATION_CACHE['TTL'],
+)
+
+
+def get_application(client_id):
+    """ Returns the `Application` with the given client id, or None.
+
+    Applications are remembered per process for at most
+    `OAUTH_APPLICATION_CACHE['TTL']` seconds, and evicted by the signal
+    handlers in `oauth.signals` when they are saved or deleted. Each caller
+    gets its own copy.
+    """
+    if not client_id:
+        return None
+
+    application = application_cache.get(client_id)
+    if application is None:
+        try:
+            application = Application.objects.get(client_id=client_id)
+        except Application.DoesNotExist:
+            return None
+        application_cache.set(client_id, application)
+    return copy.copy(application)
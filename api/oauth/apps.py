@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class OauthConfig(AppConfig):
     name = 'oauth'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,177 @@
+import copy
+import hashlib
+import time
+
+from django.conf import settings
+from django.db.models import F
+from oauthlib.common import Request
+from oauth2_provider.contrib.rest_framework import OAuth2Authentication
+from oauth2_provider.settings import oauth2_settings
+
+from audit.log import audit_log, get_remote_addr
+from oauth_microservice.metrics import AUTHENTICATIONS
+from oauth_microservice.utils.cache import TTLCache
+from .models import RevocationVersion
+from .tokens import get_token_lookup_value
+
+
+# Entries are `(access_token, revocation version)`, and only trusted while
+# the version is the one this process last read (see `check_revocations()`).
+token_cache = TTLCache(
+    max_size=settings.OAUTH_TOKEN_CACHE['MAX_SIZE'],
+    ttl=settings.OAUTH_TOKEN_CACHE['TTL'],
+)
+_revocations = {'version': None, 'checked_at': None}
+
+# Django's ModelBackend memoizes permissions on the user instance. Cached users
+# must never carry these between requests, or permission changes would be
+# hidden until the entry expires.
+USER_PERMISSION_CACHE_ATTRS = ('_perm_cache', '_user_perm_cache', '_group_perm_cache')
+
+
+def token_cache_key(token):
+    """ Cache entries are keyed by a hash of the stored token value so the
+    raw bearer credentials are never kept around as dictionary keys.
+    """
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def get_bearer_token(request):
+    """ Returns the bearer token from the request's Authorization header,
+    or None if the request doesn't carry one.
+    """
+    auth = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(auth) == 2 and auth[0].lower() == 'bearer':
+        return auth[1]
+    return None
+
+
+def copy_credentials(access_token):
+    """ Hand each request its own copies of the cached token and user so
+    that per-request state set on them never leaks into the cache.
+    """
+    access_token = copy.copy(access_token)
+    user = copy.copy(access_token.user)
+    for attr in USER_PERMISSION_CACHE_ATTRS:
+        user.__dict__.pop(attr, None)
+    access_token.user = user
+    return user, access_token
+
+
+def get_revocation_version():
+    version = RevocationVersion.objects.values_list('version', flat=True).first()
+    return version or 0
+
+
+def bump_revocation_version():
+    """ Make every process validate its cached tokens again. """
+    if not RevocationVersion.objects.filter(pk=1).update(version=F('version') + 1):
+        RevocationVersion.objects.get_or_create(pk=1, defaults={'version': 1})
+
+
+def revocation_check_due():
+    """ Whether `check_revocations()` should run before the cache is used:
+    at most once per `OAUTH_TOKEN_CACHE['REVOCATION_CHECK_INTERVAL']`.
+    """
+    if token_cache.max_size <= 0:
+        return False
+    checked_at = _revocations['checked_at']
+    interval = settings.OAUTH_TOKEN_CACHE['REVOCATION_CHECK_INTERVAL']
+    return checked_at is None or time.monotonic() - checked_at >= interval
+
+
+def check_revocations():
+    """ Read the `RevocationVersion` (one query). Tokens cached under an
+    older version are validated against the database again.
+
+    The version may be read from a replica. It is bumped after the token
+    changes, so a replica that shows the new version also shows the change.
+    """
+    version = get_revocation_version()
+    _revocations['version'] = version
+    _revocations['checked_at'] = time.monotonic()
+
+
+def get_cached_credentials(lookup_value):
+    """ Returns `(user, access_token)` for a token in the cache, or None.
+    Never queries the database; callers run `check_revocations()` when
+    `revocation_check_due()`.
+    """
+    entry = token_cache.get(token_cache_key(lookup_value))
+    if entry is None:
+        return None
+    access_token, version = entry
+    if version != _revocations['version']:
+        # Tokens may have been revoked since this one was validated.
+        token_cache.delete(token_cache_key(lookup_value))
+        return None
+    AUTHENTICATIONS.labels('bearer', 'cached').inc()
+    return copy_credentials(access_token)
+
+
+def record_credentials(lookup_value, credentials):
+    """ Count the outcome of a token checked against the database, and cache
+    the token when it was valid.
+    """
+    if credentials is None:
+        AUTHENTICATIONS.labels('bearer', 'failure').inc()
+        return
+    AUTHENTICATIONS.labels('bearer', 'success').inc()
+    user, access_token = credentials
+    token_cache.set(
+        token_cache_key(lookup_value),
+        (access_token, _revocations['version']),
+        expires_at=access_token.expires.timestamp(),
+    )
+
+
+def validate_bearer_token(token, lookup_value):
+    """ Check a bearer token against the database, as the toolkit does for
+    API requests, outside of any request (e.g. in `oauth_microservice.asgi`).
+    Returns `(user, access_token)` or None.
+    """
+    request = Request('')
+    if oauth2_settings.OAUTH2_VALIDATOR_CLASS().validate_bearer_token(token, [], request):
+        credentials = request.user, request.access_token
+    else:
+        credentials = None
+    record_credentials(lookup_value, credentials)
+    return credentials
+
+
+class CachedOAuth2Authentication(OAuth2Authentication):
+    """ A subclass of OAuth Toolkit's OAuth2Authentication which remembers
+    successfully validated access tokens in a bounded, per-process cache.
+
+    Entries live for at most `OAUTH_TOKEN_CACHE['TTL']` seconds and never
+    outlive the token's own expiry. Tokens that are revoked or deleted are
+    evicted by the signal handlers in `oauth.signals` in the process that made
+    the change. Other processes stop trusting their cached tokens once they
+    read the bumped `RevocationVersion`, within
+    `OAUTH_TOKEN_CACHE['REVOCATION_CHECK_INTERVAL']` seconds.
+    """
+
+    def authenticate(self, request):
+        token = get_bearer_token(request)
+        if token is None:
+            return super().authenticate(request)
+
+        # JWTs are verified locally and cached under their `jti`, the same
+        # value the eviction signals see in `AccessToken.token`.
+        lookup_value = get_token_lookup_value(token)
+        if lookup_value is None:
+            AUTHENTICATIONS.labels('bearer', 'failure').inc()
+            credentials = None
+        else:
+            if revocation_check_due():
+                check_revocations()
+            credentials = get_cached_credentials(lookup_value)
+            if credentials is None:
+                credentials = super().authenticate(request)
+                record_credentials(lookup_value, credentials)
+
+        if credentials is None:
+            audit_log.record(
+                'token.rejected', remote_addr=get_remote_addr(request), path=request.path
+            )
+        return credentials
@@ -0,0 +1,167 @@
+""" Deleting expired grants and tokens.
+
+Rows are deleted in small batches walked in primary key order, each in its
+own short transaction, with a pause in between. That way cleanup never holds
+locks on the token tables for long, even with a large backlog to clear.
+"""
+import datetime
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Grant, RefreshToken
+
+
+logger = logging.getLogger(__name__)
+
+# Shared by every process cleaning the same database, so only one runs at a time.
+ADVISORY_LOCK_ID = 0x6f61757468
+
+CleanupResult = namedtuple('CleanupResult', ('deleted', 'seconds'))
+
+
+def get_expired_querysets(now=None, refresh_token_retention=None):
+    """ The rows to delete, in the order they should be deleted:
+
+    - refresh tokens whose access token expired more than
+      `refresh_token_retention` ago (kept forever when it is None),
+    - expired access tokens that have no refresh token left,
+    - expired grants.
+    """
+    now = now or timezone.now()
+    querysets = OrderedDict()
+    if refresh_token_retention is not None:
+        querysets['refresh tokens'] = RefreshToken.objects.filter(
+            access_token__expires__lt=now - datetime.timedelta(seconds=refresh_token_retention)
+        )
+    querysets['access tokens'] = AccessToken.objects.filter(
+        expires__lt=now, refresh_token__isnull=True
+    )
+    querysets['grants'] = Grant.objects.filter(expires__lt=now)
+    return querysets
+
+
+def delete_in_batches(queryset, batch_size, pause=0):
+    """ Delete the queryset's rows `batch_size` at a time, sleeping `pause`
+    seconds between batches. Returns the number of rows deleted.
+    """
+    deleted = 0
+    last_pk = None
+    while True:
+        batch = queryset.order_by('pk')
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        pks = list(batch.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return deleted
+
+        with transaction.atomic():
+            # Deleting through the ORM sends post_delete, which evicts the
+            # access tokens from the token cache.
+            queryset.model.objects.filter(pk__in=pks).delete()
+        deleted += len(pks)
+        last_pk = pks[-1]
+        if len(pks) < batch_size:
+            return deleted
+        if pause:
+            time.sleep(pause)
+
+
+def clear_expired(batch_size=None, pause=None, refresh_token_retention=None, log=None):
+    """ Delete every expired grant and token, and return a
+    `{name: CleanupResult}` mapping. The defaults come from
+    `settings.TOKEN_CLEANUP`.
+    """
+    config = settings.TOKEN_CLEANUP
+    batch_size = batch_size or config['BATCH_SIZE']
+    pause = config['PAUSE'] if pause is None else pause
+    if refresh_token_retention is None:
+        refresh_token_retention = config['REFRESH_TOKEN_RETENTION']
+
+    results = OrderedDict()
+    querysets = get_expired_querysets(refresh_token_retention=refresh_token_retention)
+    for name, queryset in querysets.items():
+        started = time.perf_counter()
+        deleted = delete_in_batches(queryset, batch_size, pause)
+        results[name] = CleanupResult(deleted, time.perf_counter() - started)
+        if log:
+            log(format_result(name, results[name]))
+    return results
+
+
+def format_result(name, result):
+    rate = result.deleted / result.seconds if result.seconds else 0
+    return (
+        f'Deleted {result.deleted} expired {name} in {result.seconds:.2f}s '
+        f'({rate:.0f} rows/sec).'
+    )
+
+
+def acquire_lock():
+    """ Take the cleanup lock, if the database has one. Returns whether this
+    process may go ahead.
+    """
+    if connection.vendor != 'postgresql':
+        return True
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(%s)', [ADVISORY_LOCK_ID])
+        return cursor.fetchone()[0]
+
+
+def release_lock():
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(%s)', [ADVISORY_LOCK_ID])
+
+
+def run_cleanup(log=None, **kwargs):
+    """ `clear_expired`, unless another process is already cleaning up, in
+    which case None is returned.
+    """
+    if not acquire_lock():
+        return None
+    try:
+        return clear_expired(log=log, **kwargs)
+    finally:
+        release_lock()
+
+
+class CleanupScheduler(threading.Thread):
+    """ Runs the cleanup every `interval` seconds in a daemon thread. """
+
+    def __init__(self, interval):
+        super().__init__(name='token-cleanup', daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                run_cleanup(log=logger.info)
+            except Exception:
+                logger.exception('Unable to clear expired tokens.')
+            finally:
+                connection.close()
+
+    def stop(self):
+        self.stopped.set()
+
+
+_scheduler = None
+
+
+def start_scheduler():
+    """ Start the in-process scheduler when `TOKEN_CLEANUP['INTERVAL']` is
+    set. Every process that calls this gets one; the advisory lock keeps
+    their runs from overlapping.
+    """
+    global _scheduler
+    interval = settings.TOKEN_CLEANUP['INTERVAL']
+    if interval and _scheduler is None:
+        _scheduler = CleanupScheduler(interval)
+        _scheduler.start()
+    return _scheduler
@@ -0,0 +1,58 @@
+import calendar
+
+from django.conf import settings
+from oauth2_provider.models import AccessToken
+
+from .tokens import get_token_lookup_value
+
+
+INACTIVE = {'active': False}
+
+
+def is_introspection_client(application):
+    """ Whether the application may be granted the `introspection` scope. """
+    return (
+        application is not None
+        and application.client_id in settings.OAUTH_INTROSPECTION_CLIENT_IDS
+    )
+
+
+def get_token_introspection(access_token):
+    """ Describe an access token as an RFC 7662 introspection response. """
+    if access_token is None or not access_token.is_valid():
+        return dict(INACTIVE)
+
+    data = {
+        'active': True,
+        'token_type': 'Bearer',
+        'scope': access_token.scope,
+        'exp': int(calendar.timegm(access_token.expires.utctimetuple())),
+    }
+    if access_token.application_id:
+        data['client_id'] = access_token.application.client_id
+    if access_token.user_id:
+        data['username'] = access_token.user.get_username()
+    return data
+
+
+def introspect_tokens(tokens):
+    """ Introspect many access tokens with a single query.
+
+    Returns one RFC 7662 response per given token, in the same order.
+    Unknown, expired and malformed tokens are reported as inactive.
+    """
+    lookup_values = [get_token_lookup_value(token) for token in tokens]
+    access_tokens = {
+        access_token.token: access_token
+        for access_token in AccessToken.objects.select_related('application', 'user').filter(
+            token__in={value for value in lookup_values if value}
+        )
+    }
+    return [
+        get_token_introspection(access_tokens.get(value) if value else None)
+        for value in lookup_values
+    ]
+
+
+def introspect_token(token):
+    return introspect_tokens([token])[0]
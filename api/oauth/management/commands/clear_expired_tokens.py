@@ -0,0 +1,66 @@
+import time
+
+from django.conf import settings
+from django.core.management import base
+from django.utils import timezone
+
+from oauth.cleanup import run_cleanup
+
+
+class Command(base.BaseCommand):
+    help = (
+        'Delete expired grants and access tokens, and refresh tokens past their '
+        'retention window, in small batches.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-b',
+            '--batch-size',
+            help='The most rows deleted per transaction.',
+            type=int,
+            default=settings.TOKEN_CLEANUP['BATCH_SIZE']
+        )
+        parser.add_argument(
+            '-p',
+            '--pause',
+            help='Seconds to wait between batches.',
+            type=float,
+            default=settings.TOKEN_CLEANUP['PAUSE']
+        )
+        parser.add_argument(
+            '-r',
+            '--refresh-token-retention',
+            help=(
+                'Delete refresh tokens whose access token expired more than this '
+                'many seconds ago. Refresh tokens are kept by default.'
+            ),
+            type=int,
+            default=settings.TOKEN_CLEANUP['REFRESH_TOKEN_RETENTION']
+        )
+        parser.add_argument(
+            '-l',
+            '--loop',
+            help='Keep running, cleaning up every TOKEN_CLEANUP_INTERVAL seconds.',
+            action='store_true',
+            default=False
+        )
+
+    def log(self, message):
+        """ Write log messages to stdout in a consistent format. """
+        self.stdout.write(f'[{timezone.now()}] {message}')
+
+    def clean(self, **kwargs):
+        if run_cleanup(log=self.log, **kwargs) is None:
+            self.log('Another process is already clearing expired tokens.')
+
+    def handle(self, verbosity, batch_size, pause, refresh_token_retention, loop, *args, **kwargs):
+        options = {
+            'batch_size': batch_size,
+            'pause': pause,
+            'refresh_token_retention': refresh_token_retention,
+        }
+        self.clean(**options)
+        while loop:
+            time.sleep(settings.TOKEN_CLEANUP['INTERVAL'] or 3600)
+            self.clean(**options)
@@ -1 +1,14 @@
-# no: qa
+from django.db import models
+
+
+class RevocationVersion(models.Model):
+    """ A single row counting the access tokens revoked or changed while
+    they were still valid.
+
+    Each process caches validated access tokens (see `oauth.authentication`)
+    under the version it last read. Any process that revokes, deletes or
+    changes a live token bumps the version, so every other process validates
+    its cached tokens against the database again once it reads the new
+    version, instead of accepting a revoked token until its entry expires.
+    """
+    version = models.PositiveIntegerField(default=0)
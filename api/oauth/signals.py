@@ -0,0 +1,32 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from oauth2_provider.models import AccessToken
+
+from .applications import Application, application_cache
+from .authentication import bump_revocation_version, token_cache, token_cache_key
+
+
+@receiver(post_save, sender=AccessToken)
+@receiver(post_delete, sender=AccessToken)
+def evict_cached_access_token(sender, instance, **kwargs):
+    """ Revoking a token deletes it, and saving may change its expiry or
+    scope, so either way the cached copy is no longer trustworthy.
+    """
+    token_cache.delete(token_cache_key(instance.token))
+
+
+@receiver(post_save, sender=AccessToken)
+@receiver(post_delete, sender=AccessToken)
+def revoke_cached_access_tokens(sender, instance, created=False, **kwargs):
+    """ Let other processes know their cached copy may be stale. New tokens
+    and expired ones, which no cache accepts, don't need it.
+    """
+    if not created and instance.expires > timezone.now():
+        bump_revocation_version()
+
+
+@receiver(post_save, sender=Application)
+@receiver(post_delete, sender=Application)
+def evict_cached_application(sender, instance, **kwargs):
+    application_cache.delete(instance.client_id)
@@ -1,12 +1,49 @@
+import asyncio
 import datetime
+import json
+import os
+import tempfile
+import threading
+from io import StringIO
+from collections import OrderedDict
+from concurrent.futures import Executor, Future
+from decimal import Decimal
+from unittest import mock
 
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
 from django.utils import timezone
+from django.utils.translation import ugettext_lazy
 from django.conf import settings
-from django.test import TestCase
-from django.contrib.auth.models import User
-from oauth2_provider.models import Application, AccessToken
+from django.core.management import call_command
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection
+from django.db.models.signals import post_delete
+from django.test import TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.contrib.auth.models import Permission, User
+from oauth2_provider.models import Application, AccessToken, Grant, RefreshToken
+from oauth2_provider.oauth2_backends import OAuthLibCore
+from prometheus_client import REGISTRY
+from rest_framework.renderers import JSONRenderer
 
+from oauth_microservice.asgi import ASGIApplication, ASYNC_VIEWS
+from oauth_microservice.db.utils import CountingCursorWrapper
+from oauth_microservice.metrics import get_view_name
+from oauth_microservice.renderers import FastJSONRenderer
+from oauth_microservice.wsgi import application as wsgi_application
+from oauth_microservice.utils.cache import TTLCache
+from oauth_microservice.utils.pool import ConnectionPool, PoolTimeout
+from .applications import application_cache
 from .apps import OauthConfig
+from .authentication import token_cache
+from .cleanup import delete_in_batches
+from .signals import evict_cached_access_token
+from .tokens import JWTServer, decode_access_token, get_key_set, reset_key_set
+from .validators import OAuth2Validator
+from .views import RedirectToAuthorizationView
 
 
 class OAuthAppTestCase(TestCase):
@@ -59,3 +96,811 @@ class RedirectToAuthorizationViewTestCase(TestCase):
 
         self.assertEqual(r.status_code, 302)
         self.assertRegex(r.url, r'http://localhost/\?next=%2F.*')
+
+    def authorize(self, **params):
+        return self.client.get('/o/authorize/', {
+            'client_id': self.application.client_id,
+            'response_type': 'token',
+            **params,
+        })
+
+    def test_skip_authorization_applications_are_cached(self):
+        application_cache.clear()
+        self.client.login(username='test_user', password='test')
+        self.authorize()
+
+        with CaptureQueriesContext(connection) as queries:
+            r = self.authorize(state='xyz')
+        self.assertEqual(r.status_code, 302)
+        self.assertRegex(r.url, r'^http://localhost/#access_token=\w+.*&state=xyz')
+        self.assertFalse(any(
+            'oauth2_provider_application' in query['sql'] for query in queries.captured_queries
+        ))
+
+    def test_saving_an_application_evicts_it(self):
+        self.client.login(username='test_user', password='test')
+        self.authorize()
+        self.application.skip_authorization = False
+        self.application.save()
+
+        r = self.authorize()
+        self.assertEqual(r.status_code, 200)
+        self.assertIn('form', r.context)
+
+    def test_invalid_requests_are_rejected(self):
+        self.client.login(username='test_user', password='test')
+        r = self.authorize(redirect_uri='http://attacker/')
+        self.assertEqual(r.status_code, 400)
+
+    def test_redirect_param_keeps_the_authorization_code(self):
+        self.application.authorization_grant_type = Application.GRANT_AUTHORIZATION_CODE
+        self.application.save()
+        self.client.login(username='test_user', password='test')
+        r = self.authorize(response_type='code', state='a b', next='/page/')
+
+        self.assertEqual(r.status_code, 302)
+        self.assertRegex(r.url, r'^http://localhost/\?code=\w+&state=a\+b&next=%2Fpage%2F$')
+
+
+class TTLCacheTestCase(TestCase):
+
+    def test_get_and_set(self):
+        cache = TTLCache(max_size=2, ttl=60)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_expired_entries_are_evicted(self):
+        cache = TTLCache(max_size=2, ttl=60)
+        cache.set('a', 1, expires_at=0)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = TTLCache(max_size=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+
+class FakeConnection(object):
+
+    def __init__(self):
+        self.closed = 0
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTestCase(TestCase):
+
+    def test_connections_are_reused(self):
+        pool = ConnectionPool(FakeConnection, size=2, max_overflow=0)
+        connection = pool.checkout()
+        pool.checkin(connection)
+        self.assertIs(pool.checkout(), connection)
+        self.assertEqual(pool.stats()['open'], 1)
+        self.assertEqual(pool.stats()['checkouts'], 2)
+
+    def test_overflow_connections_are_closed_when_returned(self):
+        pool = ConnectionPool(FakeConnection, size=1, max_overflow=1)
+        first, second = pool.checkout(), pool.checkout()
+        self.assertEqual(pool.stats()['overflow'], 1)
+
+        pool.checkin(second)
+        pool.checkin(first)
+        self.assertTrue(second.closed)
+        self.assertFalse(first.closed)
+        self.assertEqual(pool.stats()['open'], 1)
+        self.assertEqual(pool.stats()['idle'], 1)
+
+    def test_checkout_waits_for_a_free_connection(self):
+        pool = ConnectionPool(FakeConnection, size=1, max_overflow=0, timeout=5)
+        connection = pool.checkout()
+        threading.Timer(0.05, pool.checkin, (connection,)).start()
+
+        self.assertIs(pool.checkout(), connection)
+        self.assertEqual(pool.stats()['waits'], 1)
+
+    def test_checkout_times_out(self):
+        pool = ConnectionPool(FakeConnection, size=1, max_overflow=0, timeout=0.01)
+        pool.checkout()
+        with self.assertRaises(PoolTimeout):
+            pool.checkout()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_broken_connections_are_replaced(self):
+        pool = ConnectionPool(
+            FakeConnection, size=2, max_overflow=0, check=lambda connection: False, check_after=0
+        )
+        connection = pool.checkout()
+        pool.checkin(connection)
+        self.assertIsNot(pool.checkout(), connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['discarded'], 1)
+        self.assertEqual(pool.stats()['open'], 1)
+
+        pool.checkin(FakeConnection(), discard=True)
+        self.assertEqual(pool.stats()['open'], 0)
+        self.assertEqual(pool.stats()['in_use'], 0)
+
+
+class DatabaseStatusTestCase(TestCase):
+
+    def test_requires_staff(self):
+        User.objects.create_user('test_user', 'tester@gmail.com', 'test')
+        self.client.login(username='test_user', password='test')
+        self.assertEqual(self.client.get('/status/database/').status_code, 403)
+
+    def test_status(self):
+        User.objects.create_superuser('admin', 'admin@gmail.com', 'test')
+        self.client.login(username='admin', password='test')
+        r = self.client.get('/status/database/')
+        self.assertEqual(r.status_code, 200)
+        self.assertIsNone(r.json()['default']['pool'])
+
+
+class SiteURLsTestCase(TestCase):
+
+    def test_lazy_includes(self):
+        self.assertEqual(reverse('registration_register'), '/register/')
+        self.assertEqual(reverse('admin:index'), '/console/')
+        self.assertEqual(resolve('/register/closed/').url_name, 'registration_disallowed')
+        self.assertRedirects(self.client.get('/register/'), '/register/closed/')
+
+        User.objects.create_superuser('admin', 'admin@gmail.com', 'test')
+        self.client.login(username='admin', password='test')
+        r = self.client.get('/console/')
+        self.assertContains(r, f'{settings.SITENAME} Admin Panel')
+
+
+class CachedOAuth2AuthenticationTestCase(TestCase):
+
+    def setUp(self):
+        token_cache.clear()
+        token_cache.reset_stats()
+        self.test_user = User.objects.create_user('test_user', 'tester@gmail.com', 'test')
+        self.application = Application.objects.create(
+            name='Test Application',
+            redirect_uris='http://localhost/',
+            user=self.test_user,
+            skip_authorization=True,
+            authorization_grant_type=Application.GRANT_IMPLICIT,
+            client_secret='',
+            client_type=Application.CLIENT_PUBLIC,
+        )
+        self.valid_token = AccessToken.objects.create(
+            user=self.test_user, token='12345678901',
+            application=self.application,
+            expires=timezone.now() + datetime.timedelta(days=1),
+        )
+        self.auth = {'HTTP_AUTHORIZATION': 'Bearer 12345678901'}
+
+    def test_cached_token_skips_database(self):
+        r = self.client.get('/validate/', **self.auth)
+        self.assertEqual(r.status_code, 200)
+
+        with self.assertNumQueries(0):
+            r = self.client.get('/validate/', **self.auth)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(token_cache.stats()['hits'], 1)
+        self.assertEqual(token_cache.stats()['misses'], 1)
+
+    def test_revoked_token_is_evicted(self):
+        self.client.get('/validate/', **self.auth)
+        self.valid_token.revoke()
+
+        r = self.client.get('/validate/', **self.auth)
+        self.assertEqual(r.status_code, 401)
+
+    @override_settings(OAUTH_TOKEN_CACHE=dict(
+        settings.OAUTH_TOKEN_CACHE, REVOCATION_CHECK_INTERVAL=0
+    ))
+    def test_tokens_revoked_by_other_processes_are_rejected(self):
+        self.client.get('/validate/', **self.auth)
+        # Another process revokes the token. Its eviction only reaches its own
+        # cache, so all that this one sees is the database.
+        post_delete.disconnect(evict_cached_access_token, sender=AccessToken)
+        self.addCleanup(post_delete.connect, evict_cached_access_token, sender=AccessToken)
+        self.valid_token.revoke()
+        self.assertEqual(len(token_cache), 1)
+
+        r = self.client.get('/validate/', **self.auth)
+        self.assertEqual(r.status_code, 401)
+
+    @override_settings(OAUTH_TOKEN_CACHE=dict(
+        settings.OAUTH_TOKEN_CACHE, REVOCATION_CHECK_INTERVAL=0
+    ))
+    def test_new_tokens_keep_cached_tokens_valid(self):
+        self.client.get('/validate/', **self.auth)
+        AccessToken.objects.create(
+            user=self.test_user, token='other-token', application=self.application,
+            expires=timezone.now() + datetime.timedelta(days=1),
+        )
+        # Only the version is read.
+        with self.assertNumQueries(1):
+            r = self.client.get('/validate/', **self.auth)
+        self.assertEqual(r.status_code, 200)
+
+    def test_expired_token_is_not_cached(self):
+        self.valid_token.expires = timezone.now() - datetime.timedelta(seconds=1)
+        self.valid_token.save()
+
+        r = self.client.get('/validate/', **self.auth)
+        self.assertEqual(r.status_code, 401)
+        self.assertEqual(len(token_cache), 0)
+
+
+def write_private_key(directory, name):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as f:
+        f.write(key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.TraditionalOpenSSL,
+            encryption_algorithm=serialization.NoEncryption(),
+        ))
+    return path
+
+
+class JWTAccessTokenTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.key_dir = tempfile.TemporaryDirectory()
+        cls.keys = [
+            write_private_key(cls.key_dir.name, 'new.pem'),
+            write_private_key(cls.key_dir.name, 'old.pem'),
+        ]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.key_dir.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.settings_override = override_settings(OAUTH_JWT={
+            'KEYS': self.keys,
+            'ALGORITHM': 'RS256',
+            'ISSUER': 'test-issuer',
+        })
+        self.settings_override.enable()
+        reset_key_set()
+        token_cache.clear()
+
+        self.test_user = User.objects.create_user('test_user', 'tester@gmail.com', 'test')
+        self.application = Application.objects.create(
+            name='Test Application',
+            redirect_uris='http://localhost/',
+            user=self.test_user,
+            authorization_grant_type=Application.GRANT_PASSWORD,
+            client_secret='',
+            client_type=Application.CLIENT_PUBLIC,
+        )
+
+    def tearDown(self):
+        self.settings_override.disable()
+        reset_key_set()
+
+    def issue_token(self):
+        core = OAuthLibCore(JWTServer(OAuth2Validator()))
+        request = RequestFactory().post('/o/token/', {
+            'grant_type': 'password',
+            'username': 'test_user',
+            'password': 'test',
+            'client_id': self.application.client_id,
+        })
+        url, headers, body, status = core.create_token_response(request)
+        self.assertEqual(status, 200)
+        return json.loads(body)['access_token']
+
+    def test_issued_token_is_a_signed_jwt(self):
+        token = self.issue_token()
+        claims = decode_access_token(token)
+
+        self.assertEqual(claims['sub'], str(self.test_user.pk))
+        self.assertEqual(claims['username'], 'test_user')
+        self.assertEqual(claims['client_id'], self.application.client_id)
+        self.assertEqual(claims['permissions'], [])
+        self.assertTrue(AccessToken.objects.filter(token=claims['jti']).exists())
+
+    def test_jwt_authenticates_api_requests(self):
+        token = self.issue_token()
+        r = self.client.get('/validate/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(r.status_code, 200)
+
+    def test_tampered_jwt_is_rejected(self):
+        header, payload, signature = self.issue_token().split('.')
+        token = '.'.join((header, payload, signature[::-1]))
+        r = self.client.get('/validate/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(r.status_code, 401)
+
+    def test_revoked_jwt_is_rejected(self):
+        token = self.issue_token()
+        AccessToken.objects.get(token=decode_access_token(token)['jti']).revoke()
+        r = self.client.get('/validate/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(r.status_code, 401)
+
+    def test_jwks_publishes_all_keys(self):
+        r = self.client.get('/o/jwks/')
+        self.assertEqual(r.status_code, 200)
+
+        kids = [key['kid'] for key in r.json()['keys']]
+        self.assertEqual(kids, [key.kid for key in get_key_set().keys])
+        self.assertEqual(len(kids), 2)
+
+
+class IntrospectTokenViewTestCase(TestCase):
+
+    def setUp(self):
+        token_cache.clear()
+        self.test_user = User.objects.create_user('test_user', 'tester@gmail.com', 'test')
+        self.application = Application.objects.create(
+            name='Test Application',
+            redirect_uris='http://localhost/',
+            user=self.test_user,
+            authorization_grant_type=Application.GRANT_IMPLICIT,
+            client_secret='',
+            client_type=Application.CLIENT_PUBLIC,
+        )
+        expires = timezone.now() + datetime.timedelta(days=1)
+        self.gateway_token = AccessToken.objects.create(
+            user=self.test_user, token='gateway', application=self.application,
+            expires=expires, scope='introspection',
+        )
+        self.user_token = AccessToken.objects.create(
+            user=self.test_user, token='user', application=self.application,
+            expires=expires, scope='read write',
+        )
+        self.expired_token = AccessToken.objects.create(
+            user=self.test_user, token='expired', application=self.application,
+            expires=timezone.now() - datetime.timedelta(days=1), scope='read',
+        )
+        self.auth = {'HTTP_AUTHORIZATION': 'Bearer gateway'}
+        allowlist = self.settings(OAUTH_INTROSPECTION_CLIENT_IDS=[self.application.client_id])
+        allowlist.enable()
+        self.addCleanup(allowlist.disable)
+
+    def test_introspect_active_token(self):
+        r = self.client.post('/o/introspect/', {'token': 'user'}, **self.auth)
+        self.assertEqual(r.status_code, 200)
+
+        data = r.json()
+        self.assertTrue(data['active'])
+        self.assertEqual(data['scope'], 'read write')
+        self.assertEqual(data['username'], 'test_user')
+        self.assertEqual(data['client_id'], self.application.client_id)
+        self.assertEqual(data['exp'], int(self.user_token.expires.timestamp()))
+
+    def test_introspect_inactive_tokens(self):
+        for token in ('expired', 'unknown', 'not.a.jwt'):
+            r = self.client.post('/o/introspect/', {'token': token}, **self.auth)
+            self.assertEqual(r.status_code, 200)
+            self.assertEqual(r.json(), {'active': False})
+
+    def test_introspect_requires_introspection_scope(self):
+        r = self.client.post('/o/introspect/', {'token': 'gateway'},
+                             HTTP_AUTHORIZATION='Bearer user')
+        self.assertEqual(r.status_code, 403)
+
+    def test_introspect_requires_an_allowlisted_client(self):
+        with self.settings(OAUTH_INTROSPECTION_CLIENT_IDS=[]):
+            r = self.client.post('/o/introspect/', {'token': 'user'}, **self.auth)
+        self.assertEqual(r.status_code, 403)
+
+    def test_introspect_does_not_accept_tokens_in_the_query_string(self):
+        r = self.client.get('/o/introspect/', {'token': 'user'}, **self.auth)
+        self.assertEqual(r.status_code, 405)
+
+    def test_only_allowlisted_clients_are_granted_the_scope(self):
+        application = Application.objects.create(
+            name='Password Application',
+            user=self.test_user,
+            authorization_grant_type=Application.GRANT_PASSWORD,
+            client_type=Application.CLIENT_CONFIDENTIAL,
+        )
+
+        def request_token(scope):
+            return self.client.post('/o/token/', {
+                'grant_type': 'password',
+                'username': 'test_user',
+                'password': 'test',
+                'scope': scope,
+                'client_id': application.client_id,
+                'client_secret': application.client_secret,
+            })
+
+        r = request_token('introspection')
+        self.assertNotEqual(r.status_code, 200)
+        self.assertEqual(r.json()['error'], 'invalid_scope')
+        self.assertEqual(request_token('read').status_code, 200)
+
+        with self.settings(OAUTH_INTROSPECTION_CLIENT_IDS=[application.client_id]):
+            r = request_token('introspection')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json()['scope'], 'introspection')
+
+    def test_batch_introspection_uses_one_query(self):
+        # Warm the token cache so only the introspection query is counted.
+        self.client.get('/validate/', **self.auth)
+
+        with self.assertNumQueries(1):
+            r = self.client.post(
+                '/o/introspect/batch/',
+                json.dumps({'tokens': ['user', 'unknown', 'expired', 'user']}),
+                content_type='application/json',
+                **self.auth
+            )
+        self.assertEqual(r.status_code, 200)
+
+        results = r.json()['results']
+        self.assertEqual([result['active'] for result in results], [True, False, False, True])
+
+    def test_batch_introspection_rejects_invalid_payload(self):
+        r = self.client.post(
+            '/o/introspect/batch/',
+            json.dumps({'tokens': 'user'}),
+            content_type='application/json',
+            **self.auth
+        )
+        self.assertEqual(r.status_code, 400)
+
+
+class MetricsTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('test_user', 'tester@gmail.com', 'test')
+        self.application = Application.objects.create(
+            name='Test Application',
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_PASSWORD,
+        )
+        self.access_token = AccessToken.objects.create(
+            user=self.user,
+            application=self.application,
+            token='metrics-token',
+            expires=timezone.now() + datetime.timedelta(hours=1),
+            scope='read write',
+        )
+        token_cache.clear()
+
+    def get_sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_view_names(self):
+        from users import views
+
+        self.assertEqual(get_view_name(views.validate, 'GET'), 'users.views.validate')
+        list_view = views.UserViewSet.as_view({'get': 'list'})
+        self.assertEqual(get_view_name(list_view, 'GET'), 'users.views.UserViewSet.list')
+        authorize_view = RedirectToAuthorizationView.as_view()
+        self.assertEqual(
+            get_view_name(authorize_view, 'GET'), 'oauth.views.RedirectToAuthorizationView'
+        )
+
+    def test_requests_are_recorded_by_view(self):
+        labels = {'view': 'users.views.validate', 'method': 'GET', 'status': '200'}
+        before = self.get_sample('oauth_http_request_duration_seconds_count', **labels)
+        failures = self.get_sample(
+            'oauth_authentications_total', method='bearer', outcome='failure'
+        )
+
+        self.client.get('/validate/', HTTP_AUTHORIZATION='Bearer metrics-token')
+        self.client.get('/validate/', HTTP_AUTHORIZATION='Bearer not-a-token')
+
+        self.assertEqual(
+            self.get_sample('oauth_http_request_duration_seconds_count', **labels), before + 1
+        )
+        self.assertEqual(
+            self.get_sample('oauth_authentications_total', method='bearer', outcome='failure'),
+            failures + 1,
+        )
+
+    def test_token_issuance_is_counted(self):
+        before = self.get_sample('oauth_tokens_issued_total', grant_type='password')
+        r = self.client.post('/o/token/', {
+            'grant_type': 'password',
+            'username': 'test_user',
+            'password': 'test',
+            'client_id': self.application.client_id,
+            'client_secret': self.application.client_secret,
+        })
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(
+            self.get_sample('oauth_tokens_issued_total', grant_type='password'), before + 1
+        )
+
+    def test_queries_are_counted(self):
+        connection.ensure_connection()
+        connection.query_count, connection.query_duration = 0, 0.0
+        self.addCleanup(delattr, connection, 'query_count')
+        self.addCleanup(delattr, connection, 'query_duration')
+
+        CountingCursorWrapper(connection.connection.cursor(), connection).execute('SELECT 1')
+        self.assertEqual(connection.query_count, 1)
+        self.assertGreater(connection.query_duration, 0)
+
+    @override_settings(METRICS={'ENABLED': True, 'AUTH_TOKEN': 'scraper'})
+    def test_scrape_endpoint(self):
+        self.client.get('/validate/', HTTP_AUTHORIZATION='Bearer metrics-token')
+        r = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer scraper')
+        self.assertEqual(r.status_code, 200)
+        self.assertIn(b'oauth_http_request_duration_seconds_bucket', r.content)
+
+    @override_settings(METRICS={'ENABLED': True, 'AUTH_TOKEN': 'scraper'})
+    def test_scrape_endpoint_token(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        r = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer other')
+        self.assertEqual(r.status_code, 403)
+
+    @override_settings(METRICS={'ENABLED': True, 'AUTH_TOKEN': None})
+    def test_scrape_endpoint_is_closed_without_a_token(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        r = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer None')
+        self.assertEqual(r.status_code, 403)
+
+
+class APIFastLaneTestCase(TestCase):
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user('test_user', 'tester@gmail.com', 'test')
+        self.other_user = User.objects.create_user('other_user', 'other@gmail.com', 'test')
+        self.application = Application.objects.create(
+            name='Test Application',
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_PASSWORD,
+        )
+        AccessToken.objects.create(
+            user=self.user,
+            application=self.application,
+            token='fast-lane-token',
+            expires=timezone.now() + datetime.timedelta(hours=1),
+            scope='read write',
+        )
+        self.auth = {'HTTP_AUTHORIZATION': 'Bearer fast-lane-token'}
+
+    def test_bearer_requests_skip_the_session(self):
+        # The session of another user is ignored, not even loaded.
+        self.client.login(username='other_user', password='test')
+        r = self.client.get('/user/', **self.auth)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json()['username'], 'test_user')
+        self.assertFalse(hasattr(r.wsgi_request, 'session'))
+        self.assertFalse(hasattr(r.wsgi_request, '_messages'))
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, r.cookies)
+
+    def test_session_requests_use_the_full_stack(self):
+        self.client.login(username='test_user', password='test')
+        r = self.client.get('/user/')
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(hasattr(r.wsgi_request, 'session'))
+
+        r = self.client.get('/console/', **self.auth)
+        self.assertTrue(hasattr(r.wsgi_request, 'session'))
+
+    @override_settings(FORCE_SCRIPT_NAME='/auth')
+    def test_paths_are_matched_without_the_script_name(self):
+        r = self.client.get('/user/', **self.auth)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.wsgi_request.path, '/auth/user/')
+        self.assertFalse(hasattr(r.wsgi_request, 'session'))
+
+    @override_settings(API_FAST_LANE_PATHS=[])
+    def test_fast_lane_can_be_disabled(self):
+        r = self.client.get('/user/', **self.auth)
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(hasattr(r.wsgi_request, 'session'))
+
+
+class FastJSONRendererTestCase(TestCase):
+    data = OrderedDict((
+        ('text', 'caf\u00e9 \u2028'),
+        ('lazy', ugettext_lazy('Read access')),
+        ('when', datetime.datetime(2026, 1, 2, 3, 4, 5, 6000, tzinfo=datetime.timezone.utc)),
+        ('amount', Decimal('1.50')),
+        ('items', [1, 2.5, None, True]),
+        (1, 'non-string key'),
+    ))
+
+    def test_matches_the_stock_renderer(self):
+        self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+
+    def test_falls_back_without_orjson(self):
+        with mock.patch('oauth_microservice.renderers.orjson', None):
+            self.assertEqual(
+                FastJSONRenderer().render(self.data), JSONRenderer().render(self.data)
+            )
+
+    def test_indented_output(self):
+        media_type = 'application/json; indent=2'
+        self.assertEqual(
+            FastJSONRenderer().render(self.data, media_type),
+            JSONRenderer().render(self.data, media_type),
+        )
+
+
+class ClearExpiredTokensTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('test_user', 'tester@gmail.com', 'test')
+        self.application = Application.objects.create(
+            name='Test Application',
+            redirect_uris='http://localhost/',
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_AUTHORIZATION_CODE,
+        )
+        now = timezone.now()
+        self.valid = self.create_token('valid', now + datetime.timedelta(hours=1))
+        for i in range(5):
+            self.create_token(f'expired-{i}', now - datetime.timedelta(hours=1))
+        self.recently_refreshable = self.create_token('recent', now - datetime.timedelta(hours=1))
+        self.create_refresh_token(self.recently_refreshable)
+        self.refreshable = self.create_token('old', now - datetime.timedelta(days=2))
+        self.create_refresh_token(self.refreshable)
+
+        for code, expires in (('valid', 1), ('expired', -1)):
+            Grant.objects.create(
+                user=self.user, application=self.application, code=code,
+                redirect_uri='http://localhost/', expires=now + datetime.timedelta(hours=expires),
+            )
+
+    def create_token(self, token, expires):
+        return AccessToken.objects.create(
+            user=self.user, application=self.application, token=token, expires=expires,
+        )
+
+    def create_refresh_token(self, access_token):
+        RefreshToken.objects.create(
+            user=self.user, application=self.application,
+            token=f'refresh-{access_token.token}', access_token=access_token,
+        )
+
+    def clear(self, *args):
+        out = StringIO()
+        call_command('clear_expired_tokens', '--batch-size', '2', '--pause', '0', *args, stdout=out)
+        return out.getvalue()
+
+    def test_expired_rows_are_deleted(self):
+        output = self.clear()
+        self.assertEqual(
+            set(AccessToken.objects.values_list('token', flat=True)), {'valid', 'recent', 'old'}
+        )
+        self.assertEqual(RefreshToken.objects.count(), 2)
+        self.assertEqual(list(Grant.objects.values_list('code', flat=True)), ['valid'])
+        self.assertIn('Deleted 5 expired access tokens', output)
+        self.assertIn('rows/sec', output)
+
+    def test_refresh_token_retention(self):
+        output = self.clear('--refresh-token-retention', str(24 * 60 * 60))
+        self.assertEqual(
+            set(AccessToken.objects.values_list('token', flat=True)), {'valid', 'recent'}
+        )
+        self.assertEqual(RefreshToken.objects.get().access_token, self.recently_refreshable)
+        self.assertIn('Deleted 1 expired refresh tokens', output)
+
+    def test_batches_are_paused_between(self):
+        with mock.patch('time.sleep') as sleep:
+            deleted = delete_in_batches(
+                AccessToken.objects.filter(token__startswith='expired'), batch_size=2, pause=1
+            )
+        self.assertEqual(deleted, 5)
+        self.assertEqual(sleep.call_count, 2)
+
+
+class ImmediateExecutor(Executor):
+    """ Runs submitted calls right away, in the test's thread and transaction. """
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+class ASGIApplicationTestCase(TestCase):
+
+    def setUp(self):
+        token_cache.clear()
+        # Like Django's test client, keep requests from closing the test's
+        # connection (and transaction).
+        for signal in (request_started, request_finished):
+            signal.disconnect(close_old_connections)
+            self.addCleanup(signal.connect, close_old_connections)
+        patcher = mock.patch('oauth_microservice.asgi.close_old_connections')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.app = ASGIApplication(wsgi_application, ASYNC_VIEWS, ImmediateExecutor())
+        self.user = User.objects.create_user('test_user', 'tester@gmail.com', 'test')
+        self.user.user_permissions.add(Permission.objects.get(codename='add_user'))
+        application = Application.objects.create(
+            name='Test Application',
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_PASSWORD,
+        )
+        AccessToken.objects.create(
+            user=self.user, application=application, token='asgi-token',
+            expires=timezone.now() + datetime.timedelta(hours=1), scope='read write',
+        )
+
+    def request(self, path, query='', token='asgi-token', cookie=None):
+        scope = {
+            'type': 'http',
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'root_path': '',
+            'query_string': query.encode(),
+            'headers': [(b'host', b'testserver')],
+            'server': ('testserver', 80),
+            'client': ('127.0.0.1', 50000),
+        }
+        if token:
+            scope['headers'].append((b'authorization', f'Bearer {token}'.encode()))
+        if cookie:
+            scope['headers'].append((b'cookie', cookie.encode()))
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.get_event_loop().run_until_complete(self.app(scope, receive, send))
+        body = b''.join(message.get('body', b'') for message in sent[1:])
+        return sent[0]['status'], dict(sent[0]['headers']), body
+
+    def test_validate(self):
+        status, headers, body = self.request('/validate/')
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body.decode()), {'message': 'User is valid.'})
+
+        # Cached tokens are validated without the database.
+        with self.assertNumQueries(0):
+            status, headers, body = self.request('/validate/')
+        self.assertEqual(status, 200)
+
+    def test_invalid_token(self):
+        status, headers, body = self.request('/validate/', token='not-a-token')
+        self.assertEqual(status, 401)
+        self.assertEqual(headers[b'www-authenticate'], b'Bearer realm="api"')
+
+    def test_has_permission(self):
+        status, headers, body = self.request('/user/has_permission/', 'codename=add_user')
+        self.assertEqual(status, 200)
+        self.assertTrue(json.loads(body.decode())['has_permission'])
+
+        status, headers, body = self.request('/user/has_permission/', 'codename=delete_user')
+        self.assertFalse(json.loads(body.decode())['has_permission'])
+
+    @override_settings(DATABASE_REPLICAS=['default'])
+    def test_reads_use_the_replicas(self):
+        with mock.patch('random.choice', return_value='default') as choice:
+            status, headers, body = self.request('/validate/')
+        self.assertEqual(status, 200)
+        self.assertTrue(choice.called)
+
+    @override_settings(DATABASE_REPLICAS=['default'])
+    def test_pinned_clients_use_the_primary(self):
+        with mock.patch('random.choice') as choice:
+            status, headers, body = self.request('/validate/', cookie='pin_primary=1')
+            self.request('/user/has_permission/', 'codename=add_user', cookie='pin_primary=1')
+        self.assertEqual(status, 200)
+        self.assertFalse(choice.called)
+
+    def test_other_requests_go_to_django(self):
+        status, headers, body = self.request('/user/')
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body.decode())['username'], 'test_user')
+
+        status, headers, body = self.request('/validate/', token=None)
+        self.assertEqual(status, 401)
@@ -0,0 +1,183 @@
+import base64
+import hashlib
+import json
+import uuid
+from datetime import timedelta
+
+import jwt
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.serialization import load_pem_private_key
+from django.conf import settings
+from django.utils import timezone
+from jwt.algorithms import RSAAlgorithm
+from oauthlib.oauth2 import Server
+from oauthlib.oauth2.rfc6749.tokens import random_token_generator
+from oauth2_provider.settings import oauth2_settings
+
+from users.permissions import get_user_permission_codenames
+
+
+def is_jwt(token):
+    """ Opaque tokens are plain random strings, while JWTs always have exactly
+    three dot separated segments.
+    """
+    return bool(token) and token.count('.') == 2
+
+
+def _b64url(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+class SigningKey(object):
+    """ An RSA key pair used to sign and verify JWT access tokens.
+
+    The key id (`kid`) is the RFC 7638 thumbprint of the public key, so it is
+    stable across restarts and identical on every worker.
+    """
+
+    def __init__(self, private_key):
+        self.private_key = private_key
+        self.public_key = private_key.public_key()
+        self.jwk = json.loads(RSAAlgorithm.to_jwk(self.public_key))
+        thumbprint = json.dumps(
+            {member: self.jwk[member] for member in ('e', 'kty', 'n')},
+            sort_keys=True,
+            separators=(',', ':'),
+        )
+        self.kid = _b64url(hashlib.sha256(thumbprint.encode('utf-8')).digest())
+        self.jwk.update({
+            'kid': self.kid,
+            'use': 'sig',
+            'alg': settings.OAUTH_JWT['ALGORITHM'],
+        })
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'rb') as f:
+            return cls(load_pem_private_key(f.read(), password=None, backend=default_backend()))
+
+
+class KeySet(object):
+    """ The ordered set of signing keys from `OAUTH_JWT['KEYS']`.
+
+    The first key signs new tokens. Every key is published in the JWKS
+    document and accepted for verification, which allows keys to be rotated
+    by prepending a new key and dropping the old one once the tokens it
+    signed have expired.
+    """
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.keys_by_id = {key.kid: key for key in keys}
+
+    @property
+    def signing_key(self):
+        return self.keys[0]
+
+    def get(self, kid):
+        return self.keys_by_id.get(kid)
+
+    def jwks(self):
+        return {'keys': [key.jwk for key in self.keys]}
+
+
+_key_set = None
+
+
+def get_key_set():
+    """ Load the configured keys once per process. """
+    global _key_set
+    if _key_set is None:
+        _key_set = KeySet([SigningKey.from_file(path) for path in settings.OAUTH_JWT['KEYS']])
+    return _key_set
+
+
+def reset_key_set():
+    global _key_set
+    _key_set = None
+
+
+def jwt_enabled():
+    return bool(settings.OAUTH_JWT['KEYS'])
+
+
+def get_access_token_claims(request):
+    """ Build the claims of a JWT access token from an oauthlib request. """
+    now = timezone.now()
+    claims = {
+        'jti': uuid.uuid4().hex,
+        'iss': settings.OAUTH_JWT['ISSUER'],
+        'iat': now,
+        'exp': now + timedelta(seconds=request.expires_in),
+        'scope': ' '.join(request.scopes or []),
+    }
+    client = getattr(request, 'client', None)
+    if client is not None:
+        claims['client_id'] = client.client_id
+
+    user = getattr(request, 'user', None)
+    if user is not None:
+        claims.update({
+            'sub': str(user.pk),
+            'username': user.get_username(),
+            'permissions': get_user_permission_codenames(user),
+        })
+    return claims
+
+
+def jwt_token_generator(request, refresh_token=False):
+    """ An oauthlib token generator which issues signed JWT access tokens. """
+    key = get_key_set().signing_key
+    token = jwt.encode(
+        get_access_token_claims(request),
+        key.private_key,
+        algorithm=settings.OAUTH_JWT['ALGORITHM'],
+        headers={'kid': key.kid},
+    )
+    return token.decode('ascii')
+
+
+def decode_access_token(token):
+    """ Verify a JWT access token's signature, issuer and expiry against the
+    local key set. Returns the token's claims, or None if it isn't valid.
+    """
+    try:
+        key = get_key_set().get(jwt.get_unverified_header(token).get('kid'))
+        if key is None:
+            return None
+        return jwt.decode(
+            token,
+            key.public_key,
+            algorithms=[settings.OAUTH_JWT['ALGORITHM']],
+            issuer=settings.OAUTH_JWT['ISSUER'],
+        )
+    except jwt.InvalidTokenError:
+        return None
+
+
+def get_token_lookup_value(token):
+    """ Returns the value stored in `AccessToken.token` for a bearer token.
+
+    JWTs are too long for the toolkit's token column, so only their `jti` is
+    stored. A JWT that fails verification has no lookup value.
+    """
+    if not is_jwt(token):
+        return token
+    if not jwt_enabled():
+        return None
+    claims = decode_access_token(token)
+    return claims['jti'] if claims else None
+
+
+class JWTServer(Server):
+    """ An oauthlib Server which issues JWT access tokens for every grant.
+
+    Refresh tokens stay opaque, random strings since they are only ever
+    presented back to this service.
+    """
+
+    def __init__(self, request_validator, *args, **kwargs):
+        kwargs.setdefault('token_generator', jwt_token_generator)
+        kwargs.setdefault('refresh_token_generator', random_token_generator)
+        kwargs.setdefault('token_expires_in', oauth2_settings.ACCESS_TOKEN_EXPIRE_SECONDS)
+        super().__init__(request_validator, *args, **kwargs)
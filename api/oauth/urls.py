@@ -5,5 +5,8 @@ from . import views
 
 urlpatterns = [
     url(r'^authorize/$', views.RedirectToAuthorizationView.as_view()),
+    url(r'^jwks/$', views.jwks, name='jwks'),
+    url(r'^introspect/$', views.IntrospectTokenView.as_view(), name='introspect'),
+    url(r'^introspect/batch/$', views.BatchIntrospectTokenView.as_view(), name='introspect-batch'),
     url(r'^', include('oauth2_provider.urls', namespace='oauth2_provider')),
 ]
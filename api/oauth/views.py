@@ -1,9 +1,27 @@
-from urllib.parse import urlencode, urlparse, urlunparse, parse_qs
+from urllib.parse import urlencode, urlsplit, urlunsplit
 
 from django.conf import settings
-from django.shortcuts import redirect
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, JsonResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import require_GET
+from oauth2_provider.contrib.rest_framework import TokenHasScope
+from oauth2_provider.exceptions import OAuthToolkitError
+from oauth2_provider.http import HttpResponseUriRedirect
 from oauth2_provider.views import AuthorizationView
+from rest_framework import exceptions, permissions, response, views
+
+from audit.log import audit_log, get_remote_addr
+from .applications import get_application
+from .introspection import introspect_token, introspect_tokens, is_introspection_client
+from .tokens import get_key_set, jwt_enabled
+
+
+def add_query_param(url, name, value):
+    """ Append a query param to the URL, leaving the rest of it untouched. """
+    scheme, netloc, path, query, fragment = urlsplit(url)
+    param = urlencode({name: value})
+    query = f'{query}&{param}' if query else param
+    return urlunsplit((scheme, netloc, path, query, fragment))
 
 
 class RedirectToAuthorizationView(AuthorizationView):
@@ -27,6 +45,13 @@ class RedirectToAuthorizationView(AuthorizationView):
         # Extract the optional `redirect_to` URL param and saves it for later.
         redirect_to = request.GET.get(self.REDIRECT_PARAM, None)
 
+        application = get_application(request.GET.get('client_id'))
+        if (
+            request.GET.get('response_type') == 'token'
+            and application is not None and application.skip_authorization
+        ):
+            return self.authorize_implicitly(request, redirect_to)
+
         # Perform OAuth Toolkit's default auth behavior.
         response = super().get(request, *args, **kwargs)
 
@@ -37,12 +62,100 @@ class RedirectToAuthorizationView(AuthorizationView):
         if not isinstance(response, HttpResponseRedirect) or not redirect_to:
             return response
 
-        # Add the query param to the existing URL.
-        scheme, netloc, path, params, query, fragment = urlparse(response.url)
-        new_query = urlencode({
-            **parse_qs(query),
-            self.REDIRECT_PARAM: redirect_to
-        })
-        new_url = urlunparse((scheme, netloc, path, params, new_query, fragment))
+        return HttpResponseUriRedirect(
+            add_query_param(response.url, self.REDIRECT_PARAM, redirect_to)
+        )
+
+    def authorize_implicitly(self, request, redirect_to):
+        """ Implicit grants for applications that skip authorization, e.g. the
+        SPA clients from `create_public_application`, don't need the consent
+        form or the toolkit's own application lookup: validate the request,
+        issue the token and redirect straight to the client.
+        """
+        try:
+            scopes, credentials = self.validate_authorization_request(request)
+            uri, headers, body, status = self.create_authorization_response(
+                request=request, scopes=' '.join(scopes), credentials=credentials, allow=True
+            )
+        except OAuthToolkitError as error:
+            return self.error_response(error)
+
+        if redirect_to:
+            uri = add_query_param(uri, self.REDIRECT_PARAM, redirect_to)
+        return HttpResponseUriRedirect(uri)
+
+    def create_authorization_response(self, request, scopes, credentials, allow):
+        # Every decision, whether from the consent form, an application that
+        # skips authorization or an earlier approval, goes through here.
+        audit_log.record(
+            'authorization.allowed' if allow else 'authorization.denied',
+            user_id=request.user.pk,
+            client_id=credentials.get('client_id'),
+            remote_addr=get_remote_addr(request),
+            response_type=credentials.get('response_type'),
+            scope=scopes,
+        )
+        return super().create_authorization_response(request, scopes, credentials, allow)
+
+
+@require_GET
+@cache_control(public=True, max_age=300)
+def jwks(request):
+    """ Publish the public keys that JWT access tokens are signed with as a
+    JSON Web Key Set, so resource servers can verify tokens offline.
+    """
+    return JsonResponse(get_key_set().jwks() if jwt_enabled() else {'keys': []})
+
+
+class IsIntrospectionClient(permissions.BasePermission):
+    """ Allows access to tokens issued to an application listed in
+    `OAUTH_INTROSPECTION_CLIENT_IDS`, whatever scopes they carry.
+    """
+
+    def has_permission(self, request, view):
+        return request.auth is not None and is_introspection_client(request.auth.application)
+
+
+class IntrospectTokenView(views.APIView):
+    """ Token introspection as described by RFC 7662.
+
+    The caller (e.g. an API gateway) must authenticate with its own access
+    token, issued to an application in `OAUTH_INTROSPECTION_CLIENT_IDS` and
+    carrying the `introspection` scope. The token to inspect is given as the
+    `token` form parameter.
+
+    post:
+    Returns whether the token is active and, if it is, its `scope`, `exp`,
+    `client_id` and `username`.
+    """
+    permission_classes = (TokenHasScope, IsIntrospectionClient)
+    required_scopes = ['introspection']
+
+    def post(self, request, *args, **kwargs):
+        return self.introspect(request.data.get('token'))
+
+    def introspect(self, token):
+        if not token:
+            raise exceptions.ValidationError({'token': 'This field is required.'})
+        return response.Response(introspect_token(token))
+
+
+class BatchIntrospectTokenView(IntrospectTokenView):
+    """ Introspect many tokens in one round trip.
+
+    post:
+    Expects a JSON body of the form `{"tokens": ["...", ...]}` and returns
+    `{"results": [...]}` with one RFC 7662 response per token, in the same
+    order as the request. All tokens are resolved with a single query.
+    """
+    max_batch_size = settings.OAUTH_INTROSPECTION_MAX_BATCH_SIZE
 
-        return redirect(new_url)
+    def post(self, request, *args, **kwargs):
+        tokens = request.data.get('tokens')
+        if not isinstance(tokens, list) or not all(isinstance(t, str) for t in tokens):
+            raise exceptions.ValidationError({'tokens': 'Expected a list of tokens.'})
+        if len(tokens) > self.max_batch_size:
+            raise exceptions.ValidationError({
+                'tokens': f'At most {self.max_batch_size} tokens may be introspected at once.'
+            })
+        return response.Response({'results': introspect_tokens(tokens)})
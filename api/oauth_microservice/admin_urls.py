@@ -0,0 +1,13 @@
+""" The admin console, included lazily by `oauth_microservice.urls`. """
+from django.conf import settings
+from django.conf.urls import url
+from django.contrib import admin
+
+
+urlpatterns = (
+    url(r'^', admin.site.urls),
+)
+
+# Name the admin site.
+admin.site.site_header = '{} Admin Panel'.format(settings.SITENAME)
+admin.site.site_title = admin.site.site_header
@@ -0,0 +1,264 @@
+"""
+ASGI config for oauth_microservice project.
+
+It exposes the ASGI callable as a module-level variable named ``application``,
+to be served with e.g.
+``gunicorn oauth_microservice.asgi:application -k uvicorn.workers.UvicornWorker``.
+
+Bearer token GET requests to the endpoints in `ASYNC_VIEWS` are answered on
+the event loop: cached tokens without touching the database, the rest with
+the ORM run in a pool of `ASGI['THREADS']` threads. A worker can keep
+thousands of validations in flight while only that many wait on the
+database. Every other request, including /user/ and /permissions/, goes to
+the regular sync Django app, which runs in the same pool.
+"""
+
+import asyncio
+import functools
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import parse_cookie
+
+from oauth_microservice.wsgi import application as wsgi_application  # Sets up Django.
+
+from audit.log import audit_log
+from oauth.authentication import (
+    check_revocations, get_cached_credentials, revocation_check_due, validate_bearer_token
+)
+from oauth.tokens import get_token_lookup_value
+from oauth_microservice.db.routers import reads_from_replicas, use_replicas
+from oauth_microservice.metrics import AUTHENTICATIONS, REQUEST_DURATION, get_view_name
+from oauth_microservice.renderers import FastJSONRenderer
+from users import async_views
+
+
+ASYNC_VIEWS = {
+    '/validate/': async_views.validate,
+    '/user/has_permission/': async_views.has_permission,
+}
+
+# What DRF answers requests that fail to authenticate with.
+NOT_AUTHENTICATED = (
+    401,
+    {'detail': 'Authentication credentials were not provided.'},
+    [(b'www-authenticate', b'Bearer realm="api"')],
+)
+
+
+def call_with_connections(func, *args, replicas=False):
+    """ Run `func` the way Django runs a request in a thread: with database
+    connections that are fit for use, and reads sent to the replicas if
+    `replicas` (see `ReplicaRoutingMiddleware`).
+    """
+    close_old_connections()
+    use_replicas(replicas)
+    try:
+        return func(*args)
+    finally:
+        use_replicas(False)
+        close_old_connections()
+
+
+def get_wsgi_environ(scope, body):
+    """ The WSGI environ for an ASGI HTTP request. """
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f'HTTP/{scope["http_version"]}',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+        environ['REMOTE_PORT'] = str(scope['client'][1])
+
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        value = value.decode('latin-1')
+        if name in environ:
+            value = f'{environ[name]},{value}'
+        environ[name] = value
+    return environ
+
+
+def run_wsgi_application(wsgi_app, environ):
+    """ Call the WSGI app, returning its status code, headers and body. """
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [
+            (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers
+        ]
+
+    result = wsgi_app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        # Django closes the request (and its database connections) here.
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], body
+
+
+class AsyncRequest(object):
+    """ The little of a request that the async views need. """
+
+    def __init__(self, scope, executor):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.query = dict(
+            parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True)
+        )
+        self.headers = {
+            name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers']
+        }
+        self.cookies = parse_cookie(self.headers.get('cookie', ''))
+        self.replicas = reads_from_replicas(self.method, self.path, self.cookies)
+        self.executor = executor
+        self.remote_addr = scope['client'][0] if scope.get('client') else None
+        self.user = None
+        self.auth = None
+
+    def get_bearer_token(self):
+        auth = self.headers.get('authorization', '').split()
+        if len(auth) == 2 and auth[0].lower() == 'bearer':
+            return auth[1]
+        return None
+
+    async def run_in_thread(self, func, *args):
+        loop = asyncio.get_event_loop()
+        call = functools.partial(call_with_connections, func, *args, replicas=self.replicas)
+        return await loop.run_in_executor(self.executor, call)
+
+    async def authenticate(self):
+        """ Authenticate the bearer token like
+        `oauth.authentication.CachedOAuth2Authentication`, and return whether
+        it is valid.
+        """
+        token = self.get_bearer_token()
+        lookup_value = get_token_lookup_value(token)
+        if lookup_value is None:
+            AUTHENTICATIONS.labels('bearer', 'failure').inc()
+            credentials = None
+        else:
+            if revocation_check_due():
+                await self.run_in_thread(check_revocations)
+            credentials = get_cached_credentials(lookup_value)
+            if credentials is None:
+                credentials = await self.run_in_thread(validate_bearer_token, token, lookup_value)
+
+        if credentials is None:
+            audit_log.record('token.rejected', remote_addr=self.remote_addr, path=self.path)
+            return False
+        self.user, self.auth = credentials
+        return True
+
+
+class ASGIApplication(object):
+
+    def __init__(self, wsgi_app, views, executor):
+        self.wsgi_app = wsgi_app
+        self.views = views
+        self.executor = executor
+        self.renderer = FastJSONRenderer()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f'Unsupported ASGI scope type: {scope["type"]}')
+
+        view = self.views.get(scope['path']) if scope['method'] == 'GET' else None
+        if view is not None:
+            request = AsyncRequest(scope, self.executor)
+            if request.get_bearer_token() is not None:
+                started = time.perf_counter()
+                response = await self.handle(view, request)
+                if response is not None:
+                    status, data, headers = response
+                    await self.send_json(send, status, data, headers)
+                    REQUEST_DURATION.labels(
+                        get_view_name(view, request.method), request.method, str(status)
+                    ).observe(time.perf_counter() - started)
+                    # Django flushes the audit log once its requests finish;
+                    # these never reach it.
+                    if audit_log.is_due():
+                        await request.run_in_thread(audit_log.flush)
+                    return
+
+        await self.call_django(scope, receive, send)
+
+    async def handle(self, view, request):
+        if not await request.authenticate():
+            return NOT_AUTHENTICATED
+        response = await view(request)
+        if response is None:
+            return None
+        status, data = response
+        return status, data, []
+
+    async def call_django(self, scope, receive, send):
+        body = b''
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        loop = asyncio.get_event_loop()
+        status, headers, body = await loop.run_in_executor(
+            self.executor, run_wsgi_application, self.wsgi_app, get_wsgi_environ(scope, body)
+        )
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def send_json(self, send, status, data, headers):
+        body = self.renderer.render(data)
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                *headers,
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+application = ASGIApplication(
+    wsgi_application,
+    ASYNC_VIEWS,
+    ThreadPoolExecutor(max_workers=settings.ASGI['THREADS'], thread_name_prefix='asgi'),
+)
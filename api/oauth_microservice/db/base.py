@@ -0,0 +1,114 @@
+""" A PostgreSQL backend with connection health checks and an optional
+connection pool shared by the threads of a worker process.
+
+Select it with `'ENGINE': 'oauth_microservice.db'` and configure it with two
+extra keys in the database settings:
+
+- `CONN_HEALTH_CHECKS`: test a persistent connection before its first use in
+  each request, and reconnect if the server has dropped it.
+- `POOL`: `None`, or a dict with `SIZE`, `MAX_OVERFLOW`, `TIMEOUT` and
+  `CHECK_AFTER` (see `ConnectionPool`). Use it with `CONN_MAX_AGE = 0` so
+  connections go back to the pool at the end of every request.
+
+Every connection also counts its queries for the metrics middleware.
+"""
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+from oauth_microservice.utils.pool import ConnectionPool, PoolTimeout, get_pool
+
+from .utils import CountingCursorDebugWrapper, CountingCursorWrapper
+
+
+Database = base.Database
+
+
+def ping(connection):
+    try:
+        connection.cursor().execute('SELECT 1')
+    except Database.Error:
+        return False
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_pending = False
+        self.query_count = 0
+        self.query_duration = 0.0
+
+    def make_cursor(self, cursor):
+        return CountingCursorWrapper(cursor, self)
+
+    def make_debug_cursor(self, cursor):
+        return CountingCursorDebugWrapper(cursor, self)
+
+    @property
+    def pool(self):
+        pool_settings = self.settings_dict.get('POOL')
+        if not pool_settings:
+            return None
+
+        return get_pool(self.alias, lambda: self.make_pool(pool_settings))
+
+    def make_pool(self, pool_settings):
+        conn_params = self.get_connection_params()
+        return ConnectionPool(
+            lambda: Database.connect(**conn_params),
+            size=pool_settings['SIZE'],
+            max_overflow=pool_settings['MAX_OVERFLOW'],
+            timeout=pool_settings['TIMEOUT'],
+            check=ping if self.settings_dict.get('CONN_HEALTH_CHECKS') else None,
+            check_after=pool_settings['CHECK_AFTER'],
+        )
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+
+        try:
+            connection = pool.checkout()
+        except PoolTimeout as e:
+            raise Database.OperationalError(str(e))
+
+        # The same as the base backend, for connections that may have been
+        # opened by another thread.
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+        pool = self.pool
+        if pool is None or self.connection is None:
+            return super()._close()
+
+        discard = False
+        try:
+            if self.connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                self.connection.rollback()
+        except Database.Error:
+            discard = True
+        pool.checkin(self.connection, discard=discard)
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        # Called at the start and end of every request. The connection is
+        # only tested once the next request actually needs it.
+        if self.connection is not None and self.settings_dict.get('CONN_HEALTH_CHECKS'):
+            self.health_check_pending = True
+
+    def ensure_connection(self):
+        if self.health_check_pending:
+            self.health_check_pending = False
+            if self.connection is not None and not self.in_atomic_block and not self.is_usable():
+                self.close()
+        super().ensure_connection()
@@ -0,0 +1,107 @@
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
+
+
+PRIMARY = 'default'
+
+_state = threading.local()
+
+
+def use_replicas(enabled=True):
+    """ Allow (or stop) this thread's reads going to the replicas. Writes
+    always go to the primary, and pin the thread's later reads to it.
+    """
+    _state.use_replicas = enabled
+    _state.wrote = False
+
+
+def wrote_to_primary():
+    return getattr(_state, 'wrote', False)
+
+
+def reads_use_replicas():
+    """ Whether this thread's reads currently go to a replica. """
+    return (
+        bool(settings.DATABASE_REPLICAS)
+        and getattr(_state, 'use_replicas', False)
+        and not wrote_to_primary()
+    )
+
+
+@contextmanager
+def primary_reads():
+    """ Send this thread's reads to the primary for the duration of the
+    block, e.g. to retry a lookup that a lagging replica may have missed.
+    """
+    enabled = getattr(_state, 'use_replicas', False)
+    _state.use_replicas = False
+    try:
+        yield
+    finally:
+        _state.use_replicas = enabled
+
+
+def reads_from_replicas(method, path, cookies):
+    """ Whether a request may read from the replicas: a safe request to one
+    of `settings.REPLICA_READ_PATHS`, from a client that isn't pinned to the
+    primary (see `ReplicaRoutingMiddleware`). `path` excludes the script name.
+    """
+    return (
+        method in ('GET', 'HEAD', 'OPTIONS')
+        and path.startswith(tuple(settings.REPLICA_READ_PATHS))
+        and ReplicaRoutingMiddleware.cookie_name not in cookies
+    )
+
+
+class ReplicaRouter(object):
+    """ Sends reads to a random replica from `settings.DATABASE_REPLICAS`,
+    but only where `use_replicas()` has allowed it (see
+    `ReplicaRoutingMiddleware`), and only until the thread writes.
+    Everything else uses the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if reads_use_replicas():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replicas get the schema through replication.
+        return db == PRIMARY
+
+
+class ReplicaRoutingMiddleware(MiddlewareMixin):
+    """ Let safe requests to `settings.REPLICA_READ_PATHS` read from the
+    replicas.
+
+    A client whose request wrote to the primary gets a cookie that keeps its
+    reads on the primary for `settings.REPLICA_PIN_SECONDS`, so it doesn't
+    miss its own writes while the replicas catch up.
+    """
+    cookie_name = 'pin_primary'
+
+    def process_request(self, request):
+        use_replicas(reads_from_replicas(request.method, request.path_info, request.COOKIES))
+
+    def process_response(self, request, response):
+        wrote = wrote_to_primary() or request.method not in ('GET', 'HEAD', 'OPTIONS')
+        if settings.DATABASE_REPLICAS and wrote:
+            response.set_cookie(
+                self.cookie_name, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True
+            )
+        use_replicas(False)
+        return response
@@ -0,0 +1,32 @@
+import time
+
+from django.db.backends.utils import CursorDebugWrapper, CursorWrapper
+
+
+class QueryCountingMixin(object):
+    """ Adds the number and duration of the queries a cursor runs to its
+    connection's `query_count` and `query_duration`, which the metrics
+    middleware reads. Cheaper than the debug cursor, which also keeps the SQL.
+    """
+
+    def _count(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self.db.query_count += 1
+            self.db.query_duration += time.perf_counter() - started
+
+    def execute(self, sql, params=None):
+        return self._count(super().execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self._count(super().executemany, sql, param_list)
+
+
+class CountingCursorWrapper(QueryCountingMixin, CursorWrapper):
+    pass
+
+
+class CountingCursorDebugWrapper(QueryCountingMixin, CursorDebugWrapper):
+    pass
@@ -0,0 +1,11 @@
+""" The schema and API docs, included lazily by `oauth_microservice.urls`
+since building them imports coreapi.
+"""
+from django.conf.urls import url
+
+from rest_framework.documentation import include_docs_urls
+
+
+urlpatterns = (
+    url(r'^', include_docs_urls(title='OAuth Microservice')),
+)
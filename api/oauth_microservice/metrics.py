@@ -0,0 +1,143 @@
+""" Prometheus metrics.
+
+When several worker processes serve the app (e.g. gunicorn), set the
+`prometheus_multiproc_dir` environment variable to an empty directory that
+every worker can write to. Each worker then writes its metrics there and
+`/metrics/` adds them up.
+"""
+import os
+import time
+
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_in, user_login_failed
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.utils.deprecation import MiddlewareMixin
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest,
+    multiprocess,
+)
+
+
+REQUEST_DURATION = Histogram(
+    'oauth_http_request_duration_seconds',
+    'Time spent handling requests, by view.',
+    ('view', 'method', 'status'),
+)
+REQUEST_DB_QUERIES = Histogram(
+    'oauth_http_request_db_queries',
+    'Database queries run per request, by view.',
+    ('view',),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, float('inf')),
+)
+REQUEST_DB_DURATION = Histogram(
+    'oauth_http_request_db_duration_seconds',
+    'Time spent in database queries per request, by view.',
+    ('view',),
+)
+AUTHENTICATIONS = Counter(
+    'oauth_authentications_total',
+    'Authentication attempts, by method and outcome.',
+    ('method', 'outcome'),
+)
+TOKENS_ISSUED = Counter(
+    'oauth_tokens_issued_total',
+    'Access tokens issued, by grant type.',
+    ('grant_type',),
+)
+AUDIT_EVENTS = Counter(
+    'oauth_audit_events_total',
+    'Audit events written, dropped because the buffer was full, or failed to write.',
+    ('outcome',),
+)
+
+UNRESOLVED_VIEW = '<unresolved>'
+
+
+def get_view_name(view_func, method):
+    """ A stable name for the view that handles a request, e.g.
+    "users.views.validate", "users.views.UserViewSet.list" or
+    "oauth.views.RedirectToAuthorizationView".
+    """
+    view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    if view_class is None:
+        return f'{view_func.__module__}.{view_func.__name__}'
+
+    name = f'{view_class.__module__}.{view_class.__name__}'
+    # Viewsets map each method to an action.
+    actions = getattr(view_func, 'actions', None)
+    if actions and method.lower() in actions:
+        name = f'{name}.{actions[method.lower()]}'
+    return name
+
+
+def get_query_stats():
+    """ The queries run so far by this thread's connections, as reported by
+    backends that count them (see `oauth_microservice.db`).
+    """
+    count = duration = 0
+    for connection in connections.all():
+        count += getattr(connection, 'query_count', 0)
+        duration += getattr(connection, 'query_duration', 0)
+    return count, duration
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    """ Record the latency, query count and query time of every request,
+    labelled with the view that handled it.
+    """
+
+    def process_request(self, request):
+        request._metrics_started = time.perf_counter()
+        request._metrics_queries = get_query_stats()
+        request._metrics_view = UNRESOLVED_VIEW
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_view = get_view_name(view_func, request.method)
+
+    def process_response(self, request, response):
+        started = getattr(request, '_metrics_started', None)
+        if started is None:
+            # An earlier middleware answered without reaching this one.
+            return response
+
+        view = request._metrics_view
+        REQUEST_DURATION.labels(view, request.method, str(response.status_code)).observe(
+            time.perf_counter() - started
+        )
+        count, duration = get_query_stats()
+        count_before, duration_before = request._metrics_queries
+        REQUEST_DB_QUERIES.labels(view).observe(count - count_before)
+        REQUEST_DB_DURATION.labels(view).observe(duration - duration_before)
+        return response
+
+
+def metrics(request):
+    """ The scrape endpoint. Requires `Authorization: Bearer <token>` with
+    `METRICS['AUTH_TOKEN']`, and refuses every scrape until it is set.
+    """
+    token = settings.METRICS['AUTH_TOKEN']
+    if not token or not constant_time_compare(
+        request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'
+    ):
+        return HttpResponseForbidden()
+
+    if 'prometheus_multiproc_dir' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def count_login(sender, **kwargs):
+    AUTHENTICATIONS.labels('login', 'success').inc()
+
+
+def count_failed_login(sender, **kwargs):
+    AUTHENTICATIONS.labels('login', 'failure').inc()
+
+
+user_logged_in.connect(count_login, dispatch_uid='metrics.count_login')
+user_login_failed.connect(count_failed_login, dispatch_uid='metrics.count_failed_login')
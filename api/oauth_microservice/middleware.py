@@ -0,0 +1,65 @@
+""" A fast lane for bearer token API requests.
+
+Requests with an `Authorization: Bearer` header to `settings.API_FAST_LANE_PATHS`
+are authenticated by their token alone, so they have no use for the session,
+CSRF, auth or messages middleware. The classes here replace those middleware
+in `MIDDLEWARE_CLASSES` and do nothing for such requests; every other request
+(the console, the login pages, `/o/authorize/`, session-authenticated browsing
+of the API in development) goes through them as usual.
+"""
+from django.conf import settings
+from django.contrib.auth import middleware as auth_middleware
+from django.contrib.messages import middleware as messages_middleware
+from django.contrib.sessions import middleware as sessions_middleware
+from django.middleware import csrf
+
+
+def uses_fast_lane(request):
+    fast_lane = getattr(request, '_api_fast_lane', None)
+    if fast_lane is None:
+        fast_lane = request._api_fast_lane = (
+            request.path_info.startswith(tuple(settings.API_FAST_LANE_PATHS))
+            and request.META.get('HTTP_AUTHORIZATION', '')[:7].lower() == 'bearer '
+        )
+    return fast_lane
+
+
+def _skip_hook(name, passthrough):
+    def hook(self, request, *args):
+        if uses_fast_lane(request):
+            # Response hooks hand the response back untouched.
+            return args[-1] if passthrough else None
+        return getattr(super(self.fast_lane_base, self), name)(request, *args)
+    hook.__name__ = name
+    return hook
+
+
+def skip_on_fast_lane(middleware_class):
+    """ Returns a subclass of an (old-style) middleware that does nothing for
+    fast lane requests.
+    """
+    attrs = {
+        '__module__': __name__,
+        '__doc__': f'`{middleware_class.__name__}`, skipped for fast lane requests.',
+    }
+    for name, passthrough in (
+        ('process_request', False),
+        ('process_view', False),
+        ('process_exception', False),
+        ('process_template_response', True),
+        ('process_response', True),
+    ):
+        if hasattr(middleware_class, name):
+            attrs[name] = _skip_hook(name, passthrough)
+    subclass = type(middleware_class.__name__, (middleware_class,), attrs)
+    subclass.fast_lane_base = subclass
+    return subclass
+
+
+SessionMiddleware = skip_on_fast_lane(sessions_middleware.SessionMiddleware)
+CsrfViewMiddleware = skip_on_fast_lane(csrf.CsrfViewMiddleware)
+AuthenticationMiddleware = skip_on_fast_lane(auth_middleware.AuthenticationMiddleware)
+SessionAuthenticationMiddleware = skip_on_fast_lane(
+    auth_middleware.SessionAuthenticationMiddleware
+)
+MessageMiddleware = skip_on_fast_lane(messages_middleware.MessageMiddleware)
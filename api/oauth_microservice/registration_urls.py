@@ -0,0 +1,17 @@
+""" The sign up pages, included lazily by `oauth_microservice.urls`. Sign
+ups are closed, so /register/ only redirects to the closed page.
+"""
+from django.conf.urls import url
+from django.views.generic.base import RedirectView, TemplateView
+
+
+urlpatterns = (
+    url(r'^register/$',
+        RedirectView.as_view(pattern_name='registration_disallowed'),
+        name='registration_register'),
+    url(r'^register/closed/$',
+        TemplateView.as_view(
+            template_name='registration/registration_closed.html'
+        ),
+        name='registration_disallowed'),
+)
@@ -1,7 +1,10 @@
 import os
 
+from django.utils.functional import SimpleLazyObject
+
 from .utils import (
-    load_permissions, load_groups, load_managed_user_permissions, load_managed_user_groups
+    load_permissions, load_groups, load_managed_user_permissions, load_managed_user_groups,
+    parse_database_url,
 )
 
 
@@ -28,6 +31,10 @@ ALLOWED_HOSTS = os.environ.get('ALLOWED_HOSTS', '*').split(',')
 
 # Application definition
 
+# API-only workers serve the API and the OAuth endpoints but not the admin
+# console, the registration pages or the API docs, so they boot faster.
+API_ONLY = os.environ.get('API_ONLY', 'false').lower() == 'true'
+
 INSTALLED_APPS = [
     'django.contrib.admin',
     'django.contrib.auth',
@@ -41,16 +48,25 @@ INSTALLED_APPS = [
     'rest_framework',
 
     # Project apps.
+    'audit',
     'managed_users',
     'oauth',
     'users',
 ]
+if API_ONLY:
+    INSTALLED_APPS.remove('django.contrib.admin')
+
+# The benchmark commands seed and delete data, so they are only installed in
+# development or when explicitly enabled.
+BENCHMARKS_ENABLED = os.environ.get('BENCHMARKS_ENABLED', str(DEBUG)).lower() == 'true'
+if BENCHMARKS_ENABLED:
+    INSTALLED_APPS.append('benchmarks')
 
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 25,
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'oauth2_provider.contrib.rest_framework.OAuth2Authentication',
+        'oauth.authentication.CachedOAuth2Authentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -60,10 +76,14 @@ REST_FRAMEWORK = {
     ),
 }
 
-if not DEBUG:
-    # Don't include the browsable API renderer outside of Development.
-    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = (
-        'rest_framework.renderers.JSONRenderer',
+# JSON is rendered with orjson when it's installed (see oauth_microservice.renderers).
+REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = (
+    'oauth_microservice.renderers.FastJSONRenderer',
+)
+if DEBUG:
+    # Only include the browsable API renderer in Development.
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] += (
+        'rest_framework.renderers.BrowsableAPIRenderer',
     )
 
 if DEBUG:
@@ -81,20 +101,131 @@ OAUTH2_PROVIDER = {
     'SCOPES': {
         'read': 'Global read access',
         'write': 'Global write access',
-    }
+        'introspection': 'Introspect other access tokens',
+    },
+    # Introspection must be requested explicitly, so it's left out of the defaults.
+    'DEFAULT_SCOPES': ['read', 'write'],
+    'OAUTH2_VALIDATOR_CLASS': 'oauth.validators.OAuth2Validator',
+}
+
+# Signed JWT access tokens. When one or more RSA private keys (PEM files,
+# separated by ";") are given, access tokens are issued as JWTs signed with the
+# first key. All keys are published at /o/jwks/ so that resource servers can
+# verify tokens without calling back to this service.
+OAUTH_JWT = {
+    'KEYS': [path for path in os.environ.get('OAUTH_JWT_KEYS', '').split(';') if path],
+    'ALGORITHM': 'RS256',
+    'ISSUER': os.environ.get('OAUTH_JWT_ISSUER', 'oauth-microservice'),
 }
+if OAUTH_JWT['KEYS']:
+    OAUTH2_PROVIDER['OAUTH2_SERVER_CLASS'] = 'oauth.tokens.JWTServer'
+
+# The client ids of the applications (e.g. API gateways) that may be granted
+# the `introspection` scope and call /o/introspect/, comma separated. Nobody
+# else can request the scope or introspect tokens with it.
+OAUTH_INTROSPECTION_CLIENT_IDS = [
+    client_id.strip()
+    for client_id in os.environ.get('OAUTH_INTROSPECTION_CLIENT_IDS', '').split(',')
+    if client_id.strip()
+]
+# The most tokens that can be checked with one call to /o/introspect/batch/.
+OAUTH_INTROSPECTION_MAX_BATCH_SIZE = int(os.environ.get('OAUTH_INTROSPECTION_MAX_BATCH_SIZE', 1000))
 OAUTH_REDIRECT_PARAM = 'next'
 
+# Validated access tokens are cached per worker process to avoid a database
+# lookup on every API request. Revoking, deleting or changing a live token
+# evicts it in the process that made the change, and bumps a version row that
+# every other process reads at most once per REVOCATION_CHECK_INTERVAL
+# seconds, after which it validates its cached tokens again. That interval
+# bounds how long a revocation takes to apply everywhere. Set the max size to
+# 0 to disable the cache.
+OAUTH_TOKEN_CACHE = {
+    'MAX_SIZE': int(os.environ.get('OAUTH_TOKEN_CACHE_MAX_SIZE', 10000)),
+    'TTL': int(os.environ.get('OAUTH_TOKEN_CACHE_TTL', 60)),
+    'REVOCATION_CHECK_INTERVAL': float(
+        os.environ.get('OAUTH_TOKEN_CACHE_REVOCATION_CHECK_INTERVAL', 1)
+    ),
+}
+
+# OAuth applications are cached per worker process by client id, so that
+# /o/authorize/ and /o/token/ don't load them on every request. Saving or
+# deleting an application evicts it in the process that made the change;
+# other processes pick it up within the TTL.
+OAUTH_APPLICATION_CACHE = {
+    'MAX_SIZE': int(os.environ.get('OAUTH_APPLICATION_CACHE_MAX_SIZE', 1000)),
+    'TTL': int(os.environ.get('OAUTH_APPLICATION_CACHE_TTL', 60)),
+}
+
+# Under ASGI (oauth_microservice.asgi), the threads each worker runs database
+# work and the Django app in.
+ASGI = {
+    'THREADS': int(os.environ.get('ASGI_THREADS', 32)),
+}
+
+# Expired grants and tokens are deleted by the clear_expired_tokens command in
+# batches of BATCH_SIZE rows, PAUSE seconds apart. Refresh tokens are kept
+# until their access token has been expired for REFRESH_TOKEN_RETENTION seconds
+# (forever when unset). With INTERVAL set, each web process also runs the
+# cleanup every INTERVAL seconds.
+TOKEN_CLEANUP = {
+    'BATCH_SIZE': int(os.environ.get('TOKEN_CLEANUP_BATCH_SIZE', 500)),
+    'PAUSE': float(os.environ.get('TOKEN_CLEANUP_PAUSE', 0.1)),
+    'REFRESH_TOKEN_RETENTION': (
+        int(os.environ['TOKEN_CLEANUP_REFRESH_TOKEN_RETENTION'])
+        if os.environ.get('TOKEN_CLEANUP_REFRESH_TOKEN_RETENTION') else None
+    ),
+    'INTERVAL': int(os.environ.get('TOKEN_CLEANUP_INTERVAL', 0)),
+}
+
+# Audit log of issued tokens, authorization decisions, rejected bearer tokens
+# and created managed users (see audit.log). Each worker buffers events and
+# writes them in batches.
+AUDIT_LOG = {
+    # "database", "file" (JSON lines in DIRECTORY) or empty to turn it off.
+    'BACKEND': os.environ.get('AUDIT_LOG_BACKEND', ''),
+    'DIRECTORY': os.environ.get('AUDIT_LOG_DIRECTORY', os.path.join(BASE_DIR, 'audit_log')),
+    # The buffer is written once it holds FLUSH_SIZE events or its oldest
+    # event is FLUSH_INTERVAL seconds old.
+    'FLUSH_SIZE': int(os.environ.get('AUDIT_LOG_FLUSH_SIZE', 100)),
+    'FLUSH_INTERVAL': float(os.environ.get('AUDIT_LOG_FLUSH_INTERVAL', 5)),
+    # Events recorded while the buffer holds this many are dropped.
+    'MAX_EVENTS': int(os.environ.get('AUDIT_LOG_MAX_EVENTS', 10000)),
+}
+
+METRICS = {
+    # Record request latency, query and authentication metrics, and publish
+    # them at /metrics/ for Prometheus.
+    'ENABLED': os.environ.get('METRICS_ENABLED', 'true').lower() == 'true',
+    # Scrapes must send "Authorization: Bearer <token>". Until it is set,
+    # metrics are recorded but /metrics/ refuses every scrape.
+    'AUTH_TOKEN': os.environ.get('METRICS_AUTH_TOKEN') or None,
+}
+
+# Bearer token requests to these paths skip the session, CSRF, auth and
+# messages middleware (see oauth_microservice.middleware). Set it to an empty
+# string to send every request through the full stack.
+API_FAST_LANE_PATHS = [
+    path.strip()
+    for path in os.environ.get(
+        'API_FAST_LANE_PATHS', '/validate/,/user/,/permissions/,/managed_users/,/o/introspect/'
+    ).split(',')
+    if path.strip()
+]
+
 MIDDLEWARE_CLASSES = [
+    'oauth_microservice.db.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'oauth_microservice.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.auth.middleware.SessionAuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
+    'oauth_microservice.middleware.CsrfViewMiddleware',
+    'oauth_microservice.middleware.AuthenticationMiddleware',
+    'oauth_microservice.middleware.SessionAuthenticationMiddleware',
+    'oauth_microservice.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+if METRICS['ENABLED']:
+    # Outermost, so the whole request is timed.
+    MIDDLEWARE_CLASSES.insert(0, 'oauth_microservice.metrics.MetricsMiddleware')
 
 ROOT_URLCONF = 'oauth_microservice.urls'
 
@@ -147,17 +278,74 @@ if not DEBUG and USE_SSL:
 
 # Database
 
+# Connections are kept open between requests for DB_CONN_MAX_AGE seconds
+# ("none" keeps them open for good, 0 closes them after every request) and
+# tested before their first use in a request when DB_CONN_HEALTH_CHECKS is on.
+#
+# Threaded workers can share a bounded pool of connections instead, with
+# DB_POOL_ENABLED. Pooled connections go back to the pool after every request.
+DB_CONN_MAX_AGE = os.environ.get('DB_CONN_MAX_AGE', '60')
+DB_POOL_ENABLED = os.environ.get('DB_POOL_ENABLED', 'false').lower() == 'true'
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'oauth_microservice.db',
         'NAME': os.environ['DATABASE_NAME'],
         'USER': os.environ['DB_USERNAME'],
         'PASSWORD': os.environ['DB_PASSWORD'],
         'HOST': os.environ['DB_HOST'],
         'PORT': os.environ['DB_PORT'],
+        'CONN_MAX_AGE': (
+            0 if DB_POOL_ENABLED
+            else None if DB_CONN_MAX_AGE.lower() == 'none'
+            else int(DB_CONN_MAX_AGE)
+        ),
+        'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', 'true').lower() == 'true',
+        'POOL': {
+            # Connections kept open, and the most opened on top of those under load.
+            'SIZE': int(os.environ.get('DB_POOL_SIZE', 10)),
+            'MAX_OVERFLOW': int(os.environ.get('DB_POOL_MAX_OVERFLOW', 10)),
+            # Seconds to wait for a free connection before failing the request.
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+            # Idle connections older than this many seconds are tested first.
+            'CHECK_AFTER': float(os.environ.get('DB_POOL_CHECK_AFTER', 10)),
+        } if DB_POOL_ENABLED else None,
     }
 }
 
+# Read replicas of the default database, as comma separated "host[:port]"s
+# with the same name and credentials, and as comma separated database URLs
+# for any that differ (see `parse_database_url`). Safe requests to
+# REPLICA_READ_PATHS read from a random replica, unless the client wrote
+# within the last REPLICA_PIN_SECONDS. Everything else, and every write, uses
+# the default database.
+DB_REPLICA_HOSTS = [
+    host.strip() for host in os.environ.get('DB_REPLICA_HOSTS', '').split(',') if host.strip()
+]
+DB_REPLICA_URLS = [
+    url.strip() for url in os.environ.get('DB_REPLICA_URLS', '').split(',') if url.strip()
+]
+_replicas = [
+    {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+    }
+    for host, _, port in (replica.partition(':') for replica in DB_REPLICA_HOSTS)
+]
+_replicas += [parse_database_url(url, DATABASES['default']) for url in DB_REPLICA_URLS]
+for number, replica in enumerate(_replicas, 1):
+    DATABASES[f'replica_{number}'] = {**replica, 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['oauth_microservice.db.routers.ReplicaRouter']
+REPLICA_READ_PATHS = [
+    path.strip()
+    for path in os.environ.get('REPLICA_READ_PATHS', '/validate/,/user/,/permissions/').split(',')
+    if path.strip()
+]
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))
+
 
 # Password validation
 
@@ -201,11 +389,39 @@ ACCOUNT_ACTIVATION_DAYS = 7  # One-week activation window
 REGISTRATION_OPEN = False
 LOGIN_URL = '/permissions/'
 
+# The Unicode tables behind the homoglyph checks of managed users are
+# compiled into an index that every worker maps on first use (see
+# oauth_microservice.utils.confusables).
+CONFUSABLES = {
+    # The directory with categories.json and confusables.json.
+    'DATA_DIR': os.environ.get('CONFUSABLES_DATA_DIR', BASE_DIR),
+    # Where the compiled index is written. It's rebuilt whenever it's older
+    # than the JSON files.
+    'INDEX_PATH': os.environ.get(
+        'CONFUSABLES_INDEX_PATH', os.path.join(BASE_DIR, 'confusables.idx')
+    ),
+}
+
 # Permissions Settings
 
 PERMISSIONS_PATH = os.environ.get('PERMISSIONS_PATH', os.path.join(BASE_DIR, 'permissions.yaml'))
-DEFAULT_PERMISSIONS = load_permissions(PERMISSIONS_PATH)
-DEFAULT_GROUPS = load_groups(PERMISSIONS_PATH)
+# The permissions file is parsed once per process. Running processes pick up
+# changes to it when its modification time changes (checked at most every
+# PERMISSIONS_RELOAD_INTERVAL seconds) or when they receive the optional
+# PERMISSIONS_RELOAD_SIGNAL (e.g. SIGUSR2).
+PERMISSIONS_RELOAD_INTERVAL = int(os.environ.get('PERMISSIONS_RELOAD_INTERVAL', 5))
+PERMISSIONS_RELOAD_SIGNAL = os.environ.get('PERMISSIONS_RELOAD_SIGNAL', None)
+# The file isn't parsed until one of these is first used.
+DEFAULT_PERMISSIONS = SimpleLazyObject(lambda: load_permissions(PERMISSIONS_PATH))
+DEFAULT_GROUPS = SimpleLazyObject(lambda: load_groups(PERMISSIONS_PATH))
+
+# Checking many permissions at once with /user/has_permissions/. Checking
+# other users' permissions requires the permission below.
+PERMISSION_CHECK_OTHER_USERS_PERMISSION = os.environ.get(
+    'PERMISSION_CHECK_OTHER_USERS_PERMISSION', 'check_user_permissions'
+)
+PERMISSION_CHECK_MAX_CODENAMES = int(os.environ.get('PERMISSION_CHECK_MAX_CODENAMES', 100))
+PERMISSION_CHECK_MAX_USERS = int(os.environ.get('PERMISSION_CHECK_MAX_USERS', 1000))
 
 # Managed Users Settings
 
@@ -216,9 +432,18 @@ if ENABLE_REMOTE_USER_MANAGEMENT:
         'MANAGING_USER_PERMISSION': os.environ['MANAGING_USER_PERMISSION'],
         # A list of permissions to give newly created managed users.
         'MANAGED_USERS': {
-            'DEFAULT_GROUPS': load_managed_user_groups(PERMISSIONS_PATH),
-            'DEFAULT_PERMISSIONS': load_managed_user_permissions(PERMISSIONS_PATH),
-        }
+            'DEFAULT_GROUPS': SimpleLazyObject(
+                lambda: load_managed_user_groups(PERMISSIONS_PATH)
+            ),
+            'DEFAULT_PERMISSIONS': SimpleLazyObject(
+                lambda: load_managed_user_permissions(PERMISSIONS_PATH)
+            ),
+        },
+        # How long the resolved default permissions and groups are cached
+        # by each process, in seconds.
+        'DEFAULTS_CACHE_TTL': int(os.environ.get('MANAGED_USERS_DEFAULTS_CACHE_TTL', 300)),
+        # The most users that can be created with one bulk request.
+        'MAX_BULK_CREATE': int(os.environ.get('MANAGED_USERS_MAX_BULK_CREATE', 1000)),
     }
 else:
     REMOTE_USER_MANAGEMENT = None
@@ -233,3 +458,23 @@ EMAIL_HOST_PASSWORD = os.environ['EMAIL_HOST_PASSWORD']
 EMAIL_TIMEOUT = 10
 EMAIL_USE_TLS = True if ENVIRONMENT.startswith('prod') else False
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
+
+# Outgoing emails (e.g. managed user welcome emails) are queued in the database
+# and sent by the `send_queued_email` worker command instead of during requests.
+# Only enable it where that worker runs (e.g. the `outbox` compose service), or
+# the queued emails are never sent.
+EMAIL_OUTBOX = {
+    'ENABLED': os.environ.get('EMAIL_OUTBOX_ENABLED', 'false').lower() == 'true',
+    # The most emails sent over one mail connection.
+    'BATCH_SIZE': int(os.environ.get('EMAIL_OUTBOX_BATCH_SIZE', 100)),
+    # Failed emails are retried with an exponential backoff starting at
+    # RETRY_DELAY seconds, and given up on after MAX_ATTEMPTS.
+    'MAX_ATTEMPTS': int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS', 8)),
+    'RETRY_DELAY': int(os.environ.get('EMAIL_OUTBOX_RETRY_DELAY', 30)),
+    'MAX_RETRY_DELAY': int(os.environ.get('EMAIL_OUTBOX_MAX_RETRY_DELAY', 3600)),
+    # How long a worker may take to send a batch before another worker may
+    # pick up the same emails.
+    'LEASE': int(os.environ.get('EMAIL_OUTBOX_LEASE', 300)),
+    # How often the worker checks for new emails when run with --loop.
+    'POLL_INTERVAL': float(os.environ.get('EMAIL_OUTBOX_POLL_INTERVAL', 5)),
+}
@@ -1,10 +1,17 @@
 from django.conf import settings
 from django.conf.urls import url, include
-from django.contrib import admin
-from django.views.generic.base import TemplateView
 
-from rest_framework.documentation import include_docs_urls
-from registration import views
+from oauth_microservice import metrics, views as service_views
+
+
+def lazy_include(module):
+    """ Like `include()`, but the module isn't imported when the URLconf is
+    loaded. It is imported by the first request that falls through to it, or
+    by the first `reverse()` of any URL, since reversing populates the whole
+    resolver. This only keeps it out of worker boot; `settings.API_ONLY`
+    leaves it out altogether.
+    """
+    return (module, None, None)
 
 
 if settings.ENABLE_REMOTE_USER_MANAGEMENT:
@@ -12,6 +19,26 @@ if settings.ENABLE_REMOTE_USER_MANAGEMENT:
 else:
     managed_users_urls = []
 
+if settings.METRICS['ENABLED']:
+    metrics_urls = (url(r'^metrics/$', metrics.metrics, name='metrics'),)
+else:
+    metrics_urls = []
+
+# The pages people browse to, which API-only workers leave out.
+if settings.API_ONLY:
+    site_urls = []
+else:
+    site_urls = (
+        # Django-Registration views
+        url(r'^', lazy_include('oauth_microservice.registration_urls')),
+
+        # Django Admin Panel
+        url(r'^console/', lazy_include('oauth_microservice.admin_urls')),
+
+        # Schema and Docs
+        url(r'^docs/', lazy_include('oauth_microservice.docs_urls')),
+    )
+
 
 urlpatterns = (
     # API
@@ -23,14 +50,6 @@ urlpatterns = (
     # include the views here. This is because of a bug in the auto-included
     # auth views in django-registration v2.4, so we recreate all of the URLs here.
     url(r'^accounts/', include('django.contrib.auth.urls')),
-    url(r'^register/$',
-        views.RegistrationView.as_view(),
-        name='registration_register'),
-    url(r'^register/closed/$',
-        TemplateView.as_view(
-            template_name='registration/registration_closed.html'
-        ),
-        name='registration_disallowed'),
 
     # TODO: Remove base login since nothing needs it.
     # We only need token and console admin logins.
@@ -38,13 +57,9 @@ urlpatterns = (
     # OAuth Override Views
     url(r'^o/', include('oauth.urls')),
 
-    # Django Admin Panel
-    url(r'^console/', admin.site.urls),
+    # Service Status
+    url(r'^status/database/$', service_views.database_status, name='database_status'),
+    *metrics_urls,
 
-    # Schema and Docs
-    url(r'^docs/', include_docs_urls(title='OAuth Microservice'))
+    *site_urls,
 )
-
-# Name the admin site.
-admin.site.site_header = '{} Admin Panel'.format(settings.SITENAME)
-admin.site.site_title = admin.site.site_header
@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache(object):
+    """ A small, thread-safe, bounded LRU cache whose entries expire.
+
+    The cache lives in the memory of a single worker process, so it is only
+    suitable for data where a short window of staleness across workers is
+    acceptable (or where every writer evicts the entries it changes).
+
+    Notes
+    -----
+
+    - `max_size` bounds the number of entries; the least recently used entry
+      is evicted first when the cache is full.
+    - `ttl` is the default lifetime of an entry in seconds. A shorter
+      absolute expiry can be given per entry with `expires_at`.
+    - `hits`, `misses` and `evictions` are simple counters that can be read
+      with `stats()`. Expired entries count as both a miss and an eviction.
+    """
+
+    def __init__(self, max_size=1000, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[0] > time.time()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._data[key]
+                self.misses += 1
+                self.evictions += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, expires_at=None):
+        """ Store `value` under `key` until the default TTL elapses or until
+        `expires_at` (a UNIX timestamp), whichever comes first.
+        """
+        if self.max_size <= 0:
+            return
+
+        expiry = time.time() + self.ttl
+        if expires_at is not None:
+            expiry = min(expiry, expires_at)
+
+        with self._lock:
+            self._data[key] = (expiry, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        """ Evict `key` from the cache, returning whether it was present. """
+        with self._lock:
+            if self._data.pop(key, None) is None:
+                return False
+            self.evictions += 1
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        return {
+            'size': len(self._data),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,327 @@
+""" Homoglyph checks over a compact, memory-mapped index of the Unicode
+script and confusable characters tables.
+
+The functions mirror `confusable_homoglyphs` (which django-registration
+uses) and give the same results for the same `categories.json` and
+`confusables.json`. Instead of loading both files into dicts in every
+process, they are compiled once into an index file of sorted code point
+arrays. Each process maps the file read-only on first use, so its pages are
+shared by every worker on the host and only the parts that are looked up
+are ever read.
+"""
+import bisect
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from array import array
+
+
+CATEGORIES_FILE = 'categories.json'
+CONFUSABLES_FILE = 'confusables.json'
+
+MAGIC = b'CFX1'
+# Magic, then the number of ranges, single character keys, multi-character
+# keys, homoglyph entries and glyphs, and the length of the JSON metadata.
+HEADER = struct.Struct('=4s6I')
+
+# What `aliases_categories` returns for code points that aren't in any range.
+UNKNOWN = ('Unknown', 'Zzzz')
+
+
+def _uint_array(values):
+    # The index is read back with memoryview.cast('I'), in native byte order.
+    return array('I', values)
+
+
+def _pack_strings(strings):
+    """ UTF-8 encode `strings` into one blob, returning the blob and the
+    offsets of its `len(strings) + 1` boundaries.
+    """
+    blob = bytearray()
+    offsets = [0]
+    for string in strings:
+        blob += string.encode('utf-8')
+        offsets.append(len(blob))
+    return bytes(blob), offsets
+
+
+def compile_index(data_dir, path):
+    """ Compile the JSON tables in `data_dir` into an index file at `path`.
+
+    The file is written next to `path` and then moved into place, so
+    processes reading the old index are never handed a partial one.
+    """
+    with open(os.path.join(data_dir, CATEGORIES_FILE)) as f:
+        categories = json.load(f)
+    with open(os.path.join(data_dir, CONFUSABLES_FILE)) as f:
+        confusables = json.load(f)
+
+    ranges = sorted(categories['code_points_ranges'])
+    # Every glyph always comes with the same name, so entries only point
+    # at a glyph.
+    glyphs = {}
+    for homoglyphs in confusables.values():
+        for homoglyph in homoglyphs:
+            glyphs.setdefault((homoglyph['c'], homoglyph['n']), len(glyphs))
+
+    # Single characters, which are what the checks look up, are found by
+    # code point; longer keys by their UTF-8 bytes.
+    single = sorted((key for key in confusables if len(key) == 1), key=ord)
+    multi = sorted((key for key in confusables if len(key) != 1), key=lambda key: key.encode())
+    entries = []
+    key_offsets = [0]
+    for key in single + multi:
+        entries.extend(glyphs[(h['c'], h['n'])] for h in confusables[key])
+        key_offsets.append(len(entries))
+
+    multi_blob, multi_offsets = _pack_strings(multi)
+    glyph_blob, glyph_offsets = _pack_strings(glyph for glyph, _ in glyphs)
+    name_blob, name_offsets = _pack_strings(name for _, name in glyphs)
+    meta = json.dumps({
+        'aliases': categories['iso_15924_aliases'],
+        'categories': categories['categories'],
+    }).encode()
+    meta += b' ' * (-len(meta) % 4)
+
+    sections = [
+        meta,
+        _uint_array(start for start, _, _, _ in ranges),
+        _uint_array(end for _, end, _, _ in ranges),
+        _uint_array(alias << 16 | category for _, _, alias, category in ranges),
+        _uint_array(ord(key) for key in single),
+        _uint_array(key_offsets),
+        _uint_array(entries),
+        _uint_array(multi_offsets),
+        _uint_array(glyph_offsets),
+        _uint_array(name_offsets),
+        multi_blob,
+        glyph_blob,
+        name_blob,
+    ]
+    header = HEADER.pack(
+        MAGIC, len(ranges), len(single), len(multi), len(entries), len(glyphs), len(meta)
+    )
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.confusables-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            for section in sections:
+                f.write(section)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+class ConfusablesIndex(object):
+    """ A read-only view of a compiled index file. """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+
+        magic, n_ranges, n_single, n_multi, n_entries, n_glyphs, meta_length = (
+            HEADER.unpack_from(view)
+        )
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a confusables index.')
+        offset = HEADER.size
+
+        def take(length, cast=True):
+            nonlocal offset
+            section = view[offset:offset + length * (4 if cast else 1)]
+            offset += len(section)
+            return section.cast('I') if cast else section
+
+        meta = json.loads(bytes(take(meta_length, cast=False)).decode())
+        self.aliases = meta['aliases']
+        self.categories = meta['categories']
+        self.range_starts = take(n_ranges)
+        self.range_ends = take(n_ranges)
+        self.range_values = take(n_ranges)
+        self.single_keys = take(n_single)
+        self.key_offsets = take(n_single + n_multi + 1)
+        self.entries = take(n_entries)
+        multi_offsets = take(n_multi + 1)
+        glyph_offsets = take(n_glyphs + 1)
+        name_offsets = take(n_glyphs + 1)
+        self.multi_keys = _StringTable(take(multi_offsets[-1], cast=False), multi_offsets)
+        self.glyphs = _StringTable(take(glyph_offsets[-1], cast=False), glyph_offsets)
+        self.names = _StringTable(take(name_offsets[-1], cast=False), name_offsets)
+
+    def aliases_categories(self, char):
+        point = ord(char)
+        i = bisect.bisect_right(self.range_starts, point) - 1
+        if i < 0 or point > self.range_ends[i]:
+            return UNKNOWN
+        value = self.range_values[i]
+        return self.aliases[value >> 16], self.categories[value & 0xffff]
+
+    def get(self, key, default=None):
+        """ The homoglyphs of `key` like `confusables_data.get(key)`: a new
+        list of `{'c': glyph, 'n': name}` dicts.
+        """
+        if len(key) == 1:
+            point = ord(key)
+            i = bisect.bisect_left(self.single_keys, point)
+            if i == len(self.single_keys) or self.single_keys[i] != point:
+                return default
+        else:
+            i = self.multi_keys.find(key)
+            if i is None:
+                return default
+            i += len(self.single_keys)
+
+        return [
+            {'c': self.glyphs[glyph], 'n': self.names[glyph]}
+            for glyph in self.entries[self.key_offsets[i]:self.key_offsets[i + 1]]
+        ]
+
+
+class _StringTable(object):
+    """ Strings stored back to back in a UTF-8 blob, by position. """
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def encoded(self, i):
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]])
+
+    def __getitem__(self, i):
+        return self.encoded(i).decode('utf-8')
+
+    def find(self, string):
+        """ The position of `string` in a table sorted by UTF-8 bytes. """
+        encoded = string.encode('utf-8')
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.encoded(middle) < encoded:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self) and self.encoded(low) == encoded:
+            return low
+        return None
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def is_stale(data_dir, path):
+    try:
+        built = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return True
+    return any(
+        os.stat(os.path.join(data_dir, name)).st_mtime > built
+        for name in (CATEGORIES_FILE, CONFUSABLES_FILE)
+    )
+
+
+def get_index():
+    """ Returns the shared `ConfusablesIndex`, mapping it on first use and
+    compiling it first if it's missing or older than the JSON tables.
+    """
+    global _index
+    if _index is None:
+        with _lock:
+            if _index is None:
+                from django.conf import settings
+                data_dir = settings.CONFUSABLES['DATA_DIR']
+                path = settings.CONFUSABLES['INDEX_PATH']
+                if is_stale(data_dir, path):
+                    compile_index(data_dir, path)
+                _index = ConfusablesIndex(path)
+    return _index
+
+
+def reset_index():
+    """ Forget the mapped index, so the next lookup maps it again. """
+    global _index
+    with _lock:
+        _index = None
+
+
+def aliases_categories(char):
+    """ The script alias and Unicode category of a character, e.g.
+    `('LATIN', 'L')` for "A".
+    """
+    return get_index().aliases_categories(char)
+
+
+def alias(char):
+    return aliases_categories(char)[0]
+
+
+def category(char):
+    return aliases_categories(char)[1]
+
+
+def unique_aliases(string):
+    return {alias(char) for char in string}
+
+
+def is_mixed_script(string, allowed_aliases=('COMMON',)):
+    """ Whether `string` has characters from more than one script, other
+    than the `allowed_aliases`.
+    """
+    allowed_aliases = {name.upper() for name in allowed_aliases}
+    return len(unique_aliases(string) - allowed_aliases) > 1
+
+
+def is_confusable(string, greedy=False, preferred_aliases=()):
+    """ The characters of `string` that could be confused with characters
+    of the `preferred_aliases` scripts (or any script, when empty), as a list
+    of `{'character', 'alias', 'homoglyphs'}` dicts, or False if there are
+    none. Only the first one is returned unless `greedy` is set.
+    """
+    index = get_index()
+    preferred_aliases = [name.upper() for name in preferred_aliases]
+    outputs = []
+    checked = set()
+    for char in string:
+        if char in checked:
+            continue
+        checked.add(char)
+        char_alias = index.aliases_categories(char)[0]
+        if char_alias in preferred_aliases:
+            continue
+        found = index.get(char)
+        if not found:
+            continue
+        # With preferred scripts, a character is only confusable if one of
+        # its homoglyphs has a character from one of them.
+        if preferred_aliases and not any(
+            index.aliases_categories(glyph_char)[0] in preferred_aliases
+            for homoglyph in found
+            for glyph_char in homoglyph['c']
+        ):
+            continue
+
+        output = {'character': char, 'alias': char_alias, 'homoglyphs': found}
+        if not greedy:
+            return [output]
+        outputs.append(output)
+    return outputs or False
+
+
+def is_dangerous(string, preferred_aliases=()):
+    """ Whether `string` is mixed-script and has characters that could be
+    confused with characters of the `preferred_aliases` scripts.
+    """
+    return is_mixed_script(string) and bool(
+        is_confusable(string, preferred_aliases=preferred_aliases)
+    )
@@ -0,0 +1,189 @@
+import logging
+import os
+import signal
+import threading
+import time
+from collections import namedtuple
+
+import yaml
+from django.core.exceptions import ImproperlyConfigured
+from django.dispatch import Signal
+
+
+# Use libyaml's C parser when PyYAML was built with it.
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+logger = logging.getLogger(__name__)
+
+# Sent with the new `config` whenever a running process reloads the file.
+permissions_config_changed = Signal(providing_args=['config'])
+
+
+PermissionsConfig = namedtuple('PermissionsConfig', (
+    # ((codename, description), ...)
+    'permissions',
+    # ((group name, (codename, ...)), ...)
+    'groups',
+    # (group name, ...)
+    'managed_user_groups',
+    # (codename, ...)
+    'managed_user_permissions',
+))
+PermissionsConfig.__doc__ = """ The parsed, validated and immutable contents of a
+permissions.yaml file.
+"""
+
+
+def load_yaml(path):
+    """ Parse a YAML file with the safe loader. """
+    with open(path) as f:
+        return yaml.load(f, Loader=SafeLoader)
+
+
+def _check_names(value, where):
+    if value is None:
+        return ()
+    if not isinstance(value, list) or not all(isinstance(name, str) for name in value):
+        raise ImproperlyConfigured(f'{where} must be a list of names.')
+    return tuple(value)
+
+
+def parse_permissions_config(data, path='permissions.yaml'):
+    """ Validate the structure of a parsed permissions file and freeze it
+    into a `PermissionsConfig`.
+    """
+    if not isinstance(data, dict):
+        raise ImproperlyConfigured(f'{path} must contain a mapping.')
+
+    permissions = data.get('permissions')
+    if not isinstance(permissions, dict) or not all(
+        isinstance(codename, str) and isinstance(description, str)
+        for codename, description in permissions.items()
+    ):
+        raise ImproperlyConfigured(
+            f'"permissions" in {path} must map permission codenames to descriptions.'
+        )
+
+    groups = data.get('groups') or {}
+    if not isinstance(groups, dict):
+        raise ImproperlyConfigured(f'"groups" in {path} must map group names to permissions.')
+
+    managed_users = data.get('managed_users') or {}
+    if not isinstance(managed_users, dict):
+        raise ImproperlyConfigured(f'"managed_users" in {path} must be a mapping.')
+
+    return PermissionsConfig(
+        permissions=tuple(permissions.items()),
+        groups=tuple(
+            (str(name), _check_names(codenames, f'Group "{name}" in {path}'))
+            for name, codenames in groups.items()
+        ),
+        managed_user_groups=_check_names(
+            managed_users.get('default_groups'), f'"managed_users.default_groups" in {path}'
+        ),
+        managed_user_permissions=_check_names(
+            managed_users.get('default_permissions'),
+            f'"managed_users.default_permissions" in {path}'
+        ),
+    )
+
+
+def read_permissions_config(path):
+    try:
+        return parse_permissions_config(load_yaml(path), path)
+    except yaml.YAMLError as e:
+        raise ImproperlyConfigured(f'Unable to parse {path}: {e}')
+
+
+class PermissionsConfigFile(object):
+    """ A permissions file that is parsed once and then reloaded whenever its
+    modification time changes or a reload is requested.
+
+    The file is checked at most once every `check_interval` seconds, so
+    reading the config on a hot path costs a clock read. If a changed file
+    fails to parse, the last good config is kept.
+    """
+
+    def __init__(self, path, check_interval=5):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime = os.stat(path).st_mtime
+        self._checked_at = time.monotonic()
+        self._reload_requested = False
+        self.config = read_permissions_config(path)
+
+    def request_reload(self, *args):
+        """ Reload on the next read. Safe to use as an OS signal handler. """
+        self._reload_requested = True
+
+    def get(self):
+        now = time.monotonic()
+        if self._reload_requested or now - self._checked_at >= self.check_interval:
+            self._check(now)
+        return self.config
+
+    def _check(self, now):
+        with self._lock:
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError:
+                logger.exception('Unable to stat %s, keeping the current permissions.', self.path)
+                return
+            if mtime == self._mtime and not self._reload_requested:
+                return
+
+            self._reload_requested = False
+            self._mtime = mtime
+            try:
+                config = read_permissions_config(self.path)
+            except (OSError, ImproperlyConfigured):
+                logger.exception('Unable to reload %s, keeping the current permissions.', self.path)
+                return
+
+            changed = config != self.config
+            self.config = config
+
+        if changed:
+            logger.info('Reloaded permissions from %s.', self.path)
+            permissions_config_changed.send(sender=self.__class__, config=config)
+
+
+_config_files = {}
+
+
+def get_permissions_config_file(path=None, check_interval=None):
+    """ Returns the shared `PermissionsConfigFile` for the path, which
+    defaults to `settings.PERMISSIONS_PATH`. The first call for a path
+    parses the file, which is then checked every `check_interval` seconds
+    (default `settings.PERMISSIONS_RELOAD_INTERVAL`).
+    """
+    if path is None:
+        from django.conf import settings
+        path = settings.PERMISSIONS_PATH
+    config_file = _config_files.get(path)
+    if config_file is None:
+        if check_interval is None:
+            from django.conf import settings
+            check_interval = settings.PERMISSIONS_RELOAD_INTERVAL
+        config_file = _config_files.setdefault(path, PermissionsConfigFile(path, check_interval))
+    return config_file
+
+
+def get_permissions_config(path=None):
+    """ Returns the current `PermissionsConfig`, reloading it if the file
+    has changed.
+    """
+    return get_permissions_config_file(path).get()
+
+
+def install_reload_signal(signal_name, path=None):
+    """ Reload the permissions file whenever the process receives the named
+    OS signal (e.g. "SIGUSR2"). Signal handlers can only be installed from
+    the main thread, so this does nothing elsewhere.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return False
+    signal.signal(getattr(signal, signal_name), get_permissions_config_file(path).request_reload)
+    return True
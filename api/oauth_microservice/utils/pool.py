@@ -0,0 +1,167 @@
+import os
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool(object):
+    """ A bounded, thread-safe pool of database connections.
+
+    Notes
+    -----
+
+    - `size` connections are kept open once they've been made. Up to
+      `max_overflow` more are opened under load and closed again as soon as
+      they're returned.
+    - When every connection is checked out, `checkout()` waits up to
+      `timeout` seconds for one to be returned and then raises `PoolTimeout`.
+    - Connections that have been idle for `check_after` seconds are tested
+      with `check(connection)` before they're handed out, and replaced if
+      the test fails. Connections that report themselves closed are always
+      replaced.
+    - `checkouts`, `waits`, `overflow`, `timeouts` and `discarded` are simple
+      counters that can be read with `stats()`.
+    """
+
+    def __init__(self, connect, size=10, max_overflow=10, timeout=30,
+                 check=None, check_after=10):
+        self.connect = connect
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.check = check
+        self.check_after = check_after
+        # (connection, returned at) pairs, most recently returned last.
+        self._idle = deque()
+        self._open = 0
+        self._in_use = 0
+        self._condition = threading.Condition()
+        self.checkouts = 0
+        self.waits = 0
+        self.overflow = 0
+        self.timeouts = 0
+        self.discarded = 0
+
+    def _is_usable(self, connection, returned_at):
+        if getattr(connection, 'closed', False):
+            return False
+        if self.check is not None and time.monotonic() - returned_at >= self.check_after:
+            return self.check(connection)
+        return True
+
+    def checkout(self):
+        deadline = time.monotonic() + self.timeout
+        with self._condition:
+            self.checkouts += 1
+            waited = False
+            while not self._idle and self._open >= self.size + self.max_overflow:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(
+                        f'No database connection became free within {self.timeout} seconds.'
+                    )
+                if not waited:
+                    self.waits += 1
+                    waited = True
+                self._condition.wait(remaining)
+
+            self._in_use += 1
+            if self._idle:
+                # The most recently returned connection is the least likely
+                # to have been dropped by the server.
+                connection, returned_at = self._idle.pop()
+            else:
+                connection = None
+                self._open += 1
+                if self._open > self.size:
+                    self.overflow += 1
+
+        if connection is not None:
+            if self._is_usable(connection, returned_at):
+                return connection
+            # Replace the broken connection, keeping its place in the pool.
+            self._close_quietly(connection)
+            with self._condition:
+                self.discarded += 1
+
+        try:
+            return self.connect()
+        except Exception:
+            with self._condition:
+                self._open -= 1
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+
+    def checkin(self, connection, discard=False):
+        """ Return a connection to the pool, closing it instead if it's
+        broken, `discard` is set, or it was opened as overflow.
+        """
+        with self._condition:
+            self._in_use -= 1
+            broken = discard or getattr(connection, 'closed', False)
+            if not broken and self._open <= self.size:
+                self._idle.append((connection, time.monotonic()))
+                self._condition.notify()
+                return
+            self._open -= 1
+            if broken:
+                self.discarded += 1
+            self._condition.notify()
+        self._close_quietly(connection)
+
+    def _close_quietly(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """ Close every idle connection. """
+        with self._condition:
+            idle, self._idle = self._idle, deque()
+            self._open -= len(idle)
+        for connection, _ in idle:
+            self._close_quietly(connection)
+
+    def reset_stats(self):
+        with self._condition:
+            self.checkouts = self.waits = self.overflow = self.timeouts = self.discarded = 0
+
+    def stats(self):
+        return {
+            'size': self.size,
+            'max_overflow': self.max_overflow,
+            'open': self._open,
+            'idle': len(self._idle),
+            'in_use': self._in_use,
+            'checkouts': self.checkouts,
+            'waits': self.waits,
+            'overflow': self.overflow,
+            'timeouts': self.timeouts,
+            'discarded': self.discarded,
+        }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, create=None):
+    """ Returns this process's pool for the database alias, making it with
+    `create()` on first use if given. Pools are per process, since
+    connections can't be shared with a forked worker.
+    """
+    key = (os.getpid(), alias)
+    pool = _pools.get(key)
+    if pool is None and create is not None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = create()
+    return pool
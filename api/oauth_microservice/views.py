@@ -0,0 +1,24 @@
+from django.db import connections
+from rest_framework import permissions, response
+from rest_framework.decorators import api_view, permission_classes
+
+from oauth_microservice.utils.pool import get_pool
+
+
+@api_view(['GET'])
+@permission_classes((permissions.IsAdminUser,))
+def database_status(request):
+    """ The connection settings of each database and, for pooled databases,
+    this worker process's pool stats.
+    """
+    status = {}
+    for alias in connections:
+        settings_dict = connections[alias].settings_dict
+        pool = get_pool(alias)
+        status[alias] = {
+            'vendor': connections[alias].vendor,
+            'conn_max_age': settings_dict['CONN_MAX_AGE'],
+            'health_checks': bool(settings_dict.get('CONN_HEALTH_CHECKS')),
+            'pool': pool.stats() if pool is not None else None,
+        }
+    return response.Response(status)
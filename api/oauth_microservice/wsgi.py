@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "oauth_microservice.settings")
 
 application = get_wsgi_application()
+
+# Clear expired tokens in the background, if TOKEN_CLEANUP_INTERVAL is set.
+from oauth.cleanup import start_scheduler  # noqa: E402
+start_scheduler()
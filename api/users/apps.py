@@ -3,3 +3,11 @@ from django.apps import AppConfig
 
 class UsersConfig(AppConfig):
     name = 'users'
+
+    def ready(self):
+        from django.conf import settings
+        from oauth_microservice.utils.permissions import install_reload_signal
+        from . import signals  # noqa: F401
+
+        if settings.PERMISSIONS_RELOAD_SIGNAL:
+            install_reload_signal(settings.PERMISSIONS_RELOAD_SIGNAL)
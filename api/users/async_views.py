@@ -0,0 +1,22 @@
+""" Async versions of the read-only auth endpoints, served by
+`oauth_microservice.asgi` to requests that carry a bearer token.
+
+Each view gets the authenticated request and returns a `(status, data)` pair,
+or None to hand the request to the Django view instead. The ORM is blocking,
+so database work is run in threads with `request.run_in_thread`.
+"""
+from .permissions import user_has_permission
+from .views import get_has_permission_data
+
+
+async def validate(request):
+    return 200, {'message': 'User is valid.'}
+
+
+async def has_permission(request):
+    codename = request.query.get('codename')
+    if codename is None:
+        # Let the Django view answer malformed requests, as it always has.
+        return None
+    has_perm = await request.run_in_thread(user_has_permission, request.user, codename)
+    return 200, get_has_permission_data(codename, has_perm)
@@ -0,0 +1,38 @@
+import os
+
+from django.conf import settings
+from django.core.management import base
+from django.utils import timezone
+
+from oauth_microservice.utils import confusables
+
+
+class Command(base.BaseCommand):
+    help = (
+        'Compile categories.json and confusables.json into the index used by the '
+        'homoglyph checks of managed users, if it is missing or out of date.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-f',
+            '--force',
+            help='Rebuild the index even if it is up to date.',
+            action='store_true',
+            default=False
+        )
+
+    def log(self, message):
+        """ Write log messages to stdout in a consistent format. """
+        self.stdout.write(f'[{timezone.now()}] {message}')
+
+    def handle(self, verbosity, force=False, *args, **kwargs):
+        data_dir = settings.CONFUSABLES['DATA_DIR']
+        path = settings.CONFUSABLES['INDEX_PATH']
+        if not force and not confusables.is_stale(data_dir, path):
+            self.log(f'{path} is up to date.')
+            return
+
+        confusables.compile_index(data_dir, path)
+        confusables.reset_index()
+        self.log(f'Wrote {path} ({os.path.getsize(path) // 1024} KiB).')
@@ -1,29 +1,52 @@
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 
 from django.core.management import base
+from django.db import transaction
 from django.utils import timezone
 from django.contrib.auth.models import Group, User
 from django.contrib.auth.hashers import make_password
 
-from oauth_microservice.utils import load_sample_users
+from oauth_microservice.utils import iter_users
+from users.permissions import rebuild_effective_permissions
 
 
 DEFAULT_SAMPLE_USERS_PATH = os.environ.get('SAMPLE_USERS_PATH', 'sample_users.yml')
 
+UserGroup = User.groups.through
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
 
 class Command(base.BaseCommand):
     help = (
-        'Remove the built-in permissions and populate the set from the '
-        'provided permissions file.'
+        'Create the users listed in a YAML, CSV or JSON Lines file. Users are '
+        'written in batches and users that already exist are skipped, so an '
+        'interrupted import can simply be run again to resume it.'
     )
 
     def add_arguments(self, parser):
         parser.add_argument(
             '-i',
             '--input',
-            help='A YAML file with sample users to create.',
+            help='A YAML, CSV or JSON Lines file with the users to create.',
             default=DEFAULT_SAMPLE_USERS_PATH
         )
+        parser.add_argument(
+            '--format',
+            help='The format of the input file. Default: taken from the file extension.',
+            choices=('yaml', 'csv', 'jsonl'),
+            default=None
+        )
         parser.add_argument(
             '-f',
             '--force',
@@ -31,6 +54,23 @@ class Command(base.BaseCommand):
             action='store_true',
             default=False
         )
+        parser.add_argument(
+            '-b',
+            '--batch-size',
+            help='The number of users to write at once. Default: 1000',
+            type=int,
+            default=1000
+        )
+        parser.add_argument(
+            '-w',
+            '--workers',
+            help=(
+                'The number of processes that hash passwords. '
+                'Default: the number of CPUs.'
+            ),
+            type=int,
+            default=os.cpu_count() or 1
+        )
 
     def log(self, message):
         """ Write log messages to stdout in a consistent format. """
@@ -39,25 +79,93 @@ class Command(base.BaseCommand):
             message=message
         ))
 
-    def handle(self, verbosity, input, force, *args, **kwargs):
+    def hash_passwords(self, passwords):
+        if self.executor is None:
+            return [make_password(password) for password in passwords]
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        return list(self.executor.map(make_password, passwords, chunksize=chunksize))
+
+    @transaction.atomic
+    def create_batch(self, batch):
+        """ Create one batch of users and their group memberships, skipping
+        users that already exist and repeats of a username. Returns the
+        number of users created.
+        """
+        existing = set(
+            User.objects.filter(username__in=[username for username, _ in batch])
+            .values_list('username', flat=True)
+        )
+        # Only the first of several entries with the same username is created.
+        unique = {}
+        for username, details in batch:
+            if username in existing:
+                continue
+            if username in unique:
+                self.log(f'Warning: user "{username}" is listed more than once. Skipping it...')
+                continue
+            unique[username] = details
+        batch = list(unique.items())
+        if not batch:
+            return 0
+
+        passwords = self.hash_passwords([details.get('password') for _, details in batch])
+
+        users, memberships = [], {}
+        for (username, details), password_hash in zip(batch, passwords):
+            details = dict(details)
+            group_names = details.pop('groups', None) or []
+            details.pop('password', None)
+            users.append(User(**{**details, 'username': username, 'password': password_hash}))
+
+            memberships[username] = [
+                self.groups[name] for name in group_names if name in self.groups
+            ]
+            for name in group_names:
+                if name not in self.groups and name not in self.unknown_groups:
+                    self.unknown_groups.add(name)
+                    self.log(f'Warning: group "{name}" does not exist. Skipping it...')
+
+        User.objects.bulk_create(users)
+
+        # Not every database backend sets primary keys on bulk inserts.
+        user_ids = dict(
+            User.objects.filter(username__in=memberships).values_list('username', 'pk')
+        )
+        UserGroup.objects.bulk_create([
+            UserGroup(user_id=user_ids[username], group_id=group_id)
+            for username, group_ids in memberships.items()
+            for group_id in group_ids
+        ])
+        # Bulk writes to the membership table don't send m2m_changed.
+        rebuild_effective_permissions(user_ids.values())
+        return len(users)
+
+    def handle(self, verbosity, input, format, force, batch_size, workers, *args, **kwargs):
         if force:
             self.log(f'Dumping all existing users...')
             User.objects.all().delete()
 
-        for username, details in load_sample_users(input):
-            group_names = details.pop('groups')
-            password_hash = make_password(details.pop('password'))
-
-            groups = Group.objects.filter(name__in=group_names)
+        # Resolve every group name once up front.
+        self.groups = dict(Group.objects.values_list('name', 'pk'))
+        self.unknown_groups = set()
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
 
-            user_details = {
-                **details,
-                **{'username': username, 'password': password_hash}
-            }
+        self.log(f'Creating users from {input} with {workers} password hashing workers...')
+        started = time.monotonic()
+        processed = created = 0
+        try:
+            for batch in batches(iter_users(input, format), batch_size):
+                created += self.create_batch(batch)
+                processed += len(batch)
 
-            groups_count = len(groups)
-            self.log(f'Creating {username} as a member of {groups_count} groups...')
-            user = User.objects.create(**user_details)
-            user.groups.set(groups)
+                elapsed = max(time.monotonic() - started, 1e-6)
+                self.log(
+                    f'Processed {processed} users: {created} created, '
+                    f'{processed - created} skipped ({processed / elapsed:.1f} users/s)...'
+                )
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
 
         self.log('Done.')
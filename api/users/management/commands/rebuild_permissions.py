@@ -1,26 +1,70 @@
 from django.conf import settings
 from django.core.management import base
+from django.db import transaction
 from django.utils import timezone
 from django.contrib.auth.models import Permission, Group
 from django.contrib.contenttypes.models import ContentType
 
 from users.models import PermissionSupport
+from users.permissions import rebuild_effective_permissions
+from users.signals import get_group_member_ids, get_permission_holder_ids, permissions_rebuilt
+from users.versions import bump_user_versions
 
 
 DELIMETER = '\n- '
 
+GroupPermission = Group.permissions.through
+
+
+class PermissionsPlan(object):
+    """ The changes needed to bring the database in line with the permissions
+    file, computed from a handful of queries up front.
+    """
+
+    def __init__(self):
+        self.create_permissions = []
+        self.rename_permissions = []
+        self.delete_permissions = []
+        self.create_groups = []
+        self.delete_groups = []
+        self.add_group_permissions = {}
+        self.remove_group_permissions = {}
+
+    @property
+    def is_empty(self):
+        return not any((
+            self.create_permissions,
+            self.rename_permissions,
+            self.delete_permissions,
+            self.create_groups,
+            self.delete_groups,
+            self.add_group_permissions,
+            self.remove_group_permissions,
+        ))
+
 
 class Command(base.BaseCommand):
     help = (
-        'Remove the built-in permissions and groups and populate the set '
-        'from the provided permissions file.'
+        'Bring the permissions and groups in line with the provided '
+        'permissions file. Only the differences are written, in a single '
+        'transaction, so existing user assignments are kept.'
     )
 
     def add_arguments(self, parser):
         parser.add_argument(
             '-f',
             '--force',
-            help='Dump all existing groups and permissions and recreate them.',
+            help=(
+                'Also delete the permissions (including the built-in ones) and '
+                'groups which are not in the permissions file.'
+            ),
+            action='store_true',
+            default=False
+        )
+        parser.add_argument(
+            '-n',
+            '--dry-run',
+            help='Print the changes that would be made without making them.',
             action='store_true',
             default=False
         )
@@ -32,53 +76,140 @@ class Command(base.BaseCommand):
             message=message
         ))
 
-    def handle_permissions(self, permissions):
+    def build_plan(self, permissions, groups, force):
+        """ Compare the permissions file with the database. """
+        plan = PermissionsPlan()
+        permissions = dict(permissions)
+        groups = dict(groups)
         content_type = ContentType.objects.get_for_model(PermissionSupport)
 
-        # Load the permissions from the global permissions file.
-        for codename, description in permissions:
-            qs = Permission.objects.filter(codename=codename)
-            if not qs.exists():
-                self.log(f'Creating permission: {codename}...')
-                Permission.objects.create(
+        # Permissions are matched by codename across every content type, which
+        # keeps built-in permissions assignable from the permissions file.
+        existing_permissions = {}
+        for pk, codename, name, content_type_id in Permission.objects.values_list(
+            'pk', 'codename', 'name', 'content_type_id'
+        ):
+            existing_permissions.setdefault(codename, []).append((pk, name, content_type_id))
+
+        for codename, description in permissions.items():
+            matches = existing_permissions.get(codename)
+            if not matches:
+                plan.create_permissions.append(Permission(
                     codename=codename,
                     name=description,
-                    content_type=content_type
-                )
-            else:
-                self.log(f'Permission {codename} already exists. Skipping...')
-
-    def handle_groups(self, groups):
-        for name, permissions in groups:
-            qs = Group.objects.filter(name=name)
-
-            # Create Group
-            if not qs.exists():
-                self.log(f'Creating group: "{name}"...')
-                group = Group.objects.create(name=name)
-            else:
-                self.log(f'Group "{name}" already exists. Skipping...')
-                group = qs.first()
-
-            # Add Permissions to group
-            group_name = f'Group: {name}'
-            joined_permissions = DELIMETER + DELIMETER.join(permissions)
-            line = '-' * len(group_name)
-            self.log(
-                f'Setting permissions for group:\n\n{group_name}\n'
-                f'{line}{joined_permissions}\n\n'
-            )
-            group.permissions.set(
-                Permission.objects.filter(codename__in=permissions)
+                    content_type=content_type,
+                ))
+            for pk, name, content_type_id in matches or []:
+                if content_type_id == content_type.pk and name != description:
+                    plan.rename_permissions.append((pk, codename, description))
+
+        if force:
+            plan.delete_permissions = sorted(
+                codename for codename in existing_permissions if codename not in permissions
             )
 
-    def handle(self, verbosity, force=False, *args, **kwargs):
+        existing_groups = dict(Group.objects.values_list('name', 'pk'))
+        plan.create_groups = [name for name in groups if name not in existing_groups]
         if force:
-            self.log('Dropping existing groups and permissions...')
-            Permission.objects.all().delete()
-            Group.objects.all().delete()
+            plan.delete_groups = sorted(name for name in existing_groups if name not in groups)
+
+        current_links = {}
+        for group_id, codename in GroupPermission.objects.values_list(
+            'group_id', 'permission__codename'
+        ):
+            current_links.setdefault(group_id, set()).add(codename)
+
+        for name, codenames in groups.items():
+            wanted = set(codenames or [])
+            current = current_links.get(existing_groups.get(name), set())
+            if wanted - current:
+                plan.add_group_permissions[name] = sorted(wanted - current)
+            if current - wanted:
+                plan.remove_group_permissions[name] = sorted(current - wanted)
+
+        return plan
+
+    def log_plan(self, plan):
+        for permission in plan.create_permissions:
+            self.log(f'Creating permission: {permission.codename}...')
+        for pk, codename, description in plan.rename_permissions:
+            self.log(f'Renaming permission {codename}: "{description}"...')
+        for codename in plan.delete_permissions:
+            self.log(f'Deleting permission: {codename}...')
+        for name in plan.create_groups:
+            self.log(f'Creating group: "{name}"...')
+        for name in plan.delete_groups:
+            self.log(f'Deleting group: "{name}"...')
+
+        for changes, verb in (
+            (plan.add_group_permissions, 'Adding'),
+            (plan.remove_group_permissions, 'Removing'),
+        ):
+            for name, codenames in changes.items():
+                group_name = f'Group: {name}'
+                joined_permissions = DELIMETER + DELIMETER.join(codenames)
+                line = '-' * len(group_name)
+                self.log(
+                    f'{verb} permissions for group:\n\n{group_name}\n'
+                    f'{line}{joined_permissions}\n\n'
+                )
+
+    @transaction.atomic
+    def apply_plan(self, plan):
+        Permission.objects.bulk_create(plan.create_permissions)
+        for pk, codename, description in plan.rename_permissions:
+            Permission.objects.filter(pk=pk).update(name=description)
+        if plan.rename_permissions:
+            bump_user_versions(get_permission_holder_ids(
+                [pk for pk, codename, description in plan.rename_permissions]
+            ))
+
+        # Deleting cascades to the user and group assignments of the removed
+        # permissions and groups only. The group delete signals keep the
+        # members' effective permissions current.
+        if plan.delete_permissions:
+            Permission.objects.filter(codename__in=plan.delete_permissions).delete()
+        if plan.delete_groups:
+            Group.objects.filter(name__in=plan.delete_groups).delete()
+
+        Group.objects.bulk_create([Group(name=name) for name in plan.create_groups])
+
+        changed_group_names = set(plan.add_group_permissions) | set(plan.remove_group_permissions)
+        if not changed_group_names:
+            return
+
+        groups = dict(Group.objects.filter(name__in=changed_group_names).values_list('name', 'pk'))
+        permissions = {}
+        for pk, codename in Permission.objects.values_list('pk', 'codename'):
+            permissions.setdefault(codename, []).append(pk)
+
+        for name, codenames in plan.remove_group_permissions.items():
+            GroupPermission.objects.filter(
+                group_id=groups[name],
+                permission__codename__in=codenames,
+            ).delete()
+
+        GroupPermission.objects.bulk_create([
+            GroupPermission(group_id=groups[name], permission_id=permission_id)
+            for name, codenames in plan.add_group_permissions.items()
+            for codename in codenames
+            for permission_id in permissions.get(codename, [])
+        ])
+
+        # Bulk writes to the through table don't send m2m_changed, so the
+        # members of the changed groups are brought up to date here.
+        rebuild_effective_permissions(get_group_member_ids(groups.values()))
+
+    def handle(self, verbosity, force=False, dry_run=False, *args, **kwargs):
+        plan = self.build_plan(settings.DEFAULT_PERMISSIONS, settings.DEFAULT_GROUPS, force)
+        self.log_plan(plan)
 
-        self.handle_permissions(settings.DEFAULT_PERMISSIONS)
-        self.handle_groups(settings.DEFAULT_GROUPS)
+        if plan.is_empty:
+            self.log('Permissions and groups are already up to date.')
+        elif dry_run:
+            self.log('Dry run, no changes were made.')
+        else:
+            self.apply_plan(plan)
+            permissions_rebuilt.send(sender=self.__class__)
 
         self.log('Done.')
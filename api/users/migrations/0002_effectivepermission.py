@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 13:32
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_effective_permissions(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    EffectivePermission = apps.get_model('users', 'EffectivePermission')
+
+    pairs = set(User.user_permissions.through.objects.values_list('user_id', 'permission_id'))
+    pairs |= set(
+        User.groups.through.objects
+        .filter(group__permissions__isnull=False)
+        .values_list('user_id', 'group__permissions')
+    )
+    EffectivePermission.objects.bulk_create([
+        EffectivePermission(user_id=user_id, permission_id=permission_id)
+        for user_id, permission_id in pairs
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('auth', '0008_alter_user_username_max_length'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EffectivePermission',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('permission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='effective_users', to='auth.Permission')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='effective_permissions', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='effectivepermission',
+            unique_together=set([('user', 'permission')]),
+        ),
+        migrations.RunPython(populate_effective_permissions, migrations.RunPython.noop),
+    ]
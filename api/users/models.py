@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.contrib.auth.models import Permission
 from django.db import models
 
 
@@ -23,3 +25,43 @@ class PermissionSupport(models.Model):
         # No database table creation or deletion operations \
         # will be performed for this model.
         managed = False
+
+
+class EffectivePermission(models.Model):
+    """ A denormalized row for every permission a user has, either directly
+    or through any of their groups.
+
+    The table is kept current by the signal handlers in `users.signals`, so
+    reading a user's permissions is a single indexed lookup no matter how
+    many groups they belong to.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='effective_permissions',
+    )
+    permission = models.ForeignKey(
+        Permission,
+        on_delete=models.CASCADE,
+        related_name='effective_users',
+    )
+
+    class Meta:
+        unique_together = ('user', 'permission')
+
+
+class UserVersion(models.Model):
+    """ A counter bumped whenever anything in a user's `/user/` or
+    `/permissions/` responses may have changed: the user themselves, their
+    effective permissions, or the permissions they hold.
+
+    It tags those responses with an ETag that can be checked without
+    building them. Users without a row are at version 0.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='version',
+    )
+    version = models.PositiveIntegerField(default=0)
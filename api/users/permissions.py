@@ -0,0 +1,115 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.db import transaction
+from django.db.models import Q
+
+from .models import EffectivePermission
+from .versions import bump_user_versions
+
+
+UserModel = get_user_model()
+
+
+def get_user_permissions(user):
+    """ Returns a queryset of every permission the user has, either directly
+    or through one of their groups, without duplicates.
+    """
+    return Permission.objects.filter(effective_users__user=user)
+
+
+def get_user_permission_codenames(user):
+    """ Returns the sorted codenames of every permission the user has. """
+    return list(
+        EffectivePermission.objects
+        .filter(user=user)
+        .order_by('permission__codename')
+        .values_list('permission__codename', flat=True)
+    )
+
+
+def get_source_permission_pairs(user_ids=None):
+    """ Returns the set of `(user_id, permission_id)` pairs that the users
+    should have, computed from their direct and group permissions. All users
+    are included when `user_ids` is None.
+    """
+    direct = UserModel.user_permissions.through.objects.all()
+    grouped = UserModel.groups.through.objects.filter(group__permissions__isnull=False)
+    if user_ids is not None:
+        direct = direct.filter(user_id__in=user_ids)
+        grouped = grouped.filter(user_id__in=user_ids)
+
+    return (
+        set(direct.values_list('user_id', 'permission_id')) |
+        set(grouped.values_list('user_id', 'group__permissions'))
+    )
+
+
+@transaction.atomic
+def rebuild_effective_permissions(user_ids=None):
+    """ Bring the effective permissions of the given users (or of all users
+    when `user_ids` is None) in line with their direct and group permissions.
+
+    Only the difference is written: missing rows are bulk inserted and stale
+    rows are deleted. Users whose permissions changed move to a new version.
+    """
+    if user_ids is not None:
+        user_ids = set(user_ids)
+        if not user_ids:
+            return
+
+    existing = EffectivePermission.objects.all()
+    if user_ids is not None:
+        existing = existing.filter(user_id__in=user_ids)
+    current = {
+        (user_id, permission_id): pk
+        for pk, user_id, permission_id in existing.values_list('pk', 'user_id', 'permission_id')
+    }
+    wanted = get_source_permission_pairs(user_ids)
+
+    stale = {pair: pk for pair, pk in current.items() if pair not in wanted}
+    if stale:
+        EffectivePermission.objects.filter(pk__in=stale.values()).delete()
+
+    missing = wanted.difference(current)
+    EffectivePermission.objects.bulk_create([
+        EffectivePermission(user_id=user_id, permission_id=permission_id)
+        for user_id, permission_id in missing
+    ])
+    bump_user_versions(user_id for user_id, permission_id in [*stale, *missing])
+
+
+def get_permission_matrix(users, codenames):
+    """ Check many codenames for many users with a single query.
+
+    Codenames may be bare (`change_user`) or qualified with their app label
+    (`auth.change_user`), as with Django's `has_perm`. Returns a
+    `{user.pk: {codename: bool}}` mapping. As with `has_perm`, active
+    superusers have every permission and inactive users have none.
+    """
+    codenames = list(dict.fromkeys(codenames))
+    matrix = {
+        user.pk: {codename: user.is_active and user.is_superuser for codename in codenames}
+        for user in users
+    }
+
+    bare = {codename for codename in codenames if '.' not in codename}
+    qualified = {codename for codename in codenames if '.' in codename}
+    query = Q(permission__codename__in=bare)
+    for codename in qualified:
+        app_label, name = codename.split('.', 1)
+        query |= Q(permission__content_type__app_label=app_label, permission__codename=name)
+
+    granted = EffectivePermission.objects.filter(
+        query, user_id__in=[user.pk for user in users if user.is_active]
+    ).values_list('user_id', 'permission__content_type__app_label', 'permission__codename')
+    for user_id, app_label, codename in granted:
+        if codename in bare:
+            matrix[user_id][codename] = True
+        if f'{app_label}.{codename}' in qualified:
+            matrix[user_id][f'{app_label}.{codename}'] = True
+    return matrix
+
+
+def user_has_permission(user, codename):
+    """ Returns whether the user has the permission with the given codename. """
+    return get_permission_matrix([user], [codename])[user.pk][codename]
@@ -1,6 +1,37 @@
+from collections import OrderedDict
+from urllib.parse import quote
+
 from django.contrib.auth import models
+from django.utils.http import RFC3986_SUBDELIMS
 from rest_framework import serializers
 
+from .permissions import get_user_permissions
+
+
+LOOKUP_PLACEHOLDER = 'lookup-placeholder'
+
+
+class PrefixedHyperlinkedIdentityField(serializers.HyperlinkedIdentityField):
+    """ A `HyperlinkedIdentityField` that reverses its view once and then
+    builds each object's URL by putting the (quoted) lookup value into it,
+    rather than reversing the URL for every object.
+    """
+
+    def get_url(self, obj, view_name, request, format):
+        key = (view_name, request, format)
+        if getattr(self, '_url_key', None) != key:
+            url = self.reverse(
+                view_name,
+                kwargs={self.lookup_url_kwarg: LOOKUP_PLACEHOLDER},
+                request=request,
+                format=format,
+            )
+            self._url_parts = url.split(LOOKUP_PLACEHOLDER, 1)
+            self._url_key = key
+
+        lookup_value = quote(str(getattr(obj, self.lookup_field)), safe=RFC3986_SUBDELIMS + '/~:@')
+        return lookup_value.join(self._url_parts)
+
 
 class UserPermissionSerializer(serializers.HyperlinkedModelSerializer):
     """ User permissions are serialized/deserialized with the following fields.
@@ -18,6 +49,8 @@ class UserPermissionSerializer(serializers.HyperlinkedModelSerializer):
     in the URL. This is an internal field in Django's Permissions which can be
     used as a proxy for the the permission's ID.
     """
+    serializer_url_field = PrefixedHyperlinkedIdentityField
+
     class Meta:
         model = models.Permission
         fields = ('url', 'name', 'codename')
@@ -25,6 +58,14 @@ class UserPermissionSerializer(serializers.HyperlinkedModelSerializer):
             'url': {'lookup_field': 'codename'},
         }
 
+    def to_representation(self, permission):
+        # Every field is read only and plain, so skip DRF's per-field loop.
+        return OrderedDict((
+            ('url', self.fields['url'].to_representation(permission)),
+            ('name', permission.name),
+            ('codename', permission.codename),
+        ))
+
 
 class UserSerializer(serializers.HyperlinkedModelSerializer):
     """ Users are serialized/deserialized with the following fields.
@@ -52,11 +93,8 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
 
     def get_permissions(self, user):
         # Django doesn't have a get_all_permissions method that returns the
-        # actual permissions, only the string names, so we have to build our
-        # own result queryset to use.
-        qs = list(user.user_permissions.all())
-        for group in user.groups.all():
-            qs += list(group.permissions.all())
-
+        # actual permissions, only the string names, so we read them from the
+        # materialized effective permissions instead.
+        qs = get_user_permissions(user)
         serializer = UserPermissionSerializer(qs, many=True, context=self.context)
         return serializer.data
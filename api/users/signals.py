@@ -0,0 +1,109 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.db.models.signals import m2m_changed, pre_delete, post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .models import EffectivePermission
+from .permissions import rebuild_effective_permissions
+from .versions import bump_user_versions
+
+
+UserModel = get_user_model()
+
+AFFECTED_USERS_ATTR = '_effective_permission_user_ids'
+
+# Sent by rebuild_permissions after it has changed the permissions and groups.
+permissions_rebuilt = Signal()
+
+
+def get_group_member_ids(group_ids):
+    return set(
+        UserModel.groups.through.objects
+        .filter(group_id__in=group_ids)
+        .values_list('user_id', flat=True)
+    )
+
+
+def get_affected_user_ids(sender, instance, reverse, pk_set):
+    """ Work out whose effective permissions a change to one of the
+    permission relations touches.
+    """
+    if sender is Group.permissions.through:
+        # Forward: a group's permissions changed. Reverse: a permission was
+        # added to or removed from some groups.
+        group_ids = pk_set if reverse else {instance.pk}
+        if reverse and pk_set is None:
+            group_ids = set(instance.group_set.values_list('pk', flat=True))
+        return get_group_member_ids(group_ids)
+
+    # User.user_permissions and User.groups. Forward: the instance is the user.
+    # Reverse: the instance is the permission or group and pk_set holds users.
+    if not reverse:
+        return {instance.pk}
+    if pk_set is not None:
+        return set(pk_set)
+    return set(instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=UserModel.user_permissions.through)
+@receiver(m2m_changed, sender=UserModel.groups.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def update_effective_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    """ Keep `EffectivePermission` rows current as users, groups and
+    permissions are linked and unlinked.
+
+    A clear doesn't tell us which rows it removes, so the affected users are
+    recorded before the clear and rebuilt after it.
+    """
+    if action == 'pre_clear':
+        setattr(instance, AFFECTED_USERS_ATTR, get_affected_user_ids(
+            sender, instance, reverse, None
+        ))
+    elif action == 'post_clear':
+        rebuild_effective_permissions(instance.__dict__.pop(AFFECTED_USERS_ATTR, set()))
+    elif action in ('post_add', 'post_remove'):
+        rebuild_effective_permissions(get_affected_user_ids(sender, instance, reverse, pk_set))
+
+
+@receiver(pre_delete, sender=Group)
+def record_deleted_group_members(sender, instance, **kwargs):
+    # Deleting a group cascades to its memberships without sending
+    # m2m_changed, so its members have to be rebuilt once it's gone.
+    setattr(instance, AFFECTED_USERS_ATTR, get_group_member_ids({instance.pk}))
+
+
+@receiver(post_delete, sender=Group)
+def rebuild_deleted_group_members(sender, instance, **kwargs):
+    rebuild_effective_permissions(instance.__dict__.pop(AFFECTED_USERS_ATTR, set()))
+
+
+def get_permission_holder_ids(permission_ids):
+    return set(
+        EffectivePermission.objects
+        .filter(permission_id__in=permission_ids)
+        .values_list('user_id', flat=True)
+    )
+
+
+@receiver(post_save, sender=UserModel)
+def bump_saved_user_version(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_user_versions({instance.pk})
+
+
+@receiver(post_save, sender=Permission)
+def bump_permission_holder_versions(sender, instance, created, raw=False, **kwargs):
+    # A renamed permission changes the responses of everyone who has it.
+    if not created and not raw:
+        bump_user_versions(get_permission_holder_ids({instance.pk}))
+
+
+@receiver(pre_delete, sender=Permission)
+def record_deleted_permission_holders(sender, instance, **kwargs):
+    # The effective permissions go with it, again without m2m_changed.
+    setattr(instance, AFFECTED_USERS_ATTR, get_permission_holder_ids({instance.pk}))
+
+
+@receiver(post_delete, sender=Permission)
+def bump_deleted_permission_holder_versions(sender, instance, **kwargs):
+    bump_user_versions(instance.__dict__.pop(AFFECTED_USERS_ATTR, set()))
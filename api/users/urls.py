@@ -12,4 +12,5 @@ urlpatterns = [
     url(r'^', include(router.urls)),
     url(r'^validate/$', users.views.validate),
     url(r'^user/has_permission/$', users.views.has_permission),
+    url(r'^user/has_permissions/$', users.views.has_permissions),
 ]
@@ -0,0 +1,40 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import UserVersion
+
+
+def get_user_version(user):
+    version = UserVersion.objects.filter(user_id=user.pk).values_list('version', flat=True).first()
+    return version or 0
+
+
+def bump_user_versions(user_ids):
+    """ Move the given users to a new version, so their cached responses are
+    no longer matched.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+
+    with transaction.atomic():
+        existing = set(
+            UserVersion.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True)
+        )
+        UserVersion.objects.filter(user_id__in=existing).update(version=F('version') + 1)
+        missing = user_ids - existing
+        if not missing:
+            return
+        try:
+            with transaction.atomic():
+                UserVersion.objects.bulk_create([
+                    UserVersion(user_id=user_id, version=1) for user_id in missing
+                ])
+        except IntegrityError:
+            # Another request created some of the rows in the meantime.
+            for user_id in missing:
+                version, created = UserVersion.objects.get_or_create(
+                    user_id=user_id, defaults={'version': 1}
+                )
+                if not created:
+                    UserVersion.objects.filter(user_id=user_id).update(version=F('version') + 1)
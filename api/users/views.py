@@ -1,8 +1,66 @@
+import functools
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.functions import Coalesce
 from django.http import Http404
-from rest_framework import viewsets, mixins, filters, response
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from rest_framework import viewsets, mixins, filters, response, exceptions
 from rest_framework.decorators import api_view
 
 from . import serializers
+from .permissions import get_permission_matrix, get_user_permissions, user_has_permission
+from .versions import get_user_version
+
+
+UserModel = get_user_model()
+
+
+def get_user_version_etag(request, version=None):
+    """ A strong ETag for the requesting user's view of the current URL,
+    which changes with the user's version (see `users.models.UserVersion`).
+    The version is read from the database unless it's given.
+    """
+    if version is None:
+        version = get_user_version(request.user)
+    key = '\n'.join((
+        str(request.user.pk),
+        str(version),
+        request.accepted_media_type,
+        request.build_absolute_uri(),
+    ))
+    return quote_etag(hashlib.sha1(key.encode()).hexdigest())
+
+
+def user_version_etag(list_view):
+    """ Tag the responses of a viewset's list with `get_user_version_etag`,
+    and answer a matching `If-None-Match` with a 304 without building it.
+
+    Viewsets with `renders_user_version` read the version along with the
+    data they render (see `UserViewSet`) and set it as the response's
+    `user_version`, so the ETag matches the body even if the version changed
+    in between. They only read it up front for conditional requests.
+    """
+    @functools.wraps(list_view)
+    def wrapper(self, request, *args, **kwargs):
+        etag = None
+        conditional = 'HTTP_IF_NONE_MATCH' in request.META or 'HTTP_IF_MATCH' in request.META
+        if conditional or not getattr(self, 'renders_user_version', False):
+            etag = get_user_version_etag(request)
+            response = get_conditional_response(request, etag=etag)
+            if response is not None:
+                response['ETag'] = etag
+                return response
+
+        response = list_view(self, request, *args, **kwargs)
+        version = getattr(response, 'user_version', None)
+        if version is not None:
+            etag = get_user_version_etag(request, version)
+        response['ETag'] = etag
+        return response
+    return wrapper
 
 
 class UserPermissionsViewSet(
@@ -28,27 +86,30 @@ class UserPermissionsViewSet(
     search_fields = ('codename',)
     lookup_field = 'codename'
 
+    list = user_version_etag(mixins.ListModelMixin.list)
+
     def get_queryset(self):
         """ Use the current user's permissions only. """
         # Django doesn't have a get_all_permissions method that returns the
-        # actual permissions, only the string names, so we have to build our
-        # own result queryset to use.
-        qs = list(self.request.user.user_permissions.all())
-        for group in self.request.user.groups.all():
-            qs += list(group.permissions.all())
-        return qs
+        # actual permissions, only the string names, so we read them from the
+        # materialized effective permissions instead.
+        # Searching, counting and paging all happen in the database. Ordering
+        # by codename keeps pages stable and avoids joining content types.
+        return get_user_permissions(self.request.user).order_by('codename')
 
     def get_object(self):
-        # Mimic the default QuerySet behavior.
+        # Codenames are only unique per content type, so take the first match
+        # rather than failing when a user has two permissions with one codename.
         lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
-        try:
-            return [
-                permission for permission in self.get_queryset()
-                if permission.codename == self.kwargs[lookup_url_kwarg]
-            ][0]
-        except IndexError:
+        permission = self.get_queryset().filter(
+            codename=self.kwargs[lookup_url_kwarg]
+        ).first()
+        if permission is None:
             raise Http404()
 
+        self.check_object_permissions(self.request, permission)
+        return permission
+
 
 class UserViewSet(viewsets.GenericViewSet):
     """ Fetch the details of the current logged in user.
@@ -57,14 +118,22 @@ class UserViewSet(viewsets.GenericViewSet):
     Retrieve the details for the user that is currently making the request.
     """
     serializer_class = serializers.UserSerializer
+    renders_user_version = True
 
     def get_queryset(self):
-        return self.request.user
+        # `request.user` may come from the token cache and be out of date, so
+        # the user is loaded afresh, with the version their ETag is made of.
+        return UserModel.objects.annotate(
+            user_version=Coalesce('version__version', 0)
+        ).get(pk=self.request.user.pk)
 
+    @user_version_etag
     def list(self, request, *args, **kwargs):
-        qs = self.get_queryset()
-        serializer = self.get_serializer(qs)
-        return response.Response(serializer.data)
+        user = self.get_queryset()
+        serializer = self.get_serializer(user)
+        result = response.Response(serializer.data)
+        result.user_version = user.user_version
+        return result
 
 
 @api_view(['GET'])
@@ -85,12 +154,55 @@ def has_permission(request):
     or not the requesting user has such a permission.
     """
     codename = request.GET['codename']
-    has_perm = request.user.has_perm(codename)
-    return response.Response({
+    return response.Response(
+        get_has_permission_data(codename, user_has_permission(request.user, codename))
+    )
+
+
+def get_has_permission_data(codename, has_perm):
+    return {
         'message': (
             f'You have the {codename} permission.'
             if has_perm else
             f'You don\'t have the {codename} permission.'
         ),
         'has_permission': has_perm
+    }
+
+
+@api_view(['GET'])
+def has_permissions(request):
+    """ Check many permissions at once. Expects one or more `codename` query
+    params and returns, for each user, whether they have each permission.
+
+    By default the requesting user is checked. Users with the
+    `PERMISSION_CHECK_OTHER_USERS_PERMISSION` permission may instead pass one
+    or more `username` query params to check other users. Unknown usernames
+    are left out of the results.
+    """
+    codenames = request.query_params.getlist('codename')
+    usernames = request.query_params.getlist('username')
+    if not codenames:
+        raise exceptions.ValidationError({'codename': 'At least one codename is required.'})
+    if len(codenames) > settings.PERMISSION_CHECK_MAX_CODENAMES:
+        raise exceptions.ValidationError({
+            'codename': f'At most {settings.PERMISSION_CHECK_MAX_CODENAMES} codenames are allowed.'
+        })
+    if len(usernames) > settings.PERMISSION_CHECK_MAX_USERS:
+        raise exceptions.ValidationError({
+            'username': f'At most {settings.PERMISSION_CHECK_MAX_USERS} usernames are allowed.'
+        })
+
+    if usernames:
+        if not user_has_permission(request.user, settings.PERMISSION_CHECK_OTHER_USERS_PERMISSION):
+            raise exceptions.PermissionDenied(
+                'You do not have permission to check the permissions of other users.'
+            )
+        users = list(UserModel.objects.filter(username__in=usernames))
+    else:
+        users = [request.user]
+
+    matrix = get_permission_matrix(users, codenames)
+    return response.Response({
+        'results': {user.get_username(): matrix[user.pk] for user in users}
     })